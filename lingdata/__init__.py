@@ -0,0 +1,2 @@
+"""Linguistic databases: Glottolog, WALS, ASJP, ISO 639-3 and Ethnologue."""
+from .database import Lingdata, open  # noqa: F401
@@ -0,0 +1,32 @@
+"""Command line interface of the lingdata package."""
+import argparse
+
+from .build import DATA_DIR, STAGES, build
+
+
+def main():
+    """Command line interface."""
+    parser = argparse.ArgumentParser(prog="python -m lingdata")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    parser_build = subparsers.add_parser(
+        "build", help="Build the databases whose inputs changed.")
+    parser_build.add_argument("stages", nargs="*",
+                              help="Databases to build (default: all): "
+                              + ", ".join(STAGES))
+    parser_build.add_argument("--data-dir", default=DATA_DIR,
+                              help="Directory of the databases.")
+    parser_build.add_argument("-j", "--jobs", type=int,
+                              help="Maximum number of parallel builds.")
+    parser_build.add_argument("--force", action="store_true",
+                              help="Rebuild even if nothing changed.")
+    args = parser.parse_args()
+    if args.command == "build":
+        unknown = set(args.stages) - set(STAGES)
+        if unknown:
+            parser.error("unknown stages: " + ", ".join(sorted(unknown)))
+        build(args.stages, data_dir=args.data_dir, jobs=args.jobs,
+              force=args.force)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,58 @@
 #!/usr/bin/env python3
 """Download ASJP data, process, and save to a SQLite database."""
 import argparse
-import collections
+import functools
+import hashlib
 import itertools
 import json
 import os
 import os.path
-import re
 import sqlite3
 import zipfile
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 import Levenshtein
+import numpy as np
 import pandas as pd
 
-from .utils import set_sql_opts, unset_sql_opts, download_file
+from . import levenshtein
+from .asjp_matrix import create_matrix, open_matrix, condensed_index
+from .utils import (StageTimer, add_timer_arguments, download_file,
+                    set_sql_opts, unset_sql_opts)
 
 URL = ("https://cdstar.shh.mpg.de/bitstreams/EAEA0-5E8D-A9F9-399E-0/"
        "asjp_dataset.tab.zip")
 DOWNLOAD_DIR = "downloads"
+CHUNKSIZE = 2000
+"""Approximate number of language pairs sent to a worker at a time."""
+CACHE_SIZE = 2 ** 20
+"""Maximum number of distances between entries memoized by each process."""
+ALL_LANGUAGES = ''
+"""Pseudo-family of the chunks of the all-pairs matrix."""
+BACKENDS = ('levenshtein', 'numpy')
+"""Implementations of :func:`lexidists` used to compute distances.
 
+``levenshtein`` uses :func:`lexidists` with memoized distances and
+``numpy`` uses :func:`lingdata.levenshtein.lexidists_block`. Both give
+identical results. ``numpy`` is faster when few word pairs repeat, so
+that the memoized distances are rarely reused: on synthetic wordlists it
+took 40% of the time and half the memory. When related languages share
+many words, the memoized distances can be faster; compare the
+``lexidists`` and ``lexidists_block`` benchmarks of
+:mod:`lingdata.benchmarks` on the data.
 
-def insert_meanings(conn):
-    """Insert data into the ``meanings`` table."""
+"""
+
+
+def load_meanings():
+    """Load the ASJP meanings."""
     with open(os.path.join('data-raw', 'ASJP_meanings.json'), 'r') as f:
-        meanings = json.load(f)
+        return json.load(f)
+
+
+def insert_meanings(conn, meanings):
+    """Insert data into the ``meanings`` table."""
     c = conn.cursor()
     for meaning, v in meanings.items():
         c.execute("INSERT INTO meanings VALUES (?, ?, ?)", (meaning, v['id'],
@@ -32,14 +60,144 @@ def insert_meanings(conn):
     conn.commit()
 
 
+def parse_wordlists(data, word_variables):
+    """Split the wordlists of the ASJP dataset into one row per word.
+
+    Parameters
+    ----------
+    data: :py:class:`~pandas.DataFrame`
+        The ASJP dataset, with one row per language.
+    word_variables: list
+        Columns of ``data`` with the words for each meaning.
+
+    Returns
+    -------
+    :py:class:`~pandas.DataFrame`
+        The rows of the ``wordlists`` table.
+
+    Synonyms are separated by commas, and loanwords are prefixed by
+    ``%``. Synonyms are numbered in the order they appear.
+
+    """
+    wordlists = data.loc[:, ['language'] + word_variables].\
+        melt(id_vars='language', var_name='meaning', value_name='word')
+    wordlists = wordlists.dropna(axis=0)
+    wordlists['word'] = wordlists['word'].str.split(r',\s*', regex=True)
+    wordlists = wordlists.explode('word')
+    wordlists['loanword'] = wordlists['word'].str.startswith('%')
+    wordlists['word'] = wordlists['word'].where(
+        ~wordlists['loanword'], wordlists['word'].str[1:])
+    wordlists = wordlists[wordlists['word'] != '']
+    # there are some duplicate words
+    wordlists = wordlists.drop_duplicates(['language', 'meaning', 'word'])
+    wordlists['synonym_num'] = wordlists.\
+        groupby(['language', 'meaning'], sort=False).cumcount() + 1
+    return wordlists.loc[:, ('language', 'meaning', 'word', 'synonym_num',
+                             'loanword')].reset_index(drop=True)
+
+
+def make_wordlist_dict(wordlists, meanings):
+    """Wordlists used to compare languages.
+
+    Parameters
+    ----------
+    wordlists: :py:class:`~pandas.DataFrame`
+        Rows of the ``wordlists`` table, as from :func:`parse_wordlists`.
+    meanings: dict
+        The ASJP meanings.
+
+    Returns
+    -------
+    dict
+        Dicts of meaning to lists of words keyed by language. Only the
+        40-item list is used, and loanwords are excluded.
+
+    """
+    in_forty = [k for k, v in meanings.items() if v['in_forty']]
+    keep = wordlists['meaning'].isin(in_forty) & ~wordlists['loanword']
+    wordlist_dict = defaultdict(dict)
+    for language, meaning, word in zip(wordlists['language'][keep],
+                                       wordlists['meaning'][keep],
+                                       wordlists['word'][keep]):
+        wordlist_dict[language].setdefault(meaning, []).append(word)
+    return dict(wordlist_dict)
+
+
 # Iterate over all pairs of languages; the comparison removes duplicate
 # and self-comparisons.
 # - Calculate LD, LDN, and LDND for all pairs
-# - use Futures for multiprocessing
 # - save to database
 
 
-def lexidists(words1, words2, min_words=2):
+def word_distance(w1, w2):
+    """Levenshtein distance between two words normalized by length."""
+    return Levenshtein.distance(w1, w2) / max(len(w1), len(w2))
+
+
+def mean_word_distance(words1, words2):
+    """Mean normalized distance between all pairs of two lists of words."""
+    d = 0
+    wcomp = list(itertools.product(words1, words2))
+    for w1, w2 in wcomp:
+        d += word_distance(w1, w2)
+    return d / len(wcomp)
+
+
+def intern_wordlists(wordlist_dict):
+    """Replace the entries of wordlists with integer IDs.
+
+    Parameters
+    ----------
+    wordlist_dict: dict
+        Wordlists (dicts of meaning to lists of words) keyed by language.
+
+    Returns
+    -------
+    (entries, interned): tuple
+        ``entries`` is a list of the unique entries, as tuples of words,
+        and ``interned`` is ``wordlist_dict`` with each list of words
+        replaced by its index in ``entries``.
+
+    Nearly all entries are a single word, so this amounts to interning the
+    words.
+
+    """
+    ids = {}
+    interned = {}
+    for language, wordlist in wordlist_dict.items():
+        interned[language] = {
+            meaning: ids.setdefault(tuple(words), len(ids))
+            for meaning, words in wordlist.items()
+        }
+    return list(ids), interned
+
+
+def cached_word_distance(entries, maxsize=CACHE_SIZE):
+    """Memoized :func:`mean_word_distance` between interned entries.
+
+    Parameters
+    ----------
+    entries: list
+        Unique entries, as returned by :func:`intern_wordlists`.
+    maxsize: int
+        Maximum number of distances to keep. The least recently used
+        distances are evicted first.
+
+    Returns
+    -------
+    function
+        A function of two entry IDs. Its ``cache_info`` method returns
+        the hits and misses of the cache.
+
+    """
+    @functools.lru_cache(maxsize=maxsize)
+    def dist(i, j):
+        return mean_word_distance(entries[i], entries[j])
+
+    return dist
+
+
+def lexidists(words1, words2, min_words=2, dist=mean_word_distance):
     """Calculate lexical distance between two pairs of languages.
 
     Parameters
@@ -48,6 +206,10 @@ def lexidists(words1, words2, min_words=2):
         List of words from two langes languages
     min_words: int
         Minimum number of common meanings
+    dist: function
+        Mean normalized distance between the words of two meanings. Use
+        :func:`cached_word_distance` with interned wordlists to memoize
+        distances.
 
     Returns
     --------
@@ -59,7 +221,9 @@ def lexidists(words1, words2, min_words=2):
     """
     ldn_sum = 0.
     ldnd_denom = 0.
-    common_words = set(words1.keys()) & set(words2.keys())
+    # sort so that the sums, and thus the results, do not depend on the
+    # (per-process) hash order of the set
+    common_words = sorted(set(words1.keys()) & set(words2.keys()))
     M = len(common_words)
     if (M > min_words):
         for meaning1, meaning2 in itertools.product(common_words,
@@ -67,11 +231,7 @@ def lexidists(words1, words2, min_words=2):
             # ignore duplicated non-equal meanings
             if meaning1 > meaning2:
                 continue
-            d = 0
-            wcomp = list(itertools.product(words1[meaning1], words2[meaning2]))
-            for w1, w2 in wcomp:
-                d += Levenshtein.distance(w1, w2) / max(len(w1), len(w2))
-            d /= len(wcomp)
+            d = dist(words1[meaning1], words2[meaning2])
             if meaning1 == meaning2:
                 ldn_sum += d
             else:
@@ -84,29 +244,252 @@ def lexidists(words1, words2, min_words=2):
         }
 
 
-def compare_langs(lang1, lang2):
+def compare_langs(lang1, lang2, dist=mean_word_distance):
     """Compare two languages."""
     # each language is a name (str), wordlist (dict) tuple
-    d = lexidists(lang1[1], lang2[1])
+    d = lexidists(lang1[1], lang2[1], dist=dist)
     # some pairs have NO overlap
     if d:
         return (lang1[0], lang2[0], d['ldn'], d['ldnd'], d['M'])
 
 
-def run(dbname):
-    """Download ASJP data, process, and insert into a database.
+def family_blocks(families, chunksize=CHUNKSIZE):
+    """Split the same-family language pairs into chunks.
 
-    The database should already have been initialized and tables created
-    before running this.
+    Parameters
+    ----------
+    families: dict
+        Sorted lists of languages keyed by family.
+    chunksize: int
+        Approximate number of language pairs in each chunk.
+
+    Yields
+    ------
+    tuple
+        ``(family, start, stop)``. The chunk consists of all pairs
+        ``(langs[i], langs[j])`` with ``start <= i < stop`` and ``j > i``,
+        where ``langs`` is the family's list of languages.
+
+    Chunks never span families, and large families are split on row
+    boundaries so that work is balanced across workers.
 
     """
-    downloaded_file = download_file(URL, DOWNLOAD_DIR)
-    print(downloaded_file)
-    asjp_dataset = zipfile.ZipFile(downloaded_file)
-    conn = sqlite3.connect(dbname)
-    set_sql_opts(conn)
-    insert_meanings(conn)
-    c = conn.cursor()
+    for family, langs in families.items():
+        n = len(langs)
+        start = 0
+        npairs = 0
+        for i in range(n - 1):
+            npairs += n - i - 1
+            if npairs >= chunksize:
+                yield (family, start, i + 1)
+                start = i + 1
+                npairs = 0
+        if npairs:
+            yield (family, start, n - 1)
+
+
+_WORDLISTS = {}
+_FAMILIES = {}
+_ONLY = None
+_DIST = mean_word_distance
+_BACKEND = 'levenshtein'
+
+
+def _init_worker(entries, wordlist_dict, families, cache_size=CACHE_SIZE,
+                 only=None, backend='levenshtein'):
+    """Set the per-process data used by :func:`compare_block`."""
+    global _WORDLISTS, _FAMILIES, _ONLY, _DIST, _BACKEND
+    _WORDLISTS = wordlist_dict
+    _FAMILIES = families
+    _ONLY = only
+    _DIST = cached_word_distance(entries, maxsize=cache_size)
+    _BACKEND = backend
+
+
+def _lexidists_pairs(pairs):
+    """Calculate the lexical distances of a list of language pairs."""
+    if _BACKEND == 'numpy':
+        return levenshtein.lexidists_block([(_WORDLISTS[a], _WORDLISTS[b])
+                                            for a, b in pairs])
+    return [lexidists(_WORDLISTS[a], _WORDLISTS[b], dist=_DIST)
+            for a, b in pairs]
+
+
+def compare_block(block):
+    """Compare all language pairs in a chunk from :func:`family_blocks`.
+
+    Returns a ``(block, npairs, rows, cache)`` tuple where ``rows`` are
+    rows for the ``distances`` table and ``cache`` is a ``(hits, misses)``
+    tuple of the distance cache while processing the chunk.
+
+    If the workers were given a set of languages to compare, pairs
+    without any of them are skipped.
+
+    """
+    family, start, stop = block
+    langs = _FAMILIES[family]
+    info = _DIST.cache_info()
+    pairs = [(langs[i], lang2) for i in range(start, stop)
+             for lang2 in langs[i + 1:]
+             if _ONLY is None or langs[i] in _ONLY or lang2 in _ONLY]
+    rows = [(lang1, lang2, d['ldn'], d['ldnd'], d['M'])
+            for (lang1, lang2), d in zip(pairs, _lexidists_pairs(pairs))
+            if d]
+    end_info = _DIST.cache_info()
+    cache = (end_info.hits - info.hits, end_info.misses - info.misses)
+    return block, len(pairs), rows, cache
+
+
+def compare_rows(block):
+    """Compare languages in a chunk with all languages after them.
+
+    Like :func:`compare_block`, but returns a ``(block, npairs, arrays,
+    cache)`` tuple. ``arrays`` is a tuple of ``ldn``, ``ldnd`` and
+    ``common_words`` arrays for the chunk's pairs in condensed-matrix
+    order, with NaN distances for pairs with too few common words.
+
+    """
+    family, start, stop = block
+    langs = _FAMILIES[family]
+    info = _DIST.cache_info()
+    pairs = [(langs[i], lang2) for i in range(start, stop)
+             for lang2 in langs[i + 1:]]
+    npairs = len(pairs)
+    ldn = np.full(npairs, np.nan)
+    ldnd = np.full(npairs, np.nan)
+    common_words = np.zeros(npairs, dtype=np.int64)
+    for k, d in enumerate(_lexidists_pairs(pairs)):
+        if d:
+            ldn[k], ldnd[k], common_words[k] = d['ldn'], d['ldnd'], d['M']
+        else:
+            lang1, lang2 = pairs[k]
+            common_words[k] = len(_WORDLISTS[lang1].keys() &
+                                  _WORDLISTS[lang2].keys())
+    end_info = _DIST.cache_info()
+    cache = (end_info.hits - info.hits, end_info.misses - info.misses)
+    return block, npairs, (ldn, ldnd, common_words), cache
+
+
+def compute_distances(wordlist_dict, families, workers=1,
+                      chunksize=CHUNKSIZE, cache_size=CACHE_SIZE,
+                      compare=compare_block, skip=(), only=None,
+                      backend='levenshtein'):
+    """Compute distances between all pairs of languages in the same family.
+
+    Parameters
+    ----------
+    wordlist_dict: dict
+        Wordlists (dicts of meaning to lists of words) keyed by language.
+    families: dict
+        Sorted lists of languages keyed by family.
+    workers: int
+        Number of worker processes. If 1, run in this process.
+    chunksize: int
+        Approximate number of language pairs in each chunk.
+    cache_size: int
+        Maximum number of distances memoized by each process.
+    compare: function
+        Function applied to each chunk, :func:`compare_block` or
+        :func:`compare_rows`.
+    skip: set
+        ``(family, start)`` of chunks that are already done.
+    only: set
+        If given, only compare pairs with at least one of these languages.
+        Only supported by :func:`compare_block`.
+    backend: str
+        One of :data:`BACKENDS`.
+
+    Yields
+    ------
+    tuple
+        The results of ``compare`` for each chunk, in the order of
+        :func:`family_blocks`.
+
+    For the ``levenshtein`` backend, wordlists are interned before they
+    are sent to the workers. Each worker receives the wordlists once, when
+    it starts, rather than with every chunk.
+
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {BACKENDS}")
+    if backend == 'numpy':
+        entries, interned = [], wordlist_dict
+    else:
+        entries, interned = intern_wordlists(wordlist_dict)
+    initargs = (entries, interned, families, cache_size, only, backend)
+    blocks = (x for x in family_blocks(families, chunksize=chunksize)
+              if x[:2] not in skip)
+    if workers <= 1:
+        _init_worker(*initargs)
+        yield from map(compare, blocks)
+    else:
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=initargs) as ex:
+            yield from ex.map(compare, blocks)
+
+
+def compute_matrix(path, wordlist_dict, families, workers=1,
+                   chunksize=CHUNKSIZE, cache_size=CACHE_SIZE, skip=(),
+                   backend='levenshtein'):
+    """Compute distances between all pairs of languages.
+
+    The distances are written to a condensed matrix in directory ``path``;
+    see :mod:`lingdata.asjp_matrix`. The arguments are the same as those
+    of :func:`compute_distances`. The chunks all have the pseudo-family
+    :data:`ALL_LANGUAGES`. If ``skip`` is not empty, the existing matrix
+    is updated.
+
+    Yields
+    ------
+    tuple
+        ``(block, npairs, rows, cache)`` for each chunk, as in
+        :func:`compare_block`, where ``rows`` are the rows for the
+        ``distances`` table of the chunk's pairs in the same family.
+
+    """
+    languages = sorted(itertools.chain(*families.values()))
+    n = len(languages)
+    language_family = {x: k for k, v in families.items() for x in v}
+    _, family_codes = np.unique([language_family[x] for x in languages],
+                                return_inverse=True)
+    if skip:
+        arrays = open_matrix(path, languages, mode='r+')
+    else:
+        arrays = create_matrix(path, languages)
+    results = compute_distances(
+        wordlist_dict, {ALL_LANGUAGES: languages},
+        workers=workers,
+        chunksize=chunksize,
+        cache_size=cache_size,
+        compare=compare_rows,
+        skip=skip,
+        backend=backend)
+    for block, npairs, (ldn, ldnd, common_words), cache in results:
+        _, start, stop = block
+        k = condensed_index(start, start + 1, n)
+        arrays['ldn'][k:k + npairs] = ldn
+        arrays['ldnd'][k:k + npairs] = ldnd
+        arrays['common_words'][k:k + npairs] = common_words
+        # the chunk may be marked as done once the rows are committed
+        for arr in arrays.values():
+            arr.flush()
+        # language indices of the pairs in the chunk
+        i = np.repeat(np.arange(start, stop), n - 1 - np.arange(start, stop))
+        j = np.arange(npairs) - (condensed_index(i, i + 1, n) - k) + i + 1
+        keep = np.flatnonzero((family_codes[i] == family_codes[j])
+                              & ~np.isnan(ldn))
+        rows = [(languages[i[x]], languages[j[x]], ldn[x], ldnd[x],
+                 int(common_words[x])) for x in keep]
+        yield block, npairs, rows, cache
+
+
+def ingest(conn, asjp_dataset, meanings):
+    """Insert the ASJP languages and wordlists into the database.
+
+    Returns the rows of the ``wordlists`` table.
+
+    """
+    insert_meanings(conn, meanings)
     with asjp_dataset.open('dataset.tab', 'r') as f:
         data = pd.read_csv(f, delimiter='\t', encoding='CP1252')
     data.rename(index=str, columns={'names': 'language'}, inplace=True)
@@ -118,76 +501,236 @@ def run(dbname):
     data.loc[:, lang_variables].to_sql(
         'languages', conn, index=False, if_exists='append')
 
-    wordlists = data.loc[:, ['language'] + word_variables].\
-        melt(id_vars='language', var_name='meaning', value_name='word')
-    wordlists = wordlists.dropna(axis=0)
-
-    for row in wordlists.itertuples(False):
-        if pd.notnull(row.word) and len(row.word) > 0:
-            # there are some duplicate words; set removes duplicates
-            words = set(re.split(r',\s*', row.word))
-            for i, w in enumerate(words):
-                if w.startswith('%'):
-                    loanword = True
-                    w = w[1:]
-                else:
-                    loanword = False
-                if w == '':
-                    continue
-                c.execute("INSERT INTO wordlists VALUES (?, ?, ?, ?, ?)",
-                          (row.language, row.meaning, w, i + 1, loanword))
+    wordlists = parse_wordlists(data, word_variables)
+    wordlists.to_sql('wordlists', conn, index=False, if_exists='append')
     conn.commit()
+    return wordlists
+
+
+def read_wordlists(conn):
+    """Read the rows of the ``wordlists`` table of an existing database."""
+    wordlists = pd.read_sql("SELECT * FROM wordlists ORDER BY rowid", conn)
+    wordlists['loanword'] = wordlists['loanword'].astype(bool)
+    return wordlists
 
-    langpairs = set(
-        c.execute("""
-        SELECT a.language as language_1,
-        b.language as language_2
-        FROM languages as a
-        INNER JOIN languages as b
-        ON a.wls_fam = b.wls_fam
-        WHERE a.language < b.language
-    """).fetchall())
-
-    res = c.execute("""
-        SELECT language, wordlists.meaning, word
-        FROM wordlists
-        INNER JOIN meanings
-        ON meanings.meaning = wordlists.meaning
-        WHERE in_forty AND NOT loanword
+
+def hash_wordlists(wordlist_dict, families):
+    """Hash the wordlist and family of each language.
+
+    Parameters
+    ----------
+    wordlist_dict: dict
+        Wordlists (dicts of meaning to lists of words) keyed by language.
+    families: dict
+        Sorted lists of languages keyed by family.
+
+    Returns
+    -------
+    dict
+        SHA-256 hex digests keyed by language. The distances of a language
+        only need to be recomputed if its digest changes.
+
+    """
+    hashes = {}
+    for family, langs in families.items():
+        for language in langs:
+            content = [family, sorted(wordlist_dict[language].items())]
+            hashes[language] = hashlib.sha256(
+                json.dumps(content).encode('utf-8')).hexdigest()
+    return hashes
+
+
+def delete_distances(c, languages):
+    """Delete the distances of ``languages`` from the database."""
+    c.execute("CREATE TEMP TABLE stale (language TEXT PRIMARY KEY)")
+    c.executemany("INSERT INTO stale VALUES (?)",
+                  ((x, ) for x in languages))
+    c.execute("""
+        DELETE FROM distances
+        WHERE language_1 IN (SELECT language FROM stale)
+        OR language_2 IN (SELECT language FROM stale)
     """)
+    c.execute("DROP TABLE stale")
+
+
+def insert_distances(c, rows, blocks):
+    """Insert distances and mark the chunks they came from as done."""
+    c.executemany("INSERT INTO distances VALUES (?, ?, ?, ?, ?)", rows)
+    c.executemany("INSERT INTO distances_progress VALUES (?, ?, ?)", blocks)
+
 
-    wordlist_dict = defaultdict(lambda: collections.defaultdict(list))
-
-    for language, meaning, word in res:
-        wordlist_dict[language][meaning].append(word)
-    wordlist_dict = dict(wordlist_dict)
-
-    wordlist_iter = ((x, y)
-                     for x, y in itertools.product(wordlist_dict.items(),
-                                                   wordlist_dict.items())
-                     if (x[0], y[0]) in langpairs)
-    update_intvl = 10000
-    results = (compare_langs(*x) for x in wordlist_iter)
-    batch = []
-    for i, res in enumerate(results):
-        if res:
-            batch.append(res)
-        if ((i + 1) % update_intvl == 0):
-            c.executemany("INSERT INTO distances VALUES (?, ?, ?, ?, ?)",
-                          batch)
-            batch = []
-            print("Processed %d" % (i + 1))
+def run(dbname, workers=1, all_pairs=None, resume=False, update=False,
+        backend='levenshtein', timer=None):
+    """Download ASJP data, process, and insert into a database.
+
+    The database should already have been initialized and tables created
+    before running this.
+
+    If ``all_pairs`` is a directory, distances between all pairs of
+    languages, not only those in the same family, are written to a
+    condensed matrix in that directory (see :mod:`lingdata.asjp_matrix`).
+    The ``distances`` table is filled with the same-family pairs as usual.
+
+    Distances are committed in batches, together with the chunks of
+    language pairs they came from. If ``resume`` is true, continue an
+    interrupted run: the data is only inserted if that had not finished,
+    and chunks that were committed are skipped. A run must be resumed with
+    the same ``all_pairs`` option it was started with.
+
+    A hash of the wordlist of each language is stored in the database. If
+    ``update`` is true, the data in an existing database is replaced, but
+    only the distances of languages whose wordlist or family changed, or
+    that were added or removed, are recomputed. The new hashes are stored
+    with the last batch of distances, so an interrupted update can be run
+    again or resumed. The all-pairs matrix cannot be updated.
+
+    ``backend`` selects the implementation of the distances; see
+    :data:`BACKENDS`. ``timer`` is a :py:class:`~lingdata.utils.StageTimer`
+    measuring each stage.
+
+    """
+    if update and (resume or all_pairs):
+        raise ValueError("update cannot be combined with resume or "
+                         "all_pairs")
+    timer = timer or StageTimer('asjp')
+    with timer.stage('download'):
+        downloaded_file = download_file(URL, DOWNLOAD_DIR)
+    print(downloaded_file)
+    asjp_dataset = zipfile.ZipFile(downloaded_file)
+    conn = sqlite3.connect(dbname)
+    try:
+        set_sql_opts(conn)
+        c = conn.cursor()
+        meanings = load_meanings()
+        ingested = False
+        if resume:
+            ingested = c.execute(
+                "SELECT COUNT(*) FROM wordlists").fetchone()[0]
+        # The hashes are only replaced once all distances are inserted, so
+        # that an interrupted update can be repeated or resumed.
+        old_hashes = {}
+        tables = ['distances_progress', 'wordlists', 'languages', 'meanings']
+        if update or ingested:
+            old_hashes = dict(
+                c.execute("SELECT language, hash FROM wordlist_hashes"))
+        else:
+            tables.extend(['wordlist_hashes', 'distances'])
+        with timer.stage('ingest') as record:
+            if ingested:
+                wordlists = read_wordlists(conn)
+            else:
+                for table in tables:
+                    c.execute(f"DELETE FROM {table}")
+                wordlists = ingest(conn, asjp_dataset, meanings)
+            record['rows'] = len(wordlists)
+        with timer.stage('transform') as record:
+            wordlist_dict = make_wordlist_dict(wordlists, meanings)
+            record['rows'] = len(wordlist_dict)
+
+        # Only languages with a wordlist are compared
+        families = defaultdict(list)
+        for language, family in c.execute("""
+            SELECT language, wls_fam FROM languages ORDER BY language
+        """).fetchall():
+            if language in wordlist_dict:
+                families[family].append(language)
+        families = dict(families)
+
+        # A resumed run continues an interrupted update if the stored hashes
+        # are those of an earlier dataset.
+        only = None
+        hashes = hash_wordlists(wordlist_dict, families)
+        done = set(c.execute("SELECT family, start FROM distances_progress"))
+        if update or (old_hashes and old_hashes != hashes):
+            only = set(old_hashes.keys() - hashes.keys())
+            only.update(k for k, v in hashes.items() if old_hashes.get(k) != v)
+            print("Updating %d languages" % len(only))
+            # the stale distances are deleted before the first batch of new
+            # ones is committed
+            if not done:
+                delete_distances(c, only)
+                conn.commit()
+            families = {k: v for k, v in families.items()
+                        if only.intersection(v)}
+
+        # A memory journal can corrupt the database if the process dies
+        # mid-transaction, which would make the committed batches useless.
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if done:
+            print("Resuming after %d chunks" % len(done))
+
+        update_intvl = 10000
+        processed = 0
+        inserted = 0
+        hits = misses = 0
+        pending = 0
+        batch = []
+        blocks = []
+        with timer.stage('distances') as record:
+            if all_pairs:
+                results = compute_matrix(all_pairs, wordlist_dict, families,
+                                         workers=workers, skip=done,
+                                         backend=backend)
+            else:
+                results = compute_distances(wordlist_dict, families,
+                                            workers=workers, skip=done,
+                                            only=only, backend=backend)
+            for block, npairs, rows, cache in results:
+                batch.extend(rows)
+                inserted += len(rows)
+                blocks.append(block)
+                processed += npairs
+                pending += npairs
+                hits += cache[0]
+                misses += cache[1]
+                if pending >= update_intvl:
+                    insert_distances(c, batch, blocks)
+                    pending = 0
+                    batch = []
+                    blocks = []
+                    print("Processed %d (cache hits %d, misses %d)" %
+                          (processed, hits, misses))
+                    conn.commit()
+            insert_distances(c, batch, blocks)
+            c.execute("DELETE FROM wordlist_hashes")
+            c.executemany("INSERT INTO wordlist_hashes VALUES (?, ?)",
+                          hashes.items())
             conn.commit()
-    conn.commit()
-    unset_sql_opts(conn)
+            record['rows'] = inserted
+        unset_sql_opts(conn)
+    finally:
+        conn.close()
 
 
 def main():
     """Command line interface."""
     parser = argparse.ArgumentParser()
     parser.add_argument("db", help="Path to a SQLite database.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of processes used to compute distances.")
+    parser.add_argument("--all-pairs", metavar="DIR",
+                        help=("Also compute distances between languages in "
+                              "different families and save them to a "
+                              "condensed matrix in DIR."))
+    parser.add_argument("--backend", choices=BACKENDS, default='levenshtein',
+                        help=("Implementation used to compute distances. "
+                              "numpy is faster when few words repeat "
+                              "across languages."))
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--resume", action="store_true",
+                       help="Continue an interrupted run.")
+    group.add_argument("--update", action="store_true",
+                       help=("Update an existing database, only recomputing "
+                             "the distances of changed languages."))
+    add_timer_arguments(parser)
     args = parser.parse_args()
-    run(args.db)
+    timer = StageTimer('asjp', profile_dir=args.profile)
+    run(args.db, workers=args.workers, all_pairs=args.all_pairs,
+        resume=args.resume, update=args.update, backend=args.backend,
+        timer=timer)
+    if args.report:
+        timer.write(args.report)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,147 @@
+"""Memory-mapped condensed matrices of ASJP distances between all languages.
+
+A matrix is a directory with the sorted list of languages in
+``languages.json`` and one ``.npy`` file per variable in :data:`VARIABLES`.
+Each file holds the upper triangle of the ``n x n`` matrix, row by row, in
+the same layout as :py:func:`scipy.spatial.distance.squareform`.
+
+"""
+import json
+import os.path
+
+import numpy as np
+
+VARIABLES = {
+    'ldn': np.float32,
+    'ldnd': np.float32,
+    'common_words': np.int16,
+}
+"""Variables stored in the matrix and their types."""
+
+LANGUAGES_FILE = 'languages.json'
+
+
+def condensed_size(n):
+    """Number of pairs in a condensed matrix of ``n`` items."""
+    return n * (n - 1) // 2
+
+
+def condensed_index(i, j, n):
+    """Index of the pair ``(i, j)``, ``i != j``, in a condensed matrix.
+
+    ``i`` and ``j`` can be integers or arrays.
+
+    """
+    i, j = np.minimum(i, j), np.maximum(i, j)
+    return n * i - i * (i + 1) // 2 + (j - i - 1)
+
+
+def create_matrix(path, languages):
+    """Create an empty matrix for ``languages`` in directory ``path``.
+
+    Distances are initialized to NaN and counts to 0.
+
+    Returns
+    -------
+    dict
+        Writable memory-mapped arrays keyed by variable.
+
+    """
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, LANGUAGES_FILE), 'w') as f:
+        json.dump(list(languages), f)
+    size = condensed_size(len(languages))
+    arrays = {}
+    for variable, dtype in VARIABLES.items():
+        arr = np.lib.format.open_memmap(
+            os.path.join(path, f'{variable}.npy'),
+            mode='w+',
+            dtype=dtype,
+            shape=(size, ))
+        arr[:] = np.nan if np.issubdtype(dtype, np.floating) else 0
+        arrays[variable] = arr
+    return arrays
+
+
+def open_matrix(path, languages=None, mode='r'):
+    """Open the arrays of an existing matrix in directory ``path``.
+
+    If ``languages`` is given, check that the matrix is for the same
+    languages.
+
+    Returns
+    -------
+    dict
+        Memory-mapped arrays keyed by variable.
+
+    """
+    if languages is not None:
+        with open(os.path.join(path, LANGUAGES_FILE), 'r') as f:
+            if json.load(f) != list(languages):
+                raise ValueError(f"{path} is a matrix of other languages")
+    return {
+        variable: np.load(os.path.join(path, f'{variable}.npy'),
+                          mmap_mode=mode)
+        for variable in VARIABLES
+    }
+
+
+class DistanceMatrix:
+    """Read-only view of a matrix written by :func:`create_matrix`.
+
+    Languages can be given either as names or as integer indices into
+    :attr:`languages`. Nothing is read from disk until it is accessed.
+
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, LANGUAGES_FILE), 'r') as f:
+            self.languages = json.load(f)
+        self.index = {x: i for i, x in enumerate(self.languages)}
+        self.arrays = open_matrix(path)
+
+    def __len__(self):
+        return len(self.languages)
+
+    def _indices(self, langs):
+        """Convert language names or indices to an array of indices."""
+        langs = np.atleast_1d(langs)
+        if langs.dtype.kind in 'iu':
+            return langs
+        return np.array([self.index[x] for x in langs], dtype=np.int64)
+
+    def upper(self, lang, variable='ldnd'):
+        """Distances from ``lang`` to all languages after it.
+
+        This is a view of the memory-mapped file; nothing is copied.
+
+        """
+        i = int(self._indices(lang)[0])
+        n = len(self)
+        start = condensed_index(i, i + 1, n) if i < n - 1 else 0
+        return self.arrays[variable][start:start + n - i - 1]
+
+    def block(self, langs1, langs2, variable='ldnd'):
+        """Distances between each of ``langs1`` and each of ``langs2``.
+
+        Returns a ``len(langs1) x len(langs2)`` array. Only the requested
+        elements are read. The diagonal is 0.
+
+        """
+        i = self._indices(langs1)[:, np.newaxis]
+        j = self._indices(langs2)[np.newaxis, :]
+        # the diagonal is not in the matrix, which is empty for one language
+        off_diag = i != j
+        k = condensed_index(i, j, len(self))
+        arr = self.arrays[variable]
+        out = np.zeros(off_diag.shape, dtype=arr.dtype)
+        out[off_diag] = arr[k[off_diag]]
+        return out
+
+    def row(self, lang, variable='ldnd'):
+        """Distances from ``lang`` to all languages."""
+        return self.block(lang, np.arange(len(self)), variable)[0]
+
+    def distance(self, lang1, lang2, variable='ldnd'):
+        """Distance between two languages."""
+        return self.block(lang1, lang2, variable)[0, 0]
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""Find the ASJP languages closest to a wordlist."""
+import argparse
+import heapq
+import json
+import re
+import sqlite3
+
+import numpy as np
+
+from .asjp import (lexidists, make_wordlist_dict, mean_word_distance,
+                   read_wordlists)
+
+METRICS = ('ldn', 'ldnd')
+
+
+def parse_wordlist(wordlist):
+    """Clean a wordlist given as a dict of meaning to words.
+
+    The words of a meaning can be a list or a string of comma separated
+    synonyms, as in the ASJP dataset. Loanwords, prefixed by ``%``, and
+    empty words are dropped.
+
+    """
+    out = {}
+    for meaning, words in wordlist.items():
+        if isinstance(words, str):
+            words = re.split(r',\s*', words)
+        words = [w for w in words if w and not w.startswith('%')]
+        if words:
+            out[meaning] = words
+    return out
+
+
+def ldn(words1, words2, min_words=2):
+    """LDN between two wordlists, as in :func:`~lingdata.asjp.lexidists`.
+
+    This only compares words with the same meaning, so it is much cheaper
+    than computing LDND. Returns ``None`` if there are too few common
+    meanings.
+
+    """
+    common_words = sorted(set(words1.keys()) & set(words2.keys()))
+    if len(common_words) > min_words:
+        ldn_sum = 0.
+        for meaning in common_words:
+            ldn_sum += mean_word_distance(words1[meaning], words2[meaning])
+        return ldn_sum / len(common_words)
+
+
+def length_ranges(wordlist, meanings):
+    """Shortest and longest word of each meaning in ``meanings``.
+
+    Returns two arrays with NaN for missing meanings.
+
+    """
+    lo = np.full(len(meanings), np.nan)
+    hi = np.full(len(meanings), np.nan)
+    for j, meaning in enumerate(meanings):
+        words = wordlist.get(meaning)
+        if words:
+            lengths = [len(w) for w in words]
+            lo[j] = min(lengths)
+            hi[j] = max(lengths)
+    return lo, hi
+
+
+class WordlistIndex:
+    """Index of ASJP wordlists for nearest-language queries.
+
+    Parameters
+    ----------
+    wordlist_dict: dict
+        Wordlists (dicts of meaning to lists of words) keyed by language.
+
+    Queries only fully score a few languages by using cheap lower bounds:
+
+    1. The normalized Levenshtein distance between two words is at least
+       their difference in length divided by the longer length. Averaging
+       these over the common meanings bounds LDN from below. The bounds of
+       all languages are computed at once with NumPy.
+    2. LDN itself, which only compares words with the same meaning, is a
+       lower bound of LDND, since LDND divides LDN by the mean distance
+       between words with different meanings, which is at most 1.
+
+    Languages are taken from a priority queue ordered by their current
+    bound. A language with a length bound has its LDN computed and is put
+    back; a language with an LDN bound is fully scored. The search stops
+    once the smallest bound is at least the k-th best distance.
+
+    """
+
+    def __init__(self, wordlist_dict):
+        self.wordlist_dict = wordlist_dict
+        self.languages = sorted(wordlist_dict)
+        self.meanings = sorted(
+            set(m for x in wordlist_dict.values() for m in x))
+        ranges = [
+            length_ranges(wordlist_dict[x], self.meanings)
+            for x in self.languages
+        ]
+        self.lo = np.array([x[0] for x in ranges]).reshape(
+            (len(self.languages), len(self.meanings)))
+        self.hi = np.array([x[1] for x in ranges]).reshape(
+            (len(self.languages), len(self.meanings)))
+        self.scored = 0
+        """Number of languages fully scored by the last query."""
+        self.refined = 0
+        """Number of languages whose LDN was computed by the last query."""
+
+    @classmethod
+    def from_db(cls, dbname):
+        """Create an index from the wordlists in an ASJP database."""
+        conn = sqlite3.connect(dbname)
+        meanings = {
+            meaning: {'in_forty': bool(in_forty)}
+            for meaning, in_forty in conn.execute(
+                "SELECT meaning, in_forty FROM meanings")
+        }
+        wordlist_dict = make_wordlist_dict(read_wordlists(conn), meanings)
+        conn.close()
+        return cls(wordlist_dict)
+
+    def lower_bounds(self, wordlist, min_words=2):
+        """Lower bounds of the LDN between ``wordlist`` and each language.
+
+        Returns an array of bounds and an array with the numbers of common
+        meanings. Languages with no more than ``min_words`` common
+        meanings have an infinite bound.
+
+        """
+        qlo, qhi = length_ranges(wordlist, self.meanings)
+        common = ~np.isnan(self.lo) & ~np.isnan(qlo)
+        # the length ranges are disjoint in at most one direction
+        with np.errstate(invalid='ignore'):
+            above = np.where(qhi < self.lo, 1 - qhi / self.lo, 0)
+            below = np.where(qlo > self.hi, 1 - self.hi / qlo, 0)
+        M = common.sum(axis=1)
+        bound = np.where(common, above + below, 0).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            bound = np.where(M > min_words, bound / M, np.inf)
+        return bound, M
+
+    def nearest(self, wordlist, k=10, metric='ldnd', min_words=2):
+        """Find the ``k`` languages closest to ``wordlist``.
+
+        Parameters
+        ----------
+        wordlist: dict
+            Words keyed by meaning; see :func:`parse_wordlist`.
+        k: int
+            Number of languages.
+        metric: str
+            Either ``'ldn'`` or ``'ldnd'``.
+        min_words: int
+            Minimum number of common meanings
+
+        Returns
+        -------
+        list
+            ``(language, ldn, ldnd, common_words)`` tuples, sorted by
+            ``metric``.
+
+        """
+        if metric not in METRICS:
+            raise ValueError(f"metric must be one of {METRICS}")
+        wordlist = parse_wordlist(wordlist)
+        bound, _ = self.lower_bounds(wordlist, min_words=min_words)
+        # (bound, bound is LDN, language index)
+        queue = [(bound[i], False, i) for i in np.flatnonzero(
+            np.isfinite(bound))]
+        heapq.heapify(queue)
+        # min-heap of the negated distances of the k best so far
+        best = []
+        self.scored = self.refined = 0
+        while queue:
+            b, is_ldn, i = heapq.heappop(queue)
+            if len(best) == k and b >= -best[0][0]:
+                break
+            language = self.languages[i]
+            words = self.wordlist_dict[language]
+            if not is_ldn:
+                self.refined += 1
+                d = ldn(wordlist, words, min_words=min_words)
+                if d is not None:
+                    heapq.heappush(queue, (d, True, i))
+                continue
+            self.scored += 1
+            d = lexidists(wordlist, words, min_words=min_words)
+            item = (-d[metric], language, d['ldn'], d['ldnd'], d['M'])
+            if len(best) < k:
+                heapq.heappush(best, item)
+            elif item > best[0]:
+                heapq.heapreplace(best, item)
+        return [x[1:] for x in sorted(best, reverse=True)]
+
+
+def main():
+    """Command line interface."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("db", help="Path to an ASJP SQLite database.")
+    parser.add_argument("wordlist",
+                        help="JSON file with words keyed by meaning.")
+    parser.add_argument("-k", type=int, default=10,
+                        help="Number of languages.")
+    parser.add_argument("--metric", choices=METRICS, default='ldnd',
+                        help="Distance used to rank languages.")
+    args = parser.parse_args()
+    with open(args.wordlist, 'r') as f:
+        wordlist = json.load(f)
+    index = WordlistIndex.from_db(args.db)
+    print("language\tldn\tldnd\tcommon_words")
+    for row in index.nearest(wordlist, k=args.k, metric=args.metric):
+        print("%s\t%f\t%f\t%d" % row)
+
+
+if __name__ == '__main__':
+    main()
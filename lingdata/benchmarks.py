@@ -0,0 +1,767 @@
+#!/usr/bin/env python3
+"""Benchmarks of the build steps.
+
+There are four commands:
+
+``compare``
+    Compare alternative implementations of a build step on a given input.
+``micro``
+    Time the hot paths of the builds (:data:`MICRO`) on synthetic data.
+``build``
+    Time the builds of the databases from synthetic data.
+``check``
+    Compare the saved results of two commits to detect regressions.
+
+The synthetic sources are generated with :mod:`lingdata.synthetic` in a
+work directory, which is set up like the root of the repository with the
+sources as the mirror (see :data:`lingdata.utils.MIRROR_ENV`), so that
+the builds read them as usual.
+
+Each benchmark is run in a fresh Python process, so that its peak resident
+set size (RSS) is not affected by the others. Besides the peak RSS of the
+process, the benchmarks report its increase while running the benchmark,
+which excludes the interpreter, imported modules and the setup. With
+``--save``, the results are saved to :data:`RESULTS`, keyed by the git
+commit they were measured at.
+
+"""
+import argparse
+import collections
+import contextlib
+import datetime
+import functools
+import json
+import os
+import os.path
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from . import asjp, ethnologue, glottolog, iso_639_3, levenshtein, synthetic
+from .build import STAGES
+from .fetch import fetch_all
+from .tree import NODE_PATTERN, ArrayTree, read_newick
+from .utils import (DOWNLOAD_DIR, MIRROR_ENV, download_file, max_rss,
+                    set_sql_opts)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+"""Root directory of the repository."""
+
+WORK_DIR = "benchmarks"
+"""Default work directory of the synthetic data and builds."""
+
+RESULTS = "benchmarks.json"
+"""Default file of the saved results."""
+
+SCALE = 0.1
+"""Default scale of the synthetic data; see :func:`synthetic.generate`."""
+
+PAIRS = 2000
+"""Number of language pairs compared by the ``lexidists`` benchmarks."""
+
+THRESHOLD = 1.25
+"""Default ratio of times above which ``check`` reports a regression."""
+
+MIN_TIME = 0.01
+"""Times in seconds below which ``check`` reports no regressions, since
+they are mostly noise."""
+
+BUILD_STAGES = ('glottolog', 'asjp', 'iso_639_3', 'ethnologue', 'names')
+"""Stages built by the ``build`` benchmark. WALS needs R and real data."""
+
+
+def newick_legacy(path):
+    """Parse the Glottolog tree with :py:mod:`newick` into nested dicts.
+
+    This was the implementation of
+    :func:`lingdata.glottolog.glottolog_tree` before
+    :func:`lingdata.tree.read_newick`.
+
+    """
+    import newick
+
+    def walk_tree(x):
+        m = NODE_PATTERN.match(x.name.strip("'"))
+        node = m.groupdict()
+        node['language'] = node['language'] is not None
+        node['children'] = [walk_tree(n) for n in x.descendants]
+        return node
+
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = newick.loads(f.read())
+    return [walk_tree(branch) for branch in tree]
+
+
+def newick_arrays(path):
+    """Parse the Glottolog tree with :func:`lingdata.tree.read_newick`."""
+    return read_newick(path)
+
+
+BENCHMARKS = {
+    'newick': (newick_legacy, newick_arrays),
+}
+"""Implementations compared by each benchmark."""
+
+
+def run_one(name, path):
+    """Run one implementation in this process and return its stats."""
+    func = globals()[name]
+    sys.setrecursionlimit(100000)
+    rss = max_rss()
+    start = time.perf_counter()
+    func(path)
+    return {
+        'name': name,
+        'time': time.perf_counter() - start,
+        'max_rss': max_rss(),
+        'rss_increase': max_rss() - rss,
+    }
+
+
+def run_isolated(benchmark, name, path):
+    """Run one implementation in a new Python process."""
+    out = subprocess.run(
+        [sys.executable, '-m', 'lingdata.benchmarks', 'compare', benchmark,
+         path, '--child', name],
+        check=True, stdout=subprocess.PIPE)
+    return json.loads(out.stdout)
+
+
+# Inputs of the microbenchmarks, read from the synthetic sources in the
+# work directory. Each is only read once per process.
+
+@functools.lru_cache(None)
+def _nodes():
+    """Node arrays of the Glottolog tree."""
+    return glottolog.glottolog_tree()
+
+
+@functools.lru_cache(None)
+def _tree():
+    """:py:class:`~lingdata.tree.ArrayTree` of the Glottolog tree."""
+    nodes = _nodes()
+    return ArrayTree(nodes['glottocode'], nodes['parent'])
+
+
+@functools.lru_cache(None)
+def _langdata():
+    """Glottolog languoid data, with the tree filled in."""
+    return glottolog.create_langdata(_tree())
+
+
+@functools.lru_cache(None)
+def _asjp_wordlists():
+    """ASJP wordlists keyed by language, and languages keyed by family."""
+    meanings = asjp.load_meanings()
+    with zipfile.ZipFile(download_file(asjp.URL, asjp.DOWNLOAD_DIR)) as z, \
+            z.open('dataset.tab', 'r') as f:
+        data = pd.read_csv(f, delimiter='\t', encoding='CP1252')
+    data = data.rename(columns={'names': 'language'})
+    wordlists = asjp.parse_wordlists(
+        data, [x for x in data.columns if x in meanings])
+    wordlist_dict = asjp.make_wordlist_dict(wordlists, meanings)
+    families = collections.defaultdict(list)
+    for language, family in sorted(zip(data['language'], data['wls_fam'])):
+        if language in wordlist_dict:
+            families[family].append(language)
+    return wordlist_dict, dict(families)
+
+
+@functools.lru_cache(None)
+def _language_pairs():
+    """Wordlists of :data:`PAIRS` random same-family pairs of languages."""
+    wordlist_dict, families = _asjp_wordlists()
+    pairs = [(x, y) for langs in families.values()
+             for i, x in enumerate(langs) for y in langs[i + 1:]]
+    pairs = random.Random(0).sample(pairs, min(PAIRS, len(pairs)))
+    return [(wordlist_dict[x], wordlist_dict[y]) for x, y in pairs]
+
+
+def _new_db(name):
+    """Connection to a new database with the schema of stage ``name``."""
+    path = os.path.join(tempfile.mkdtemp(), f'{name}.db')
+    conn = sqlite3.connect(path)
+    with open(os.path.join('src', f'{name}.sql'), 'r') as f:
+        conn.executescript(f.read())
+    set_sql_opts(conn)
+    return conn
+
+
+def micro_read_newick():
+    """Parse the Glottolog tree with :func:`~lingdata.tree.read_newick`."""
+    path = download_file(glottolog.URLS['glottolog-newick'],
+                         glottolog.DOWNLOAD_DIR)
+
+    def run():
+        return len(read_newick(path)['glottocode'])
+
+    return run, tuple
+
+
+def micro_array_tree():
+    """Build the :py:class:`~lingdata.tree.ArrayTree` of the tree."""
+    nodes = _nodes()
+
+    def run():
+        return len(ArrayTree(nodes['glottocode'], nodes['parent']))
+
+    return run, tuple
+
+
+def micro_fill_tree():
+    """Fill the languoid data with :func:`~lingdata.glottolog.fill_tree`.
+
+    This replaced ``walk_tree`` and ``topdown_fill``.
+
+    """
+    tree = _tree()
+    newdata = glottolog.get_langdata()
+
+    def run(newdata):
+        glottolog.fill_tree(tree, newdata)
+        return len(newdata)
+
+    # fill_tree updates the data in place
+    return run, lambda: ({k: dict(v) for k, v in newdata.items()}, )
+
+
+def _family_coordinates():
+    """Coordinates of the languages and dialects and their family index."""
+    langdata = _langdata()
+    families = {}
+    long, lat, groups = [], [], []
+    for x in langdata.values():
+        if x['level'] in ('language', 'dialect') and x.get('family') \
+                and x['latitude'] is not None:
+            long.append(x['longitude'])
+            lat.append(x['latitude'])
+            groups.append(families.setdefault(x['family'], len(families)))
+    return long, lat, groups, len(families)
+
+
+def micro_geomean():
+    """:func:`~lingdata.glottolog.geomean` of the languages of each family.
+    """
+    long, lat, groups, n = _family_coordinates()
+    coords = collections.defaultdict(lambda: ([], []))
+    for x, y, g in zip(long, lat, groups):
+        coords[g][0].append(x)
+        coords[g][1].append(y)
+
+    def run():
+        for x, y in coords.values():
+            glottolog.geomean(x, y)
+        return len(coords)
+
+    return run, tuple
+
+
+def micro_geomean_groups():
+    """:func:`~lingdata.glottolog.geomean_groups` of all families at once.
+    """
+    long, lat, groups, n = (np.array(x) for x in _family_coordinates())
+
+    def run():
+        glottolog.geomean_groups(long, lat, groups, int(n))
+        return int(n)
+
+    return run, tuple
+
+
+def micro_create_distmat():
+    """Compute all rows of :func:`~lingdata.glottolog.create_distmat`."""
+    langdata = _langdata()
+    tree = _tree()
+
+    def run():
+        return sum(1 for _ in glottolog.create_distmat(langdata, tree))
+
+    return run, tuple
+
+
+def micro_lexidists():
+    """:func:`~lingdata.asjp.lexidists` of :data:`PAIRS` language pairs."""
+    pairs = _language_pairs()
+
+    def run():
+        for words1, words2 in pairs:
+            asjp.lexidists(words1, words2)
+        return len(pairs)
+
+    return run, tuple
+
+
+def micro_lexidists_block():
+    """:func:`~lingdata.levenshtein.lexidists_block` of the same pairs."""
+    pairs = _language_pairs()
+
+    def run():
+        levenshtein.lexidists_block(pairs)
+        return len(pairs)
+
+    return run, tuple
+
+
+def micro_insert_languoids():
+    """Insert the ``languoids`` table of the Glottolog database."""
+    langdata = list(_langdata().values())
+
+    def run(conn):
+        return glottolog.insert_languoids(conn, langdata)
+
+    return run, lambda: (_new_db('glottolog'), )
+
+
+def micro_insert_paths():
+    """Insert the ``paths`` table of the Glottolog database."""
+    tree = _tree()
+
+    def run(conn):
+        return glottolog.insert_paths(conn, tree)
+
+    return run, lambda: (_new_db('glottolog'), )
+
+
+def micro_insert_distances():
+    """Insert the ``distances`` table of the Glottolog database."""
+    rows = list(glottolog.create_distmat(_langdata(), _tree()))
+
+    def run(conn):
+        return glottolog.insert_distances(conn, rows)
+
+    return run, lambda: (_new_db('glottolog'), )
+
+
+def micro_insert_codes():
+    """Insert the code tables of the Glottolog database."""
+    langdata = list(_langdata().values())
+
+    def run(conn):
+        return sum((glottolog.insert_wals_codes(conn, langdata),
+                    glottolog.insert_iso_codes(conn, langdata),
+                    glottolog.insert_macroareas(conn, langdata),
+                    glottolog.insert_countries(conn, langdata)))
+
+    return run, lambda: (_new_db('glottolog'), )
+
+
+def micro_asjp_ingest():
+    """Insert the ASJP languages and wordlists."""
+    meanings = asjp.load_meanings()
+    path = download_file(asjp.URL, asjp.DOWNLOAD_DIR)
+
+    def run(conn):
+        with zipfile.ZipFile(path) as z:
+            return len(asjp.ingest(conn, z, meanings))
+
+    return run, lambda: (_new_db('asjp'), )
+
+
+def micro_asjp_insert_distances():
+    """Insert the ASJP distances of all same-family pairs of languages."""
+    _, families = _asjp_wordlists()
+    rng = random.Random(0)
+    rows = [(x, y, rng.random(), rng.random() + .5, 40)
+            for langs in families.values()
+            for i, x in enumerate(langs) for y in langs[i + 1:]]
+    blocks = [(family, 0, len(langs)) for family, langs in families.items()]
+
+    def run(conn):
+        c = conn.cursor()
+        asjp.insert_distances(c, rows, blocks)
+        conn.commit()
+        return len(rows)
+
+    return run, lambda: (_new_db('asjp'), )
+
+
+def micro_insert_iso_639_3():
+    """Read and insert the ISO 639-3 code tables."""
+    download_file(iso_639_3.iso_639_3_url(iso_639_3.CURRENT_DATE),
+                  iso_639_3.DOWNLOAD_DIR)
+
+    def run(conn):
+        db = conn.execute("PRAGMA database_list").fetchone()[2]
+        conn.close()
+        iso_639_3.insert_data(db)
+
+    return run, lambda: (_new_db('iso_639_3'), )
+
+
+def micro_insert_ethnologue():
+    """Read and insert the Ethnologue code tables."""
+    download_file(ethnologue.ethnologue_url(ethnologue.CURRENT_DATE),
+                  ethnologue.DOWNLOAD_DIR)
+
+    def run(conn):
+        db = conn.execute("PRAGMA database_list").fetchone()[2]
+        conn.close()
+        ethnologue.insert_data(db)
+
+    return run, lambda: (_new_db('ethnologue'), )
+
+
+MICRO = {
+    'read_newick': micro_read_newick,
+    'array_tree': micro_array_tree,
+    'fill_tree': micro_fill_tree,
+    'geomean': micro_geomean,
+    'geomean_groups': micro_geomean_groups,
+    'create_distmat': micro_create_distmat,
+    'lexidists': micro_lexidists,
+    'lexidists_block': micro_lexidists_block,
+    'insert_languoids': micro_insert_languoids,
+    'insert_paths': micro_insert_paths,
+    'insert_distances': micro_insert_distances,
+    'insert_codes': micro_insert_codes,
+    'asjp_ingest': micro_asjp_ingest,
+    'asjp_insert_distances': micro_asjp_insert_distances,
+    'insert_iso_639_3': micro_insert_iso_639_3,
+    'insert_ethnologue': micro_insert_ethnologue,
+}
+"""Microbenchmarks keyed by name.
+
+Each is a function which sets up the benchmark, and returns the function
+to time and a function returning its arguments, which is called before
+each run. The timed function returns the number of rows it processed, or
+``None``.
+
+"""
+
+
+def run_micro(name, repeat=3):
+    """Run microbenchmark ``name`` in this process and return its stats.
+
+    The stats are the minimum ``time`` of ``repeat`` runs, all the
+    ``times``, the peak RSS and its increase during the runs in MiB, and
+    the number of ``rows`` processed.
+
+    """
+    # the output of the build steps is not part of the results
+    with contextlib.redirect_stdout(sys.stderr):
+        func, make_args = MICRO[name]()
+        rss = max_rss()
+        times = []
+        for _ in range(repeat):
+            args = make_args()
+            start = time.perf_counter()
+            rows = func(*args)
+            times.append(time.perf_counter() - start)
+    return {
+        'time': min(times),
+        'times': times,
+        'max_rss': max_rss(),
+        'rss_increase': max_rss() - rss,
+        'rows': rows,
+    }
+
+
+def prepare(work_dir, scale=SCALE, seed=0):
+    """Set up ``work_dir`` to run the builds on synthetic data.
+
+    The synthetic sources are generated in ``<work_dir>/mirror`` unless
+    they already were with the same ``scale`` and ``seed``. The code,
+    schemas and data files are linked from the repository, so the builds
+    can run in ``work_dir``.
+
+    The mirror is set in the environment of this process, and so of
+    the builds and benchmarks it runs.
+
+    """
+    mirror = os.path.join(work_dir, 'mirror')
+    params = {'scale': scale, 'seed': seed}
+    marker = os.path.join(mirror, 'synthetic.json')
+    try:
+        with open(marker, 'r') as f:
+            current = json.load(f) == params
+    except FileNotFoundError:
+        current = False
+    if not current:
+        for x in ('mirror', 'downloads', 'data'):
+            shutil.rmtree(os.path.join(work_dir, x), ignore_errors=True)
+        start = time.perf_counter()
+        synthetic.generate(mirror, scale, seed)
+        with open(marker, 'w') as f:
+            json.dump(params, f)
+        print(f"Generated synthetic data at scale {scale} in "
+              f"{time.perf_counter() - start:.1f} s", file=sys.stderr)
+    for x in ('bin', 'data-raw', 'lingdata', 'src'):
+        link = os.path.join(work_dir, x)
+        if not os.path.lexists(link):
+            os.symlink(os.path.join(ROOT, x), link)
+    os.environ[MIRROR_ENV] = os.path.abspath(mirror)
+
+
+def micro(names, work_dir=WORK_DIR, scale=SCALE, seed=0, repeat=3):
+    """Run the microbenchmarks ``names``, each in a new Python process.
+
+    Returns their stats, see :func:`run_micro`, keyed by name.
+
+    """
+    prepare(work_dir, scale, seed)
+    results = {}
+    for name in names:
+        out = subprocess.run(
+            [sys.executable, '-m', 'lingdata.benchmarks', 'micro', name,
+             '--repeat', str(repeat), '--child'],
+            check=True, stdout=subprocess.PIPE, cwd=work_dir)
+        results[name] = json.loads(out.stdout)
+        print(format_result(name, results[name]))
+    return results
+
+
+def build(stages=BUILD_STAGES, work_dir=WORK_DIR, scale=SCALE, seed=0,
+          jobs=None):
+    """Time the builds of ``stages`` from synthetic data.
+
+    All stages are built, even if their inputs did not change. Returns the
+    stats of the whole build, ``build``, and of each stage,
+    ``build.<stage>``: its ``time``, the peak RSS of its command in MiB,
+    and the time of each step in its report (see
+    :func:`lingdata.build.build_stage`).
+
+    """
+    prepare(work_dir, scale, seed)
+    command = [sys.executable, '-m', 'lingdata', 'build', *stages,
+               '--force']
+    if jobs:
+        command += ['--jobs', str(jobs)]
+    # download the sources first, so that this is not timed
+    with contextlib.redirect_stdout(sys.stderr):
+        fetch_all([url for name in stages for url in STAGES[name]['urls']],
+                  dst=os.path.join(work_dir, DOWNLOAD_DIR))
+    start = time.perf_counter()
+    subprocess.run(command, check=True, stdout=sys.stderr, cwd=work_dir)
+    results = {'build': {'time': time.perf_counter() - start, 'jobs': jobs}}
+    for name in stages:
+        with open(os.path.join(work_dir, 'data',
+                               f'{name}.report.json'), 'r') as f:
+            report = json.load(f)
+        command_stage = report['stages'][0]
+        results[f'build.{name}'] = {
+            'time': report['wall'],
+            'max_rss': command_stage['command_max_rss'],
+            'steps': {x['stage']: x['wall'] for x in report['stages']},
+        }
+    for name, result in results.items():
+        print(format_result(name, result))
+    return results
+
+
+def format_result(name, result):
+    """One line summary of the stats of a benchmark."""
+    out = f"{name}: {result['time']:.3f} s"
+    if result.get('max_rss') is not None:
+        out += f", max RSS {result['max_rss']:.0f} MiB"
+    if result.get('rss_increase') is not None:
+        out += f" (+{result['rss_increase']:.0f} MiB)"
+    if result.get('rows'):
+        out += (f", {result['rows']} rows "
+                f"({result['rows'] / result['time']:.0f}/s)")
+    return out
+
+
+def git_commit():
+    """Current git commit, with ``-dirty`` if there are local changes."""
+    try:
+        out = subprocess.run(
+            ['git', 'describe', '--always', '--dirty', '--abbrev=12'],
+            check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            cwd=ROOT)
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return out.stdout.decode('utf-8').strip()
+
+
+def read_results(path=RESULTS):
+    """Read the saved results in ``path``, keyed by commit."""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_results(results, params, path=RESULTS, commit=None):
+    """Save ``results`` of the current commit to ``path``.
+
+    ``params`` are the parameters of the synthetic data. Results saved
+    for the commit with the same parameters are updated, otherwise they
+    are replaced.
+
+    """
+    commit = commit or git_commit()
+    saved = read_results(path)
+    entry = saved.get(commit)
+    if entry is None or entry['params'] != params:
+        entry = {'params': params, 'benchmarks': {}}
+    entry.update({
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    })
+    entry['benchmarks'].update(results)
+    saved[commit] = entry
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(saved, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+    print(f"Saved results of {commit} to {path}", file=sys.stderr)
+
+
+def check(base=None, head=None, path=RESULTS, threshold=THRESHOLD):
+    """Compare the saved results of commits ``base`` and ``head``.
+
+    ``head`` defaults to the current commit and ``base`` to the commit
+    saved last before it. Prints the ratio of the times of each benchmark
+    run at both, and returns the names of those whose ratio is above
+    ``threshold`` and which take at least :data:`MIN_TIME`. If ``base`` is
+    not given and no results were saved before ``head``, there is nothing
+    to compare and no regressions are returned.
+
+    """
+    saved = read_results(path)
+    head = head or git_commit()
+    if head not in saved:
+        raise ValueError(f"no results of {head} in {path}")
+    if base is None:
+        older = sorted((x['date'], k) for k, x in saved.items()
+                       if x['date'] < saved[head]['date'])
+        if not older:
+            print(f"no results before {head} in {path} to compare with",
+                  file=sys.stderr)
+            return []
+        base = older[-1][1]
+    if base not in saved:
+        raise ValueError(f"no results of {base} in {path}")
+    if saved[base]['params'] != saved[head]['params']:
+        print(f"warning: {base} and {head} were run with different "
+              f"parameters", file=sys.stderr)
+    print(f"benchmark\t{base} (s)\t{head} (s)\tratio")
+    regressions = []
+    old = saved[base]['benchmarks']
+    new = saved[head]['benchmarks']
+    for name in sorted(old.keys() & new.keys()):
+        ratio = new[name]['time'] / old[name]['time']
+        flag = ''
+        if ratio > threshold and new[name]['time'] >= MIN_TIME:
+            regressions.append(name)
+            flag = '\tREGRESSION'
+        print(f"{name}\t{old[name]['time']:.3f}\t{new[name]['time']:.3f}\t"
+              f"{ratio:.2f}{flag}")
+    return regressions
+
+
+def main():
+    """Command line interface."""
+    parser = argparse.ArgumentParser(prog="python -m lingdata.benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_compare = subparsers.add_parser(
+        "compare", help="Compare implementations of a build step.")
+    parser_compare.add_argument("benchmark", choices=BENCHMARKS,
+                                help="Benchmark to run.")
+    parser_compare.add_argument("path", help="Input file.")
+    parser_compare.add_argument("--repeat", type=int, default=3,
+                                help="Number of runs of each "
+                                "implementation.")
+    parser_compare.add_argument("--child", help=argparse.SUPPRESS)
+
+    def add_synthetic_arguments(parser):
+        parser.add_argument("--scale", type=float, default=SCALE,
+                            help="Scale of the synthetic data.")
+        parser.add_argument("--seed", type=int, default=0,
+                            help="Seed of the synthetic data.")
+        parser.add_argument("--work-dir", default=WORK_DIR,
+                            help="Directory of the synthetic data and "
+                            "builds.")
+        parser.add_argument("--save", action="store_true",
+                            help="Save the results.")
+        parser.add_argument("--results", default=RESULTS,
+                            help="File of the saved results.")
+
+    parser_micro = subparsers.add_parser(
+        "micro", help="Run microbenchmarks on synthetic data.")
+    parser_micro.add_argument("names", nargs="*",
+                              help="Benchmarks to run (default: all): "
+                              + ", ".join(MICRO))
+    parser_micro.add_argument("--repeat", type=int, default=3,
+                              help="Number of runs of each benchmark.")
+    parser_micro.add_argument("--child", action="store_true",
+                              help=argparse.SUPPRESS)
+    add_synthetic_arguments(parser_micro)
+
+    parser_build = subparsers.add_parser(
+        "build", help="Time the builds on synthetic data.")
+    parser_build.add_argument("stages", nargs="*",
+                              help="Databases to build (default: "
+                              + ", ".join(BUILD_STAGES) + ")")
+    parser_build.add_argument("-j", "--jobs", type=int,
+                              help="Maximum number of parallel builds.")
+    add_synthetic_arguments(parser_build)
+
+    parser_check = subparsers.add_parser(
+        "check", help="Compare the saved results of two commits.")
+    parser_check.add_argument("--base", help="Base commit (default: the "
+                              "last saved before head).")
+    parser_check.add_argument("--head", help="Commit to check (default: "
+                              "the current commit).")
+    parser_check.add_argument("--threshold", type=float, default=THRESHOLD,
+                              help="Ratio of times reported as a "
+                              "regression.")
+    parser_check.add_argument("--results", default=RESULTS,
+                              help="File of the saved results.")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        if args.child:
+            print(json.dumps(run_one(args.child, args.path)))
+            return
+        print("implementation\ttime (s)\tmax RSS (MiB)\tRSS increase (MiB)")
+        for func in BENCHMARKS[args.benchmark]:
+            runs = [run_isolated(args.benchmark, func.__name__, args.path)
+                    for _ in range(args.repeat)]
+            print("%s\t%.3f\t%.1f\t%.1f" % (
+                func.__name__, min(x['time'] for x in runs),
+                max(x['max_rss'] for x in runs),
+                max(x['rss_increase'] for x in runs)))
+    elif args.command == "micro" and args.child:
+        print(json.dumps(run_micro(args.names[0], args.repeat)))
+    elif args.command in ("micro", "build"):
+        params = {'scale': args.scale, 'seed': args.seed}
+        if args.command == "micro":
+            unknown = set(args.names) - set(MICRO)
+            if unknown:
+                parser.error("unknown benchmarks: "
+                             + ", ".join(sorted(unknown)))
+            results = micro(args.names or list(MICRO), args.work_dir,
+                            repeat=args.repeat, **params)
+        else:
+            results = build(args.stages or BUILD_STAGES, args.work_dir,
+                            jobs=args.jobs, scale=args.scale,
+                            seed=args.seed)
+        if args.save:
+            save_results(results, params, args.results)
+    elif args.command == "check":
+        try:
+            regressions = check(args.base, args.head, args.results,
+                                args.threshold)
+        except ValueError as exc:
+            parser.error(str(exc))
+        if regressions:
+            print(f"{len(regressions)} regressions: "
+                  + ", ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+"""Build all the databases, skipping those whose inputs did not change.
+
+Each stage builds one database in a separate process, with the same
+commands as the Makefile. A stage is skipped if the fingerprint of its
+inputs (its code, schema, data files and downloaded sources) is the same as
+when its database was last built. Stages run in parallel once the stages
+they depend on are done. Databases are built in a temporary file which
+replaces the old database only when the build succeeds. Finally, the
+spatial index of the coordinates in the databases is updated (see
+:mod:`lingdata.spatial`).
+
+"""
+import concurrent.futures
+import hashlib
+import json
+import os
+import os.path
+import sqlite3
+import subprocess
+import sys
+import time
+
+from . import asjp, ethnologue, glottolog, iso_639_3, spatial
+from .fetch import WALS_URL, fetch_all
+from .finalize import finalize, indexes_path
+from .utils import DOWNLOAD_DIR, StageTimer, sha256sum, url_filename
+
+DATA_DIR = "data"
+"""Directory of the databases."""
+
+FINGERPRINTS = "fingerprints.json"
+"""Name of the file with the fingerprints of the built databases."""
+
+RSCRIPT = os.environ.get("RSCRIPT", "Rscript")
+"""R script interpreter used to build the WALS database."""
+
+STAGES = {
+    'wals': {
+        'code': ['bin/wals.R'],
+        'data': ['data-raw/wals-updates.csv'],
+        'urls': [WALS_URL],
+        'command': [RSCRIPT, 'bin/wals.R'],
+    },
+    'glottolog': {
+        'code': ['lingdata/glottolog.py', 'lingdata/tree.py'],
+        'urls': list(glottolog.URLS.values()),
+        'command': [sys.executable, '-m', 'lingdata.glottolog', '--tree',
+                    os.path.join('{data_dir}', 'glottolog_tree.npz')],
+    },
+    'asjp': {
+        'code': ['lingdata/asjp.py', 'lingdata/asjp_matrix.py',
+                 'lingdata/levenshtein.py'],
+        'data': ['data-raw/ASJP_meanings.json'],
+        'urls': [asjp.URL],
+        'command': [sys.executable, '-m', 'lingdata.asjp'],
+    },
+    'iso_639_3': {
+        'code': ['lingdata/iso_639_3.py'],
+        'urls': [iso_639_3.iso_639_3_url(iso_639_3.CURRENT_DATE)],
+        'command': [sys.executable, '-m', 'lingdata.iso_639_3'],
+    },
+    'ethnologue': {
+        'code': ['lingdata/ethnologue.py'],
+        'urls': [ethnologue.ethnologue_url(ethnologue.CURRENT_DATE)],
+        'command': [sys.executable, '-m', 'lingdata.ethnologue'],
+    },
+    'names': {
+        'code': ['lingdata/names.py'],
+        'urls': [],
+        'command': [sys.executable, '-m', 'lingdata.names'],
+        'deps': ['glottolog', 'iso_639_3', 'ethnologue'],
+    },
+}
+"""Build stages keyed by database name.
+
+Each stage has the ``code`` and ``data`` files it reads, relative to the
+root of the repository, the ``urls`` of its sources, the ``command`` which
+builds the database given as its last argument, and optionally the names
+of the stages it depends on in ``deps``. ``{data_dir}`` in the arguments
+of the command is replaced by the directory of the databases. The schema is always
+``src/<name>.sql`` and the indexes are in ``src/<name>_indexes.sql``.
+
+"""
+
+COMMON_CODE = ['lingdata/utils.py', 'lingdata/finalize.py']
+"""Code files used by all stages."""
+
+
+def db_path(name, data_dir=DATA_DIR):
+    """Path of the database built by stage ``name``."""
+    return os.path.join(data_dir, f'{name}.db')
+
+
+def stage_command(name, data_dir=DATA_DIR):
+    """Command of stage ``name`` building the databases in ``data_dir``."""
+    return [x.replace('{data_dir}', data_dir)
+            for x in STAGES[name]['command']]
+
+
+def schema_path(name):
+    """Path of the schema of the database built by stage ``name``."""
+    return os.path.join('src', f'{name}.sql')
+
+
+def fingerprint(name, dst=DOWNLOAD_DIR):
+    """Fingerprint of the inputs of stage ``name``.
+
+    This is a SHA-256 hash of the command and of the checksums of the code,
+    schema, data files and downloaded sources of the stage. The sources
+    must already be downloaded to ``dst``.
+
+    """
+    stage = STAGES[name]
+    files = sorted(COMMON_CODE + stage['code'] + stage.get('data', []) +
+                   [schema_path(name), indexes_path(name)])
+    files += sorted(os.path.join(dst, url_filename(x)) for x in stage['urls'])
+    h = hashlib.sha256()
+    h.update(json.dumps(stage['command']).encode('utf-8'))
+    for path in files:
+        h.update(f"{path}\t{sha256sum(path)}\n".encode('utf-8'))
+    return h.hexdigest()
+
+
+def read_fingerprints(data_dir=DATA_DIR):
+    """Read the fingerprints of the databases built in ``data_dir``."""
+    try:
+        with open(os.path.join(data_dir, FINGERPRINTS), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def write_fingerprints(fingerprints, data_dir=DATA_DIR):
+    """Write the fingerprints of the databases built in ``data_dir``."""
+    tmp = os.path.join(data_dir, FINGERPRINTS + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(fingerprints, f, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(data_dir, FINGERPRINTS))
+
+
+def build_stage(name, data_dir=DATA_DIR):
+    """Build the database of stage ``name``.
+
+    The database is created from its schema in a temporary file, and
+    finalized with :func:`~lingdata.finalize.finalize` once the stage
+    command succeeds. It then replaces the database. The output of
+    the command is written to ``<data_dir>/<name>.log``, and the time and
+    memory used by the command and each step of finalizing to
+    ``<data_dir>/<name>.report.json``.
+
+    Returns
+    -------
+    float
+        The time taken in seconds.
+
+    """
+    start = time.perf_counter()
+    timer = StageTimer(name)
+    output = db_path(name, data_dir)
+    tmp = output + '.tmp'
+    for path in (tmp, tmp + '-wal', tmp + '-shm', tmp + '-journal'):
+        if os.path.exists(path):
+            os.remove(path)
+    conn = sqlite3.connect(tmp)
+    with open(schema_path(name), 'r') as f:
+        conn.executescript(f.read())
+    conn.close()
+    with open(os.path.join(data_dir, f'{name}.log'), 'w') as log, \
+            timer.stage('command') as record:
+        proc = subprocess.Popen(stage_command(name, data_dir) + [tmp],
+                                stdout=log, stderr=subprocess.STDOUT)
+        # the resource usage of the command alone; that of all children
+        # includes the other stages running at the same time
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        record['command_cpu'] = usage.ru_utime + usage.ru_stime
+        record['command_max_rss'] = usage.ru_maxrss / 2**10
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, proc.args)
+    finalize(tmp, name, timer=timer)
+    # move everything in the write-ahead log into the database file,
+    # so that the database is a single file
+    conn = sqlite3.connect(tmp)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    os.replace(tmp, output)
+    timer.write(os.path.join(data_dir, f'{name}.report.json'))
+    return time.perf_counter() - start
+
+
+def build(stages=None, data_dir=DATA_DIR, jobs=None, force=False,
+          dst=DOWNLOAD_DIR):
+    """Build the databases of ``stages``, by default all of them.
+
+    Parameters
+    ----------
+    stages: list
+        Names of the stages in :data:`STAGES` to build. The stages they
+        depend on are always built if needed.
+    data_dir: str
+        Directory of the databases.
+    jobs: int
+        Maximum number of stages run at the same time. Defaults to the
+        number of stages.
+    force: bool
+        Rebuild the databases even if their inputs did not change.
+    dst: str
+        Download directory.
+
+    Returns
+    -------
+    list
+        Names of the stages that were built.
+
+    """
+    todo = set(stages or STAGES)
+    # add dependencies
+    while True:
+        deps = {x for name in todo for x in STAGES[name].get('deps', [])}
+        if deps <= todo:
+            break
+        todo |= deps
+    os.makedirs(data_dir, exist_ok=True)
+    fetch_all([url for name in todo for url in STAGES[name]['urls']],
+              dst=dst)
+    fingerprints = read_fingerprints(data_dir)
+    new_fingerprints = {}
+    for name in sorted(todo):
+        new_fingerprints[name] = fingerprint(name, dst)
+    pending = set(todo)
+    running = {}
+    built = []
+    with concurrent.futures.ThreadPoolExecutor(jobs or len(STAGES)) as pool:
+        while pending or running:
+            for name in sorted(pending):
+                deps = STAGES[name].get('deps', [])
+                if any(x in pending or x in running.values() for x in deps):
+                    continue
+                pending.remove(name)
+                rebuilt_deps = any(x in built for x in deps)
+                if (not force and not rebuilt_deps
+                        and os.path.exists(db_path(name, data_dir))
+                        and fingerprints.get(name) == new_fingerprints[name]):
+                    print(f"{name}: up to date")
+                    continue
+                print(f"{name}: building")
+                running[pool.submit(build_stage, name, data_dir)] = name
+            if not running:
+                continue
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    elapsed = future.result()
+                except subprocess.CalledProcessError as exc:
+                    log = os.path.join(data_dir, f'{name}.log')
+                    raise RuntimeError(f"{name} failed with exit status "
+                                       f"{exc.returncode}; see {log}")
+                print(f"{name}: built in {elapsed:.1f} s")
+                built.append(name)
+                fingerprints[name] = new_fingerprints[name]
+                write_fingerprints(fingerprints, data_dir)
+    if (any(x in spatial.SOURCES for x in built)
+            or not os.path.exists(spatial.index_path(data_dir))):
+        start = time.perf_counter()
+        n = spatial.write_index(data_dir)
+        print(f"spatial index: {n} languages in "
+              f"{time.perf_counter() - start:.1f} s")
+    return built
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""Map large arrays of language codes to Glottolog languoids.
+
+The ``iso_codes``, ``wals_codes``, ``languoids`` and ``macroareas`` tables
+of ``glottolog.db`` are loaded once into sorted, integer-coded NumPy
+arrays. These are cached as ``.npy`` files next to the database and
+memory-mapped, so loading them again is nearly free. A whole column of
+codes is then resolved with binary searches over the unique codes, instead
+of one SQL query per row.
+
+ISO 639-3 and WALS codes can map to several Glottocodes. How these are
+resolved is chosen with the ``how`` argument of :meth:`Crosswalk.resolve`;
+see :data:`HOW`.
+
+"""
+import argparse
+import json
+import os
+import os.path
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+KINDS = {
+    'glottocode': None,
+    'iso_639_3': "SELECT iso_639_3, glottocode FROM iso_codes",
+    'wals_code': "SELECT wals_code, glottocode FROM wals_codes",
+}
+"""Kinds of codes and the queries of their pairs of code and Glottocode."""
+
+HOW = ('first', 'unique', 'all', 'error')
+"""Ways of resolving codes which map to several Glottocodes.
+
+``first``
+    Use the first Glottocode in alphabetical order.
+``unique``
+    Do not resolve them.
+``all``
+    Return a row for each Glottocode.
+``error``
+    Raise a :py:class:`ValueError`.
+
+"""
+
+COLUMNS = ('glottocode', 'family', 'macroarea', 'latitude', 'longitude')
+"""Columns returned by :meth:`Crosswalk.resolve`."""
+
+ARRAYS = ('glottocode', 'family', 'macroarea', 'latitude', 'longitude',
+          'macroarea_labels', 'iso_639_3_keys', 'iso_639_3_values',
+          'wals_code_keys', 'wals_code_values')
+"""Names of the arrays of a :class:`Crosswalk`."""
+
+
+def cache_dir(db):
+    """Default directory of the cached arrays of database ``db``."""
+    return os.path.splitext(db)[0] + '_crosswalk'
+
+
+def _source(db):
+    """Size and modification time of ``db``, to check if a cache is stale."""
+    stat = os.stat(db)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _fixed_width(values):
+    """Array of UTF-8 encoded ``values`` with a fixed width."""
+    values = [x.encode('utf-8') for x in values]
+    return np.array(values, dtype=f"S{max(map(len, values), default=1)}")
+
+
+def read_arrays(db):
+    """Read the arrays of a :class:`Crosswalk` from Glottolog database ``db``.
+
+    Languoids are sorted by Glottocode, and are referred to by their index
+    in this order. Languoids with several macroareas have a label with all
+    of them joined by ``;``.
+
+    """
+    conn = sqlite3.connect(db)
+    languoids = pd.read_sql_query(
+        "SELECT glottocode, COALESCE(family_id, glottocode) AS family, "
+        "latitude, longitude FROM languoids ORDER BY glottocode", conn)
+    glottocode = _fixed_width(languoids['glottocode'])
+    out = {
+        'glottocode': glottocode,
+        'family': np.searchsorted(
+            glottocode, _fixed_width(languoids['family'])).astype(np.int32),
+        'latitude': languoids['latitude'].to_numpy(dtype=float),
+        'longitude': languoids['longitude'].to_numpy(dtype=float),
+    }
+    macroareas = pd.read_sql_query(
+        "SELECT glottocode, group_concat(macroarea, ';') AS macroarea "
+        "FROM (SELECT * FROM macroareas ORDER BY glottocode, macroarea) "
+        "GROUP BY glottocode", conn)
+    codes, labels = pd.factorize(macroareas['macroarea'], sort=True)
+    macroarea = np.full(len(glottocode), -1, dtype=np.int16)
+    macroarea[np.searchsorted(
+        glottocode, _fixed_width(macroareas['glottocode']))] = codes
+    out['macroarea'] = macroarea
+    out['macroarea_labels'] = _fixed_width(labels)
+    for kind, sql in KINDS.items():
+        if sql is None:
+            continue
+        pairs = sorted(conn.execute(sql).fetchall())
+        out[f'{kind}_keys'] = _fixed_width([x[0] for x in pairs])
+        out[f'{kind}_values'] = np.searchsorted(
+            glottocode, _fixed_width([x[1] for x in pairs])).astype(np.int32)
+    conn.close()
+    return out
+
+
+def write_cache(arrays, path, source):
+    """Write ``arrays`` to directory ``path`` as ``.npy`` files.
+
+    ``source`` describes the database they were read from; it is written
+    last, so that an interrupted write leaves an invalid cache.
+
+    """
+    os.makedirs(path, exist_ok=True)
+    meta = os.path.join(path, 'source.json')
+    if os.path.exists(meta):
+        os.remove(meta)
+    for name in ARRAYS:
+        np.save(os.path.join(path, f'{name}.npy'), arrays[name])
+    with open(meta, 'w') as f:
+        json.dump(source, f)
+
+
+def read_cache(path, source):
+    """Memory-map the arrays in directory ``path``.
+
+    Returns ``None`` if there is no cache or it is not of ``source``.
+
+    """
+    try:
+        with open(os.path.join(path, 'source.json'), 'r') as f:
+            if json.load(f) != source:
+                return None
+    except FileNotFoundError:
+        return None
+    return {
+        name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+        for name in ARRAYS
+    }
+
+
+class Crosswalk:
+    """Vectorized mappings from language codes to Glottolog languoids.
+
+    Parameters
+    ----------
+    arrays: dict
+        Arrays returned by :func:`read_arrays`.
+
+    Use :meth:`load` to create one from ``glottolog.db``.
+
+    """
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self._glottocodes = pd.Index(arrays['glottocode'].astype(str))
+        self._macroareas = pd.Index(arrays['macroarea_labels'].astype(str))
+
+    @classmethod
+    def load(cls, db, path=None, refresh=False):
+        """Load the crosswalk of Glottolog database ``db``.
+
+        The arrays are cached in directory ``path``, by default
+        :func:`cache_dir`, and read again from ``db`` if it changed or if
+        ``refresh`` is true.
+
+        """
+        path = path or cache_dir(db)
+        source = _source(db)
+        arrays = None if refresh else read_cache(path, source)
+        if arrays is None:
+            write_cache(read_arrays(db), path, source)
+            arrays = read_cache(path, source)
+        return cls(arrays)
+
+    def _encode(self, values, dtype):
+        """Encode ``values`` like the keys of ``dtype``.
+
+        Returns the encoded values and a mask of those which can match,
+        i.e. strings no longer than the keys.
+
+        """
+        encoded = [
+            x.encode('utf-8') if isinstance(x, str) else b'' for x in values
+        ]
+        valid = np.array([0 < len(x) <= dtype.itemsize for x in encoded],
+                         dtype=bool)
+        encoded = [x if ok else b'' for x, ok in zip(encoded, valid)]
+        return np.array(encoded, dtype=dtype), valid
+
+    def matches(self, codes, kind='iso_639_3'):
+        """Match unique codes to languoids.
+
+        Returns the start and stop of the matches of each code of ``codes``
+        in the arrays of ``kind``, and the index of the languoid of each
+        key in these arrays.
+
+        """
+        if kind not in KINDS:
+            raise ValueError(f"kind must be one of {tuple(KINDS)}")
+        if kind == 'glottocode':
+            keys = self.arrays['glottocode']
+            values = np.arange(len(keys), dtype=np.int32)
+        else:
+            keys = self.arrays[f'{kind}_keys']
+            values = self.arrays[f'{kind}_values']
+        encoded, valid = self._encode(codes, keys.dtype)
+        start = np.searchsorted(keys, encoded, 'left')
+        stop = np.searchsorted(keys, encoded, 'right')
+        stop[~valid] = start[~valid]
+        return start, stop, values
+
+    def resolve(self, codes, kind='iso_639_3', how='first'):
+        """Resolve ``codes`` to Glottocodes and their languoid data.
+
+        Parameters
+        ----------
+        codes: :py:class:`pandas.Series` or array-like
+            Codes to resolve. Missing values and unknown codes are not
+            resolved.
+        kind: str
+            Kind of the codes; one of the keys of :data:`KINDS`.
+        how: str
+            How to resolve codes with several Glottocodes; one of
+            :data:`HOW`.
+
+        Returns
+        -------
+        :py:class:`pandas.DataFrame`
+            The :data:`COLUMNS` of each code, and ``n_matches``, the number
+            of Glottocodes of the code. Its index is the index of
+            ``codes``, with repeated labels for ``how='all'``. Glottocode,
+            family and macroarea are categoricals; unresolved rows have
+            missing values.
+
+        """
+        if how not in HOW:
+            raise ValueError(f"how must be one of {HOW}")
+        if not isinstance(codes, pd.Series):
+            codes = pd.Series(codes)
+        # only look up each distinct code once
+        rows, uniques = pd.factorize(codes, use_na_sentinel=True)
+        start, stop, values = self.matches(uniques, kind)
+        n_matches = stop - start
+        if how == 'error' and (n_matches > 1).any():
+            ambiguous = np.asarray(uniques)[n_matches > 1]
+            raise ValueError(f"{len(ambiguous)} codes have several "
+                             f"Glottocodes, e.g. {ambiguous[0]}")
+        if how == 'unique':
+            stop = np.where(n_matches > 1, start, stop)
+        if how == 'all':
+            # one row for each match, or one row if there is none
+            counts = np.maximum(n_matches, 1)[rows]
+            counts[rows < 0] = 1
+            index = np.repeat(np.arange(len(rows)), counts)
+            offsets = np.arange(len(index)) - np.repeat(
+                np.cumsum(counts) - counts, counts)
+            row_codes = rows[index]
+            key = np.where(row_codes >= 0, start[row_codes] + offsets, 0)
+            found = (row_codes >= 0) & (offsets < n_matches[row_codes])
+        else:
+            index = np.arange(len(rows))
+            row_codes = rows
+            key = np.where(rows >= 0, start[rows], 0)
+            found = (rows >= 0) & (start < stop)[rows]
+        out = self.languoids(
+            np.where(found, np.asarray(values)[np.minimum(
+                key, max(len(values) - 1, 0))], -1))
+        out['n_matches'] = np.where(row_codes >= 0, n_matches[row_codes], 0)
+        out.index = codes.index[index]
+        return out
+
+    def languoids(self, index):
+        """Data of the languoids with indices ``index``, -1 for none.
+
+        Returns a :py:class:`pandas.DataFrame` with the :data:`COLUMNS`.
+
+        """
+        index = np.asarray(index)
+        missing = index < 0
+        index = np.where(missing, 0, index)
+        family = np.asarray(self.arrays['family'])[index]
+        macroarea = np.asarray(self.arrays['macroarea'])[index]
+        out = {
+            'glottocode': pd.Categorical.from_codes(
+                np.where(missing, -1, index), self._glottocodes),
+            'family': pd.Categorical.from_codes(
+                np.where(missing, -1, family), self._glottocodes),
+            'macroarea': pd.Categorical.from_codes(
+                np.where(missing, -1, macroarea), self._macroareas),
+        }
+        for name in ('latitude', 'longitude'):
+            out[name] = np.where(missing, np.nan,
+                                 np.asarray(self.arrays[name])[index])
+        return pd.DataFrame(out)
+
+
+def main():
+    """Command line interface."""
+    parser = argparse.ArgumentParser(
+        description="Cache the crosswalk arrays of a Glottolog database.")
+    parser.add_argument("db", help="Path to glottolog.db.")
+    parser.add_argument("--cache-dir",
+                        help="Cache directory. Defaults to <db>_crosswalk.")
+    args = parser.parse_args()
+    Crosswalk.load(args.db, args.cache_dir, refresh=True)
+
+
+if __name__ == '__main__':
+    main()
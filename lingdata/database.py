@@ -0,0 +1,259 @@
+"""Read-only access to all the built databases.
+
+:func:`open` attaches every database in a data directory to one SQLite
+connection, so that queries can join them, e.g.
+``glottolog.iso_codes`` with ``iso_639_3.iso_639_3``. Connections are
+opened read-only and kept in a pool, so a :class:`Lingdata` object can be
+shared by threads. The common lookups are methods with an LRU cache.
+
+"""
+import collections
+import contextlib
+import functools
+import os.path
+import queue
+import sqlite3
+import threading
+import urllib.parse
+import urllib.request
+
+DATABASES = ('glottolog', 'wals', 'asjp', 'iso_639_3', 'ethnologue',
+             'names')
+"""Names of the databases attached by :func:`open`."""
+
+POOL_SIZE = 4
+"""Default maximum number of pooled connections."""
+
+CACHE_SIZE = 2**16
+"""Default maximum number of results cached by each lookup."""
+
+CACHED_STATEMENTS = 256
+"""Number of prepared statements kept by each connection."""
+
+CacheStats = collections.namedtuple(
+    'CacheStats', ['hits', 'misses', 'maxsize', 'currsize', 'hit_rate'])
+"""Statistics of the cache of a lookup."""
+
+Distance = collections.namedtuple('Distance', ['shared', 'geo'])
+"""Distance between two languoids in the Glottolog tree and in meters."""
+
+
+def _readonly_uri(path):
+    """SQLite URI which opens ``path`` read-only."""
+    return ('file:' + urllib.request.pathname2url(os.path.abspath(path))
+            + '?' + urllib.parse.urlencode({'mode': 'ro'}))
+
+
+class Lingdata:
+    """Databases in ``data_dir`` on pooled read-only connections.
+
+    Parameters
+    ----------
+    data_dir: str
+        Directory of the databases, ``<data_dir>/<name>.db``. Databases in
+        :data:`DATABASES` which are not there are not attached.
+    pool_size: int
+        Maximum number of connections. Threads wait for a connection if
+        all of them are in use.
+    cache_size: int
+        Maximum number of results cached by each lookup.
+
+    The tables of each database are in the schema of the same name, e.g.
+    ``glottolog.languoids``. Lookups return tuples, so that cached
+    results cannot be modified.
+
+    """
+
+    LOOKUPS = ('iso_to_glottocode', 'glottocode_to_iso', 'wals_to_glottocode',
+               'glottocode_to_wals', 'family_of', 'distance')
+    """Names of the cached lookups."""
+
+    def __init__(self, data_dir, pool_size=POOL_SIZE, cache_size=CACHE_SIZE):
+        self.data_dir = data_dir
+        self.databases = {
+            name: os.path.join(data_dir, f'{name}.db')
+            for name in DATABASES
+            if os.path.exists(os.path.join(data_dir, f'{name}.db'))
+        }
+        if not self.databases:
+            raise FileNotFoundError(f"no databases in {data_dir}")
+        self._pool = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._connections = []
+        self._lock = threading.Lock()
+        self._crosswalk = None
+        self._spatial = None
+        for name in self.LOOKUPS:
+            method = getattr(self, '_' + name)
+            setattr(self, name, functools.lru_cache(cache_size)(method))
+
+    def _connect(self):
+        """Open a connection with all databases attached."""
+        conn = sqlite3.connect(':memory:', uri=True, check_same_thread=False,
+                               cached_statements=CACHED_STATEMENTS)
+        for name, path in self.databases.items():
+            conn.execute("ATTACH DATABASE ? AS " + name,
+                         (_readonly_uri(path), ))
+        conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Borrow a connection from the pool.
+
+        Use as ``with lingdata.connection() as conn: ...``. Connections are
+        opened as needed, up to ``pool_size``.
+
+        """
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+                with self._lock:
+                    self._connections.append(conn)
+            try:
+                yield conn
+            finally:
+                self._pool.put(conn)
+        finally:
+            self._slots.release()
+
+    def query(self, sql, params=()):
+        """Run query ``sql`` with ``params`` and return all the rows."""
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def _column(self, sql, params):
+        """First column of the rows of a query, as a tuple."""
+        return tuple(x[0] for x in self.query(sql, params))
+
+    def _iso_to_glottocode(self, iso_639_3):
+        """Glottocodes of an ISO 639-3 code."""
+        return self._column(
+            "SELECT glottocode FROM glottolog.iso_codes "
+            "WHERE iso_639_3 = ? ORDER BY glottocode", (iso_639_3, ))
+
+    def _glottocode_to_iso(self, glottocode):
+        """ISO 639-3 codes of a Glottocode."""
+        return self._column(
+            "SELECT iso_639_3 FROM glottolog.iso_codes "
+            "WHERE glottocode = ? ORDER BY iso_639_3", (glottocode, ))
+
+    def _wals_to_glottocode(self, wals_code):
+        """Glottocodes of a WALS code."""
+        return self._column(
+            "SELECT glottocode FROM glottolog.wals_codes "
+            "WHERE wals_code = ? ORDER BY glottocode", (wals_code, ))
+
+    def _glottocode_to_wals(self, glottocode):
+        """WALS codes of a Glottocode."""
+        return self._column(
+            "SELECT wals_code FROM glottolog.wals_codes "
+            "WHERE glottocode = ? ORDER BY wals_code", (glottocode, ))
+
+    def _family_of(self, glottocode):
+        """Glottocode of the family of a languoid.
+
+        Top-level families are their own family. Returns ``None`` for
+        unknown Glottocodes.
+
+        """
+        rows = self.query(
+            "SELECT COALESCE(family_id, glottocode) FROM glottolog.languoids "
+            "WHERE glottocode = ?", (glottocode, ))
+        return rows[0][0] if rows else None
+
+    def _distance(self, glottocode_1, glottocode_2):
+        """:data:`Distance` between two languoids.
+
+        Returns ``None`` unless both are languages or dialects of the same
+        family.
+
+        """
+        rows = self.query(
+            "SELECT shared, geo FROM glottolog.distances "
+            "WHERE glottocode_1 = ? AND glottocode_2 = ?",
+            (glottocode_1, glottocode_2))
+        return Distance(*rows[0]) if rows else None
+
+    def crosswalk(self):
+        """:class:`~lingdata.crosswalk.Crosswalk` of the Glottolog database.
+
+        Use it instead of the lookups to resolve many codes at once.
+
+        """
+        # imported here, so that python -m lingdata.crosswalk does not
+        # import it twice
+        from .crosswalk import Crosswalk
+        with self._lock:
+            if self._crosswalk is None:
+                self._crosswalk = Crosswalk.load(self.databases['glottolog'])
+            return self._crosswalk
+
+    def spatial(self):
+        """:class:`~lingdata.spatial.SpatialIndex` of the databases.
+
+        It is loaded from ``<data_dir>/spatial.npz``, or built from the
+        databases if there is none.
+
+        """
+        from .spatial import SpatialIndex, index_path
+        with self._lock:
+            if self._spatial is None:
+                path = index_path(self.data_dir)
+                if os.path.exists(path):
+                    self._spatial = SpatialIndex.load(path)
+                else:
+                    self._spatial = SpatialIndex.from_databases(
+                        self.data_dir)
+            return self._spatial
+
+    def search_names(self, queries, k=10):
+        """Find the ``k`` language names most similar to each of ``queries``.
+
+        See :func:`lingdata.names.search_names`.
+
+        """
+        from .names import search_names
+        with self.connection() as conn:
+            return search_names(conn, queries, k, schema='names')
+
+    def cache_stats(self):
+        """:data:`CacheStats` of each lookup, keyed by name."""
+        out = {}
+        for name in self.LOOKUPS:
+            info = getattr(self, name).cache_info()
+            calls = info.hits + info.misses
+            out[name] = CacheStats(*info,
+                                   info.hits / calls if calls else 0.)
+        return out
+
+    def cache_clear(self):
+        """Clear the caches of all lookups."""
+        for name in self.LOOKUPS:
+            getattr(self, name).cache_clear()
+
+    def close(self):
+        """Close all connections."""
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._pool = queue.LifoQueue()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def open(data_dir='data', **kwargs):
+    """Open the databases in ``data_dir``.
+
+    Returns a :class:`Lingdata`; ``kwargs`` are passed to it.
+
+    """
+    return Lingdata(data_dir, **kwargs)
@@ -1,13 +1,11 @@
 #!/usr/bin/env python3
 """Download Ethnologue code tables and save to a SQLite Database."""
 import argparse
-import io
 import sqlite3
 import zipfile
 
-import pandas as pd
-
-from .utils import download_file, DOWNLOAD_DIR
+from .utils import (DOWNLOAD_DIR, StageTimer, add_timer_arguments,
+                    download_file, insert_tsv, set_sql_opts, unset_sql_opts)
 
 CURRENT_DATE = "20180221"
 """Current version of the Ethnologue code-point data."""
@@ -20,28 +18,43 @@ def ethnologue_url(current_date):
     return url
 
 
-def insert_data(db):
-    """Download data and insert into database ``db``."""
+def insert_data(db, timer=None):
+    """Download data and insert into database ``db``.
+
+    All tables are inserted in one transaction. ``timer`` is a
+    :py:class:`~lingdata.utils.StageTimer` measuring each stage.
+
+    """
+    timer = timer or StageTimer('ethnologue')
     conn = sqlite3.connect(db)
+    set_sql_opts(conn)
     url = ethnologue_url(CURRENT_DATE)
-    z = zipfile.ZipFile(download_file(url, DOWNLOAD_DIR))
+    with timer.stage('download'):
+        z = zipfile.ZipFile(download_file(url, DOWNLOAD_DIR))
     tables = ("CountryCodes", "LanguageCodes", "LanguageIndex")
     for tbl in tables:
-        with io.TextIOWrapper(z.open(f'{tbl}.tab', 'r')) as f:
-            # important to adjust NA values otherwise Namibia is problematic
-            dat = pd.read_csv(f, delimiter='\t', na_values="",
-                              keep_default_na=False)
-            if tbl == "LanguageIndex":
-                dat = dat.dropna(axis = 0, how = 'all', subset = ('Name',))
-            dat.to_sql(tbl, conn, if_exists='append', index=False)
+        with timer.stage(f'insert {tbl}') as record, \
+                z.open(f'{tbl}.tab', 'r') as f:
+            # only empty values are missing, otherwise Namibia is
+            # problematic
+            record['rows'] = insert_tsv(
+                conn, tbl, f,
+                skip_missing=('Name', ) if tbl == "LanguageIndex" else ())
+    conn.commit()
+    unset_sql_opts(conn)
+    conn.close()
 
 
 def main():
     """Command line interface."""
     parser = argparse.ArgumentParser()
     parser.add_argument("db", help="Path to SQLite database.")
+    add_timer_arguments(parser)
     args = parser.parse_args()
-    insert_data(args.db)
+    timer = StageTimer('ethnologue', profile_dir=args.profile)
+    insert_data(args.db, timer=timer)
+    if args.report:
+        timer.write(args.report)
 
 
 if __name__ == '__main__':
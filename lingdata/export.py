@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""Export the databases to Parquet or Arrow IPC files.
+
+Each table of a database is written to a directory
+``<out_dir>/<db>/<table>`` of Parquet or uncompressed Arrow IPC files.
+String columns, such as Glottocodes and ISO codes, are dictionary encoded.
+The largest tables are partitioned by language family, in ``family=<name>``
+subdirectories, so that one family can be read without the others. Arrow
+IPC files are memory-mapped by :func:`load_table`, so reading them does not
+copy their data. Tables are read and written in batches of
+:data:`CHUNKSIZE` rows, so they do not need to fit in memory.
+
+"""
+import argparse
+import os.path
+import re
+import shutil
+import sqlite3
+import urllib.parse
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs
+import pyarrow.parquet as pq
+
+FORMATS = ('parquet', 'arrow')
+"""Export formats."""
+
+CHUNKSIZE = 100000
+"""Number of rows read from SQLite at a time."""
+
+EXCLUDE = {
+    'asjp': ('distances_progress', 'wordlist_hashes'),
+}
+"""Tables which are only used while building each database."""
+
+PARTITIONS = {
+    'glottolog': {
+        'distances':
+        ("SELECT distances.*, "
+         "COALESCE(family_id, glottocode) AS family FROM distances "
+         "JOIN languoids ON glottocode_1 = glottocode"),
+        'paths':
+        ("SELECT paths.*, COALESCE(family_id, languoids.glottocode) "
+         "AS family FROM paths JOIN languoids USING (glottocode)"),
+    },
+    'asjp': {
+        'distances':
+        ("SELECT distances.*, wls_fam AS family FROM distances "
+         "JOIN languages ON language_1 = language"),
+    },
+    'wals': {
+        'language_features':
+        ("SELECT language_features.*, family FROM language_features "
+         "JOIN languages USING (wals_code)"),
+    },
+}
+"""Queries adding a ``family`` column to the tables partitioned by family.
+"""
+
+
+def arrow_type(decltype):
+    """Arrow type of a column with SQLite declared type ``decltype``.
+
+    Uses the same rules as SQLite column affinity.
+
+    """
+    decltype = (decltype or '').upper()
+    if 'INT' in decltype:
+        return pa.int64()
+    if re.search('CHAR|CLOB|TEXT', decltype):
+        return pa.string()
+    if re.search('REAL|FLOA|DOUB|NUMERIC', decltype):
+        return pa.float64()
+    if 'BOOL' in decltype:
+        return pa.bool_()
+    return pa.string()
+
+
+def column_types(conn, table, names):
+    """Arrow types of the columns ``names`` read from ``table``.
+
+    Columns have the type of their declared type (see :func:`arrow_type`),
+    unless some of their values do not fit it, such as text in a numeric
+    column, in which case they are strings. Columns which are not in the
+    table, such as ``family``, are strings.
+
+    """
+    declared = {
+        x[1]: arrow_type(x[2])
+        for x in conn.execute(f"PRAGMA table_info({table})")
+    }
+    types = [declared.get(x, pa.string()) for x in names]
+    # whether each non-string column has other values, in one scan
+    checks = {}
+    for name, type_ in zip(names, types):
+        if pa.types.is_floating(type_):
+            checks[name] = ('integer', 'real', 'null')
+        elif not pa.types.is_string(type_):
+            checks[name] = ('integer', 'null')
+    if checks:
+        other = conn.execute(
+            "SELECT " + ", ".join(f'max(typeof("{x}") NOT IN {y})'
+                                  for x, y in checks.items())
+            + f" FROM {table}").fetchone()
+        for name, x in zip(checks, other):
+            if x:
+                types[names.index(name)] = pa.string()
+    return types
+
+
+def to_arrow(values, type_):
+    """Convert a list of values from SQLite to an Arrow array.
+
+    Values of string columns are converted to strings.
+
+    """
+    if pa.types.is_boolean(type_):
+        return pa.array(values, type=pa.int64()).cast(type_)
+    try:
+        return pa.array(values, type=type_)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        if not pa.types.is_string(type_):
+            raise
+        return pa.array([None if x is None else str(x) for x in values],
+                        type=type_)
+
+
+def read_batches(conn, table, sql=None):
+    """Read ``table`` from SQLite as Arrow record batches.
+
+    Parameters
+    ----------
+    conn: :py:class:`sqlite3.Connection`
+        Database connection.
+    table: str
+        Name of the table.
+    sql: str
+        Query adding a ``family`` column to the table, from
+        :data:`PARTITIONS`. The rows are then sorted by family, by SQLite,
+        which uses an index if there is one.
+
+    Returns
+    -------
+    (schema, batches): tuple
+        The :py:class:`pyarrow.Schema` of the table, and an iterator of
+        :py:class:`pyarrow.RecordBatch` of at most :data:`CHUNKSIZE` rows,
+        so that only one batch is in memory at a time.
+
+    """
+    if sql:
+        c = conn.execute(f"SELECT * FROM ({sql}) ORDER BY family")
+    else:
+        c = conn.execute(f"SELECT * FROM {table}")
+    names = [x[0] for x in c.description]
+    schema = pa.schema(list(zip(names, column_types(conn, table, names))))
+
+    def batches():
+        while True:
+            rows = c.fetchmany(CHUNKSIZE)
+            if not rows:
+                break
+            yield pa.RecordBatch.from_arrays(
+                [to_arrow(list(x), field.type)
+                 for x, field in zip(zip(*rows), schema)],
+                schema=schema)
+
+    return schema, batches()
+
+
+class DictionaryEncoder:
+    """Dictionary encode the string columns of record batches.
+
+    The dictionary of each column grows with the batches, and each batch
+    refers to all of it, so that the batches can be written to one Arrow
+    IPC file with dictionary deltas.
+
+    """
+
+    def __init__(self, schema):
+        self.dictionaries = {
+            x.name: pa.array([], type=pa.string())
+            for x in schema if pa.types.is_string(x.type)
+        }
+        self.schema = pa.schema([
+            (x.name, pa.dictionary(pa.int32(), pa.string()))
+            if x.name in self.dictionaries else x for x in schema
+        ])
+
+    def encode(self, batch):
+        """Dictionary encode record batch ``batch``."""
+        columns = []
+        for field, column in zip(batch.schema, batch.columns):
+            dictionary = self.dictionaries.get(field.name)
+            if dictionary is not None:
+                values = pc.unique(column).drop_null()
+                new = values.filter(pc.invert(pc.is_in(values, dictionary)))
+                if len(new):
+                    dictionary = pa.concat_arrays([dictionary, new])
+                    self.dictionaries[field.name] = dictionary
+                column = pa.DictionaryArray.from_arrays(
+                    pc.index_in(column, value_set=dictionary).cast(pa.int32()),
+                    dictionary)
+            columns.append(column)
+        return pa.RecordBatch.from_arrays(columns, schema=self.schema)
+
+
+def open_writer(path, schema, fmt='parquet'):
+    """Open a writer of record batches with ``schema`` to file ``path``.
+
+    Parquet files are compressed, Arrow IPC files are not, so that they can
+    be memory-mapped.
+
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if fmt == 'parquet':
+        return pq.ParquetWriter(path, schema, compression='zstd')
+    return pa.ipc.new_file(
+        path, schema,
+        options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+
+
+def write_partitions(schema, batches, path, fmt='parquet'):
+    """Write record batches to directory ``path``.
+
+    String columns are dictionary encoded. If the batches have a ``family``
+    column, the rows of each family, which must be consecutive, are written
+    to a separate ``family=<family>`` subdirectory, without the column.
+    The batches are written as they are read.
+
+    Returns the number of rows written.
+
+    """
+    filename = 'part-0.' + ('parquet' if fmt == 'parquet' else 'arrow')
+    partitioned = 'family' in schema.names
+    if partitioned:
+        schema = schema.remove(schema.get_field_index('family'))
+    os.makedirs(path, exist_ok=True)
+    writer = None
+    family = None
+    rows = 0
+    try:
+        for batch in batches:
+            rows += batch.num_rows
+            if not partitioned:
+                parts = [(None, batch)]
+            else:
+                families = batch['family'].to_numpy(zero_copy_only=False)
+                batch = batch.drop_columns(['family'])
+                starts = np.flatnonzero(
+                    np.r_[True, families[1:] != families[:-1]])
+                stops = np.r_[starts[1:], len(families)]
+                parts = [(families[a], batch.slice(a, b - a))
+                         for a, b in zip(starts.tolist(), stops.tolist())]
+            for key, part in parts:
+                if writer is None or key != family:
+                    if writer is not None:
+                        writer.close()
+                    family = key
+                    subdir = path
+                    if partitioned:
+                        subdir = os.path.join(
+                            path, 'family=' + urllib.parse.quote(str(key), ''))
+                    encoder = DictionaryEncoder(schema)
+                    writer = open_writer(os.path.join(subdir, filename),
+                                         encoder.schema, fmt)
+                writer.write_batch(encoder.encode(part))
+        if writer is None and not partitioned:
+            # an empty table
+            writer = open_writer(os.path.join(path, filename),
+                                 DictionaryEncoder(schema).schema, fmt)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def export_db(db, out_dir, name=None, fmt='parquet'):
+    """Export all tables of database ``db``.
+
+    Parameters
+    ----------
+    db: str
+        Path to the SQLite database.
+    out_dir: str
+        Output directory. The tables are written to
+        ``<out_dir>/<name>/<table>``, replacing any existing files.
+    name: str
+        Name of the database. Defaults to the file name of ``db`` without
+        extension.
+    fmt: str
+        One of :data:`FORMATS`.
+
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"fmt must be one of {FORMATS}")
+    name = name or os.path.basename(db).split('.')[0]
+    conn = sqlite3.connect(db)
+    tables = [
+        x[0] for x in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND name NOT LIKE 'sqlite_%' ORDER BY name")
+        if x[0] not in EXCLUDE.get(name, ())
+    ]
+    for table in tables:
+        sql = PARTITIONS.get(name, {}).get(table)
+        schema, batches = read_batches(conn, table, sql)
+        path = os.path.join(out_dir, name, table)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        rows = write_partitions(schema, batches, path, fmt)
+        print(f"{name}.{table}: {rows} rows")
+    conn.close()
+
+
+def open_dataset(path, fmt='parquet'):
+    """Open an exported table as a :py:class:`pyarrow.dataset.Dataset`.
+
+    Files are memory-mapped.
+
+    """
+    return ds.dataset(path, format='ipc' if fmt == 'arrow' else fmt,
+                      partitioning='hive',
+                      filesystem=pyarrow.fs.LocalFileSystem(use_mmap=True))
+
+
+def load_table(path, fmt='parquet', columns=None, families=None):
+    """Load an exported table into a :py:class:`pandas.DataFrame`.
+
+    Parameters
+    ----------
+    path: str
+        Directory of the table, ``<out_dir>/<db>/<table>``.
+    fmt: str
+        One of :data:`FORMATS`.
+    columns: list
+        Columns to read. Defaults to all columns.
+    families: list
+        For tables partitioned by family, only read these families.
+
+    Dictionary encoded columns become categoricals. Numeric columns of
+    Arrow IPC files without missing values are not copied; the data frame
+    refers to the memory-mapped files.
+
+    """
+    dataset = open_dataset(path, fmt)
+    filter_ = None
+    if families is not None:
+        filter_ = ds.field('family').isin(list(families))
+    data = dataset.to_table(columns=columns, filter=filter_)
+    return data.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def main():
+    """Command line interface."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("out_dir", help="Output directory.")
+    parser.add_argument("db", nargs="+", help="Paths to SQLite databases.")
+    parser.add_argument("--format", choices=FORMATS, default='parquet',
+                        help="Output format.")
+    args = parser.parse_args()
+    for db in args.db:
+        export_db(db, args.out_dir, fmt=args.format)
+
+
+if __name__ == '__main__':
+    main()
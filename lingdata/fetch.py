@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Download the source data of all databases concurrently."""
+import argparse
+import concurrent.futures
+import os.path
+import threading
+import time
+import urllib.parse
+
+from . import asjp, ethnologue, glottolog, iso_639_3
+from .utils import DOWNLOAD_DIR, download_file, mirror_url, url_filename
+
+WALS_URL = ("https://cdstar.shh.mpg.de/bitstreams/EAEA0-28CA-1D0B-37B8-0/"
+            "wals_language.csv.zip")
+"""URL of the WALS data. Must be the same as ``URL`` in ``bin/wals.R``."""
+
+WORKERS = 8
+"""Default number of concurrent downloads."""
+
+HOST_CONNECTIONS = 6
+"""Default maximum number of concurrent downloads from the same host.
+
+Five of the sources are on cdstar.shh.mpg.de, so they are all downloaded
+at once, and the total time is close to that of the largest download.
+The limit only keeps a host from being sent many more requests than
+that. A mirror serves all the sources, which then take two rounds unless
+the limit is raised to :data:`WORKERS`.
+
+"""
+
+
+def source_urls():
+    """URLs of the source data of all databases."""
+    return [
+        asjp.URL,
+        *glottolog.URLS.values(),
+        iso_639_3.iso_639_3_url(iso_639_3.CURRENT_DATE),
+        ethnologue.ethnologue_url(ethnologue.CURRENT_DATE),
+        WALS_URL,
+    ]
+
+
+def fetch_all(urls, dst=DOWNLOAD_DIR, workers=WORKERS,
+              host_connections=HOST_CONNECTIONS, **kwargs):
+    """Download ``urls`` to directory ``dst`` concurrently.
+
+    Parameters
+    ----------
+    urls: list
+        URLs to download.
+    dst: str
+        Download directory.
+    workers: int
+        Maximum number of concurrent downloads.
+    host_connections: int
+        Maximum number of concurrent downloads from the same host.
+    kwargs:
+        Passed to :func:`~lingdata.utils.download_file`.
+
+    Returns
+    -------
+    dict
+        Paths of the downloaded files keyed by URL.
+
+    Files which are already downloaded are not downloaded again; see
+    :func:`~lingdata.utils.download_file`. The progress is printed as each
+    download finishes. If any download fails, the others are completed
+    before raising a :py:class:`RuntimeError`.
+
+    """
+    def host(url):
+        """Host that ``url`` is downloaded from."""
+        return urllib.parse.urlsplit(mirror_url(url)).netloc
+
+    limits = {
+        x: threading.BoundedSemaphore(host_connections)
+        for x in set(map(host, urls))
+    }
+
+    def fetch(url):
+        with limits[host(url)]:
+            start = time.perf_counter()
+            path = download_file(url, dst, **kwargs)
+            return path, time.perf_counter() - start
+
+    paths = {}
+    errors = []
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        futures = {pool.submit(fetch, url): url for url in urls}
+        for i, future in enumerate(
+                concurrent.futures.as_completed(futures), start=1):
+            url = futures[future]
+            try:
+                path, elapsed = future.result()
+            except Exception as exc:
+                errors.append(url)
+                print(f"[{i}/{len(urls)}] {url_filename(url)}: "
+                      f"failed: {exc}")
+                continue
+            paths[url] = path
+            size = os.path.getsize(path) / 2**20
+            print(f"[{i}/{len(urls)}] {path} ({size:.1f} MiB, "
+                  f"{elapsed:.1f} s)")
+    if errors:
+        raise RuntimeError("failed to download " + ", ".join(errors))
+    return paths
+
+
+def main():
+    """Command line interface."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dst", default=DOWNLOAD_DIR,
+                        help="Download directory.")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="Maximum number of concurrent downloads.")
+    parser.add_argument("--host-connections", type=int,
+                        default=HOST_CONNECTIONS,
+                        help="Maximum concurrent downloads per host.")
+    parser.add_argument("--revalidate", action="store_true",
+                        help="Download files again if they changed.")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    fetch_all(source_urls(), dst=args.dst, workers=args.workers,
+              host_connections=args.host_connections,
+              revalidate=args.revalidate or None)
+    print(f"Fetched all sources in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
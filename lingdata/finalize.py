@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""Optimize a loaded database for queries.
+
+Secondary indexes slow down bulk inserts, so they are not in the schemas
+in ``src/<name>.sql`` but in ``src/<name>_indexes.sql``, and are created
+by :func:`finalize` once the data is loaded. It also runs ``ANALYZE`` for
+the query planner and ``VACUUM`` with a larger page size, and can rebuild
+the largest tables as ``WITHOUT ROWID`` tables clustered on their primary
+key. These are smaller and faster to look up by primary key, but lookups
+through secondary indexes are slower, so they are not the default.
+
+"""
+import argparse
+import os.path
+import random
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from .utils import StageTimer, add_timer_arguments
+
+PAGE_SIZE = 8192
+"""Page size of finalized databases."""
+
+CACHE_SIZE = 2**18
+"""Size of the page cache in KiB used when creating indexes."""
+
+WITHOUT_ROWID = {
+    'glottolog': ('paths', 'distances'),
+    'asjp': ('distances', ),
+    'wals': ('language_features', 'distances'),
+}
+"""Tables that can be rebuilt as ``WITHOUT ROWID`` tables in each database.
+"""
+
+QUERIES = {
+    'glottolog': {
+        'wals_code to glottocode':
+        ("SELECT glottocode FROM wals_codes WHERE wals_code = ?",
+         "SELECT wals_code FROM wals_codes"),
+        'iso_639_3 to glottocode':
+        ("SELECT glottocode FROM iso_codes WHERE iso_639_3 = ?",
+         "SELECT iso_639_3 FROM iso_codes"),
+        'descendants':
+        ("SELECT glottocode, dist FROM paths "
+         "WHERE glottocode_to = ? AND dist > 0",
+         "SELECT glottocode FROM languoids"),
+        'distance between languages':
+        ("SELECT shared, geo FROM distances "
+         "WHERE glottocode_1 = ? AND glottocode_2 = ?",
+         "SELECT glottocode_1, glottocode_2 FROM distances"),
+        'distances to a language':
+        ("SELECT glottocode_1, shared, geo FROM distances "
+         "WHERE glottocode_2 = ?",
+         "SELECT DISTINCT glottocode_2 FROM distances"),
+    },
+    'asjp': {
+        'iso to language':
+        ("SELECT language FROM languages WHERE iso = ?",
+         "SELECT iso FROM languages WHERE iso IS NOT NULL"),
+        'distance between languages':
+        ("SELECT ldn, ldnd FROM distances "
+         "WHERE language_1 = ? AND language_2 = ?",
+         "SELECT language_1, language_2 FROM distances"),
+        'distances to a language':
+        ("SELECT language_1, ldnd FROM distances WHERE language_2 = ?",
+         "SELECT DISTINCT language_2 FROM distances"),
+    },
+    'wals': {
+        'iso_code to wals_code':
+        ("SELECT wals_code FROM languages WHERE iso_code = ?",
+         "SELECT iso_code FROM languages WHERE iso_code IS NOT NULL"),
+        'languages with a feature value':
+        ("SELECT wals_code FROM language_features "
+         "WHERE feature_id = ? AND value = ?",
+         "SELECT feature_id, value FROM language_features"),
+        'distances to a language':
+        ("SELECT wals_code_1, variable, value FROM distances "
+         "WHERE wals_code_2 = ?",
+         "SELECT DISTINCT wals_code_2 FROM distances"),
+    },
+}
+"""Common queries of each database used by :func:`benchmark`.
+
+Each query has the SQL of the query and of its possible parameters.
+
+"""
+
+
+def indexes_path(name):
+    """Path of the secondary indexes of database ``name``."""
+    return os.path.join('src', f'{name}_indexes.sql')
+
+
+def primary_key(conn, table):
+    """Columns of the primary key of ``table``, in order."""
+    columns = conn.execute(f"PRAGMA table_info({table})").fetchall()
+    return [x[1] for x in sorted(columns, key=lambda x: x[5]) if x[5]]
+
+
+def without_rowid(conn, table):
+    """Rebuild ``table`` as a ``WITHOUT ROWID`` table.
+
+    The rows are inserted in the order of the primary key, so the new
+    table is built sequentially. Indexes on the table are dropped. Returns
+    ``False`` if the table already is a ``WITHOUT ROWID`` table.
+
+    """
+    sql = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (table, )).fetchone()[0]
+    if re.search(r"WITHOUT\s+ROWID\s*$", sql, re.I):
+        return False
+    pk = primary_key(conn, table)
+    if not pk:
+        raise ValueError(f"{table} has no primary key")
+    new = f"{table}_without_rowid"
+    create = re.sub(r'^CREATE\s+TABLE\s+("?)' + table + r'\1', "CREATE TABLE "
+                    + new, sql, count=1, flags=re.I)
+    conn.execute(f"{create} WITHOUT ROWID")
+    conn.execute(f"INSERT INTO {new} SELECT * FROM {table} "
+                 f"ORDER BY {', '.join(pk)}")
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {new} RENAME TO {table}")
+    return True
+
+
+def finalize(db, name, tables=(), page_size=PAGE_SIZE, vacuum=True,
+             timer=None):
+    """Optimize database ``db`` for queries once its data is loaded.
+
+    Parameters
+    ----------
+    db: str
+        Path to the SQLite database.
+    name: str
+        Name of the database, e.g. ``'glottolog'``.
+    tables: list
+        Tables to rebuild as ``WITHOUT ROWID`` tables, e.g. those in
+        :data:`WITHOUT_ROWID`.
+    page_size: int
+        Page size of the database. Only changed if ``vacuum`` is true.
+    vacuum: bool
+        Run ``VACUUM``.
+    timer: :py:class:`~lingdata.utils.StageTimer`
+        Measures each step.
+
+    The indexes in ``src/<name>_indexes.sql`` are created and ``ANALYZE``
+    is run. The journal mode of the database is kept.
+
+    """
+    timer = timer or StageTimer(name)
+    conn = sqlite3.connect(db, isolation_level=None)
+    journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    # the page size cannot be changed in WAL mode
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE}")
+    if tables:
+        with timer.stage('without rowid'):
+            conn.execute("BEGIN")
+            for table in tables:
+                without_rowid(conn, table)
+            conn.execute("COMMIT")
+    if os.path.exists(indexes_path(name)):
+        with timer.stage('indexes'), open(indexes_path(name), 'r') as f:
+            conn.executescript(f.read())
+    with timer.stage('analyze'):
+        conn.execute("ANALYZE")
+    if vacuum:
+        with timer.stage('vacuum'):
+            conn.execute(f"PRAGMA page_size={page_size}")
+            conn.execute("VACUUM")
+    conn.execute(f"PRAGMA journal_mode={journal_mode}")
+    conn.close()
+
+
+def time_queries(db, queries, n=100, seed=0):
+    """Mean time in seconds of each query in ``queries`` on ``db``.
+
+    Each query is run with ``n`` random parameters.
+
+    """
+    conn = sqlite3.connect(db)
+    rng = random.Random(seed)
+    out = {}
+    for label, (sql, params_sql) in queries.items():
+        params = conn.execute(params_sql).fetchall()
+        params = [rng.choice(params) for _ in range(n)] if params else []
+        start = time.perf_counter()
+        for x in params:
+            conn.execute(sql, x).fetchall()
+        out[label] = (time.perf_counter() - start) / max(len(params), 1)
+    conn.close()
+    return out
+
+
+def benchmark(db, name, n=100, **kwargs):
+    """Compare the speed of common queries before and after finalizing.
+
+    The queries in :data:`QUERIES` are run on a copy of ``db``, which is
+    then finalized with :func:`finalize` and ``kwargs``, and the queries
+    run again. Prints the mean time of each query in microseconds and the
+    size of the database.
+
+    """
+    queries = QUERIES.get(name, {})
+    with tempfile.TemporaryDirectory() as tmpdir:
+        copy = os.path.join(tmpdir, os.path.basename(db))
+        shutil.copyfile(db, copy)
+        before = time_queries(copy, queries, n)
+        size_before = os.path.getsize(copy)
+        start = time.perf_counter()
+        finalize(copy, name, **kwargs)
+        elapsed = time.perf_counter() - start
+        after = time_queries(copy, queries, n)
+        size_after = os.path.getsize(copy)
+    print(f"finalized in {elapsed:.1f} s")
+    print("query\tbefore (us)\tafter (us)")
+    for label in queries:
+        print("%s\t%.1f\t%.1f" % (label, before[label] * 1e6,
+                                  after[label] * 1e6))
+    print("size (MiB)\t%.1f\t%.1f" % (size_before / 2**20,
+                                       size_after / 2**20))
+
+
+def main():
+    """Command line interface."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("db", help="Path to SQLite database.")
+    parser.add_argument("--name",
+                        help="Name of the database. Defaults to the file "
+                        "name of db without extension.")
+    parser.add_argument("--without-rowid", action="store_true",
+                        help="Rebuild the largest tables as WITHOUT ROWID.")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE,
+                        help="Page size of the database.")
+    parser.add_argument("--no-vacuum", action="store_true",
+                        help="Do not run VACUUM.")
+    parser.add_argument("--benchmark", action="store_true",
+                        help=("Only benchmark common queries on a copy of "
+                              "db before and after finalizing it."))
+    add_timer_arguments(parser)
+    args = parser.parse_args()
+    name = args.name or os.path.basename(args.db).split('.')[0]
+    kwargs = {
+        'tables': WITHOUT_ROWID.get(name, ()) if args.without_rowid else (),
+        'page_size': args.page_size,
+        'vacuum': not args.no_vacuum,
+    }
+    if args.benchmark:
+        benchmark(args.db, name, **kwargs)
+    else:
+        timer = StageTimer(name, profile_dir=args.profile)
+        finalize(args.db, name, timer=timer, **kwargs)
+        if args.report:
+            timer.write(args.report)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,20 +2,21 @@
 # coding: utf-8
 """Download Glottolog data, process it, and save it to a SQLite database."""
 import argparse
-import functools
+import collections
 import io
 import itertools
+import json
 import re
 import sqlite3
 import zipfile
 
 import numpy as np
 import pandas as pd
-import requests
-import newick
-from geopy.distance import great_circle
+from geopy.distance import EARTH_RADIUS
 
-from .utils import set_sql_opts, unset_sql_opts, download_file, DOWNLOAD_DIR
+from .tree import ArrayTree, read_newick
+from .utils import (DOWNLOAD_DIR, StageTimer, add_timer_arguments,
+                    download_file, set_sql_opts, unset_sql_opts)
 
 URLS = {
     "lang_geo":
@@ -31,6 +32,9 @@ URLS = {
      "tree_glottolog_newick.txt")
 }
 
+BLOCKSIZE = 256
+"""Number of languages compared with the rest of their family at a time."""
+
 
 def geomean(long, lat, w=None):
     """Mean location for spherical coordinates.
@@ -98,13 +102,15 @@ def get_languoids():
 
 def get_lang_geo():
     """Download geographic information for Glottolog languoids."""
-    out = pd.read_csv(URLS['lang_geo'], index_col="glottocode")
+    out = pd.read_csv(download_file(URLS['lang_geo'], DOWNLOAD_DIR),
+                      index_col="glottocode")
     return out.loc[:, ('macroarea', )]
 
 
 def get_resourcemap():
     """Download the Glottolog reourcemap data."""
-    return requests.get(URLS['resourcemap']).json()
+    with open(download_file(URLS['resourcemap'], DOWNLOAD_DIR), 'r') as f:
+        return json.load(f)
 
 
 def is_wals_lang_id(x):
@@ -118,129 +124,152 @@ def is_iso_lang_id(x):
 
 
 def glottolog_tree():
-    """Download and parse the Glottolog language tree."""
-    def parse_node(x):
-        """Parse each node in the Newick tree."""
-        node_pattern = """^'?
-            (?P<name> .* ) [ ]
-            \[ (?P<glottocode> [a-z0-9]{8} ) \]
-            (?: \[ (?P<iso_639_3> [a-z]{3} ) \] ) ?
-            (?P<language> -l- ) ?
-        '?$"""
-        m = re.match(node_pattern, x, re.X)
-        if m is not None:
-            out = m.groupdict()
-            out['language'] = out['language'] is not None
-            return out
-
-    def walk_tree(x):
-        """Walk the language tree."""
-        node = parse_node(x.name)
-        node['children'] = [walk_tree(n) for n in x.descendants]
-        return node
-
-    url = URLS['glottolog-newick']
-    r = requests.get(url)
-    tree = newick.loads(r.text)
-    return [walk_tree(branch) for branch in tree]
-
-
-def walk_tree(x, depth=1, ancestors=[], family=None, newdata={}):
-    """Depth first traversal of the the Glottolog tree.
-
-    While traversing the tree this fills in lists of ancestors and descendants.
+    """Download and parse the Glottolog language tree.
+
+    Returns
+    -------
+    dict
+        Arrays of node data, see :func:`lingdata.tree.read_newick`.
+
+    """
+    return read_newick(download_file(URLS['glottolog-newick'], DOWNLOAD_DIR))
+
+
+SET_ATTRIBUTES = ('wals_codes', 'iso_639_3', 'macroarea', 'country_ids')
+"""Languoid attributes which are sets of codes."""
+
+
+def pack_sets(sets):
+    """Encode a list of sets as the rows of a packed bit matrix.
+
+    Returns
+    -------
+    (bits, values): tuple
+        ``bits`` is a ``len(sets) x ceil(len(values) / 8)`` array of
+        :py:data:`numpy.uint8`. Bit ``j`` of row ``i``, in
+        :py:func:`numpy.packbits` order, is set if ``values[j]`` is in
+        ``sets[i]``.
+
+    """
+    values = sorted(set().union(*sets))
+    index = {x: i for i, x in enumerate(values)}
+    rows = np.array([i for i, x in enumerate(sets) for _ in x], dtype=np.intp)
+    cols = np.array([index[v] for x in sets for v in x], dtype=np.intp)
+    bits = np.zeros((len(sets), (len(values) + 7) // 8), dtype=np.uint8)
+    np.bitwise_or.at(bits, (rows, cols >> 3),
+                     (0x80 >> (cols & 7)).astype(np.uint8))
+    return bits, values
+
+
+def unpack_sets(bits, values):
+    """Decode the rows of a bit matrix created by :func:`pack_sets`."""
+    rows, cols = np.nonzero(bits)
+    unpacked = np.unpackbits(bits[rows, cols][:, np.newaxis], axis=1)
+    k, bit = np.nonzero(unpacked)
+    out = [set() for _ in range(len(bits))]
+    for i, j in zip(rows[k].tolist(), (cols[k] * 8 + bit).tolist()):
+        out[i].add(values[j])
+    return out
+
+
+def geomean_groups(long, lat, groups, n):
+    """Mean locations of groups of spherical coordinates.
+
+    Same as :func:`geomean` without weights, for the coordinates with each
+    value of ``groups``, from 0 to ``n - 1``, at once. Groups without any
+    coordinates have a mean of NaN.
+
+    """
+    long = np.radians(long + 180)
+    lat = np.radians(lat)
+
+    def mean_angle(x):
+        return np.arctan2(np.bincount(groups, np.sin(x), minlength=n),
+                          np.bincount(groups, np.cos(x), minlength=n))
+
+    long = mean_angle(long) % (2 * np.pi) - np.pi
+    lat = mean_angle(lat)
+    empty = np.bincount(groups, minlength=n) == 0
+    long[empty] = lat[empty] = np.nan
+    return np.degrees(long), np.degrees(lat)
+
+
+def fill_tree(tree, newdata):
+    """Fill in the languoid data of the nodes of the language tree.
+
+    Parameters
+    ----------
+    tree: :py:class:`~lingdata.tree.ArrayTree`
+        Glottolog language tree.
+    newdata: dict
+        Languoid data keyed by Glottocode, updated in place.
+
+    The sets in :data:`SET_ATTRIBUTES` are filled bottom-up with the union
+    of the sets of the children of each node, and then top-down with the
+    sets of the parents for nodes with none. Missing coordinates are filled
+    bottom-up with the mean location of the children, and then top-down
+    with the location of the parent. Both are done for a whole level of the
+    tree at a time, with the sets encoded as bit matrices.
+
+    """
+    nodes = [newdata[x] for x in tree.codes.tolist()]
+    levels = tree.levels()
+    parent = tree.parent
+    bits = {}
+    for attr in SET_ATTRIBUTES:
+        bits[attr] = pack_sets([x[attr] for x in nodes])
+    lat = np.array([x['latitude'] for x in nodes], dtype=float)
+    long = np.array([x['longitude'] for x in nodes], dtype=float)
+    subtree_depth = np.zeros(len(tree), dtype=np.int32)
+
+    # Fill in data bottom-up: children -> parents
+    for children in reversed(levels[1:]):
+        parents = parent[children]
+        for x, _ in bits.values():
+            np.bitwise_or.at(x, parents, x[children])
+        np.maximum.at(subtree_depth, parents, subtree_depth[children] + 1)
+        # if one coordinate is missing, both are
+        has_coords = ~np.isnan(lat[children])
+        mean_long, mean_lat = geomean_groups(
+            long[children[has_coords]], lat[children[has_coords]],
+            parents[has_coords], len(tree))
+        missing = np.isnan(lat)
+        long[missing] = mean_long[missing]
+        lat[missing] = mean_lat[missing]
+
+    # Fill in data top-down: parents -> children
+    for children in levels[1:]:
+        parents = parent[children]
+        for x, _ in bits.values():
+            empty = ~x[children].any(axis=1)
+            x[children[empty]] = x[parents[empty]]
+        missing = np.isnan(lat[children])
+        long[children[missing]] = long[parents[missing]]
+        lat[children[missing]] = lat[parents[missing]]
+
+    sets = {attr: unpack_sets(*x) for attr, x in bits.items()}
+    codes = tree.codes.tolist()
+    for i, data in enumerate(nodes):
+        for attr in SET_ATTRIBUTES:
+            data[attr] = sets[attr][i]
+        data.update({
+            'latitude': None if np.isnan(lat[i]) else float(lat[i]),
+            'longitude': None if np.isnan(long[i]) else float(long[i]),
+            'parent': codes[parent[i]] if parent[i] >= 0 else None,
+            'depth': int(tree.depth[i]),
+            # the roots themselves have no family
+            'family': codes[tree.root[i]] if parent[i] >= 0 else None,
+            'subtree_depth': int(subtree_depth[i]),
+        })
+
+
+def get_langdata():
+    """Glottolog languoid data keyed by Glottocode, before filling the tree.
+
+    Each languoid is a dict with the columns of the languoid table, and the
+    sets of :data:`SET_ATTRIBUTES`.
+
     """
-    glottocode = x["glottocode"]
-    data = newdata[glottocode]
-
-    if depth == 1:
-        data['family'] = glottocode
-    else:
-        data['family'] = family
-    f = functools.partial(
-        walk_tree,
-        depth=depth + 1,
-        family=data['family'],
-        ancestors=ancestors + [glottocode],
-        newdata=newdata)
-    children_data = [f(child) for child in x["children"]]
-    for c in children_data:
-        data['wals_codes'].update(c['wals_codes'])
-        data['iso_639_3'].update(c['iso_639_3'])
-        data['macroarea'].update(c['macroarea'])
-        try:
-            data['country_ids'].update(c['country_ids'])
-        except KeyError as exc:
-            print(data)
-            print(c)
-            raise exc
-
-    # Bump descendants back one level
-    data['descendants'] = {}
-    for c in children_data:
-        data['descendants'][c['glottocode']] = -1
-        for k, v in c['descendants'].items():
-            data['descendants'][k] = v - 1
-
-    # if one is missing, both are
-    if not data['latitude']:
-        child_lat = [
-            c['latitude'] for c in children_data
-            if c['latitude'] and not pd.isnull(c['latitude'])
-        ]
-        child_long = [
-            c['longitude'] for c in children_data
-            if c['longitude'] and not pd.isnull(c['longitude'])
-        ]
-        if len(child_long):
-            data['longitude'], data['latitude'] = geomean(
-                np.array(child_long), np.array(child_lat))
-        else:
-            data['longitude'] = data['latitude'] = None
-
-    if len(data['descendants']):
-        subtree_depth = -1 * min(data['descendants'].values())
-    else:
-        subtree_depth = 0
-
-    parent = ancestors[-1] if len(ancestors) else None
-
-    data.update({
-        'parent': parent,
-        'ancestors': ancestors,
-        'depth': depth,
-        'family': family,
-        'subtree_depth': subtree_depth,
-    })
-    return {
-        'glottocode': data['glottocode'],
-        'descendants': data['descendants'],
-        'iso_639_3': data['iso_639_3'],
-        'wals_codes': data['wals_codes'],
-        'country_ids': data['country_ids'],
-        'macroarea': data['macroarea'],
-        'latitude': data['latitude'],
-        'longitude': data['longitude'],
-    }
-
-
-def topdown_fill(x, newdata={}):
-    """Fill in data from parents."""
-    data = newdata[x['glottocode']]
-    if data['parent']:
-        parent = newdata[data['parent']]
-        for i in ('wals_codes', 'iso_639_3', 'macroarea', 'country_ids'):
-            if not len(data[i]):
-                data[i].update(parent[i])
-        for i in ('longitude', 'latitude'):
-            if not data[i]:
-                data[i] = parent[i]
-    for child in x['children']:
-        topdown_fill(child, newdata)
-
-
-def create_langdata(glottolog_tree):
-    """Create Glottolog language data."""
     # Get external data
     resourcemap = get_resourcemap()
     languoids = get_languoids()
@@ -254,8 +283,6 @@ def create_langdata(glottolog_tree):
             if is_wals_lang_id(id_):
                 glotto2wals[x["id"]] = id_["identifier"]
 
-    # It'll be much easier to work with dict of dicts than a pandas
-    # dataframe when walking the tree
     newdata = dict((x['glottocode'], x)
                    for x in languoids.reset_index().to_dict('records'))
     for k, v in newdata.items():
@@ -275,30 +302,77 @@ def create_langdata(glottolog_tree):
             v['wals_codes'] = set((glotto2wals[k], ))
         except KeyError:
             v['wals_codes'] = set()
+    return newdata
 
-    # Fill in data bottom-up: children -> parents
-    for subtree in glottolog_tree:
-        walk_tree(subtree, newdata=newdata)
 
-    # Fill in data top-down: parents -> children
-    for subtree in glottolog_tree:
-        topdown_fill(subtree, newdata=newdata)
+def create_langdata(tree):
+    """Create Glottolog language data.
+
+    ``tree`` is the language tree as a :py:class:`~lingdata.tree.ArrayTree`.
+
+    """
+    newdata = get_langdata()
+    fill_tree(tree, newdata)
     return newdata
 
 
-def create_distmat(newdata):
-    """Create the language distance matrix."""
-    langsdata = [
-        x for x in newdata.values()
-        if x['level'] in ("language", "dialect") and "family" in x
-    ]
-    for lang1, lang2 in itertools.product(langsdata, langsdata):
-        if (lang1["glottocode"] != lang2["glottocode"]
-                and lang1["family"] == lang2["family"]):
-            shared = len(set(lang1['ancestors']) & set(lang2['ancestors']))
-            geo = great_circle((lang1['latitude'], lang2['longitude']),
-                               (lang2['latitude'], lang2['longitude']))
-            yield (lang1["glottocode"], lang2["glottocode"], shared, geo.m)
+def great_circle_distance(lat1, long1, lat2, long2):
+    """Great-circle distance in meters between arrays of coordinates.
+
+    This is the formula used by :py:class:`geopy.distance.great_circle`,
+    vectorized with NumPy.
+
+    """
+    lat1, long1, lat2, long2 = (np.radians(x)
+                                for x in (lat1, long1, lat2, long2))
+    sin_lat1, cos_lat1 = np.sin(lat1), np.cos(lat1)
+    sin_lat2, cos_lat2 = np.sin(lat2), np.cos(lat2)
+    delta_long = long2 - long1
+    cos_delta_long, sin_delta_long = np.cos(delta_long), np.sin(delta_long)
+    d = np.arctan2(
+        np.sqrt((cos_lat2 * sin_delta_long)**2 +
+                (cos_lat1 * sin_lat2 -
+                 sin_lat1 * cos_lat2 * cos_delta_long)**2),
+        sin_lat1 * sin_lat2 + cos_lat1 * cos_lat2 * cos_delta_long)
+    return EARTH_RADIUS * 1000 * d
+
+
+def create_distmat(newdata, tree, blocksize=BLOCKSIZE):
+    """Create the language distance matrix.
+
+    Yields rows of the ``distances`` table for all ordered pairs of
+    distinct languages and dialects in the same family. The distances are
+    computed for blocks of languages at a time with NumPy, and the shared
+    ancestors with the LCA queries of ``tree``, an
+    :py:class:`~lingdata.tree.ArrayTree`.
+
+    """
+    families = collections.defaultdict(list)
+    for x in newdata.values():
+        if x['level'] in ("language", "dialect") and "family" in x:
+            families[x['family']].append(x)
+    for langs in families.values():
+        if len(langs) < 2:
+            continue
+        glottocodes = [x['glottocode'] for x in langs]
+        lat = np.array([x['latitude'] for x in langs], dtype=float)
+        long = np.array([x['longitude'] for x in langs], dtype=float)
+        nodes = tree.indices(glottocodes)
+        for start in range(0, len(langs), blocksize):
+            stop = min(start + blocksize, len(langs))
+            shared = tree.shared_ancestors(nodes[start:stop, np.newaxis],
+                                           nodes[np.newaxis, :])
+            geo = great_circle_distance(lat[start:stop, np.newaxis],
+                                        long[start:stop, np.newaxis],
+                                        lat[np.newaxis, :],
+                                        long[np.newaxis, :])
+            i, j = np.nonzero(
+                np.arange(start, stop)[:, np.newaxis] !=
+                np.arange(len(langs))[np.newaxis, :])
+            yield from zip([glottocodes[x] for x in (i + start).tolist()],
+                           [glottocodes[x] for x in j.tolist()],
+                           shared[i, j].tolist(),
+                           geo[i, j].tolist())
 
 
 def insert_languoids(conn, langdata):
@@ -334,30 +408,29 @@ def insert_languoids(conn, langdata):
         "INSERT INTO languoids VALUES (%s)" % ', '.join(['?'] * len(colnames)))
     c.executemany(sql, iterrows(langdata))
     conn.commit()
+    return c.rowcount
 
 
-def insert_paths(conn, langdata):
-    """Insert data into the paths table."""
-    def iterlangs(langdata):
-        # Get ancestors
-        for lang in langdata:
-            # Bookkeeping entries dont' have tree info
-            try:
-                for i, node in enumerate(reversed(lang['ancestors'])):
-                    yield (lang['glottocode'], node, i + 1)
-            except KeyError:
-                pass
-            # Get descendants
-            try:
-                for k, v in lang['descendants'].items():
-                    yield (lang['glottocode'], k, v)
-            except KeyError:
-                pass
+def insert_paths(conn, tree):
+    """Insert data into the paths table.
+
+    Each pair of a node and one of its ancestors in ``tree`` is inserted
+    twice: with the positive distance up to the ancestor, and with the
+    negative distance down to the node.
+
+    """
+    def iterpaths(tree):
+        for nodes, ancestors, dist in tree.paths():
+            nodes = tree.codes[nodes].tolist()
+            ancestors = tree.codes[ancestors].tolist()
+            yield from zip(nodes, ancestors, itertools.repeat(dist))
+            yield from zip(ancestors, nodes, itertools.repeat(-dist))
 
     c = conn.cursor()
     sql = "INSERT INTO paths VALUES (?, ?, ?)"
-    c.executemany(sql, iterlangs(langdata))
+    c.executemany(sql, iterpaths(tree))
     conn.commit()
+    return c.rowcount
 
 
 def insert_distances(conn, distances):
@@ -366,6 +439,7 @@ def insert_distances(conn, distances):
     sql = "INSERT INTO distances VALUES (?, ?, ?, ?)"
     c.executemany(sql, distances)
     conn.commit()
+    return c.rowcount
 
 
 def insert_iso_codes(conn, langdata):
@@ -379,6 +453,7 @@ def insert_iso_codes(conn, langdata):
     sql = "INSERT INTO iso_codes VALUES (?, ?)"
     c.executemany(sql, iterlangs(langdata))
     conn.commit()
+    return c.rowcount
 
 
 def insert_wals_codes(conn, langdata):
@@ -392,6 +467,7 @@ def insert_wals_codes(conn, langdata):
     sql = "INSERT INTO wals_codes VALUES (?, ?)"
     c.executemany(sql, iterlangs(langdata))
     conn.commit()
+    return c.rowcount
 
 
 def insert_macroareas(conn, langdata):
@@ -405,6 +481,7 @@ def insert_macroareas(conn, langdata):
     sql = "INSERT INTO macroareas VALUES (?, ?)"
     c.executemany(sql, iterlangs(langdata))
     conn.commit()
+    return c.rowcount
 
 
 def insert_countries(conn, langdata):
@@ -418,22 +495,59 @@ def insert_countries(conn, langdata):
     sql = "INSERT INTO countries VALUES (?, ?)"
     c.executemany(sql, iterlangs(langdata))
     conn.commit()
+    return c.rowcount
+
 
+def run(outfile, tree_file=None, paths=True, distances=True, timer=None):
+    """Insert data in a SQLite database.
 
-def run(outfile):
-    """Insert data in a SQLite database."""
-    langdata = create_langdata(glottolog_tree())
-    distances = create_distmat(langdata)
+    Parameters
+    ----------
+    outfile: str
+        Path to the SQLite database.
+    tree_file: str
+        If given, save the :py:class:`~lingdata.tree.ArrayTree` of the
+        language tree to this ``.npz`` file.
+    paths: bool
+        Fill the ``paths`` table.
+    distances: bool
+        Fill the ``distances`` table.
+    timer: :py:class:`~lingdata.utils.StageTimer`
+        Measures each stage.
+
+    """
+    timer = timer or StageTimer('glottolog')
+    with timer.stage('download'):
+        for url in URLS.values():
+            download_file(url, DOWNLOAD_DIR)
+    with timer.stage('parse') as record:
+        nodes = glottolog_tree()
+        record['rows'] = len(nodes['glottocode'])
+    with timer.stage('transform') as record:
+        tree = ArrayTree(nodes['glottocode'], nodes['parent'])
+        if tree_file:
+            tree.save(tree_file)
+        langdata = create_langdata(tree)
+        record['rows'] = len(langdata)
     # Initialize database and create tables
     conn = sqlite3.connect(outfile)
     set_sql_opts(conn)
-    insert_languoids(conn, langdata.values())
-    insert_paths(conn, langdata.values())
-    insert_distances(conn, distances)
-    insert_wals_codes(conn, langdata.values())
-    insert_iso_codes(conn, langdata.values())
-    insert_macroareas(conn, langdata.values())
-    insert_countries(conn, langdata.values())
+    with timer.stage('insert languoids') as record:
+        record['rows'] = insert_languoids(conn, langdata.values())
+    if paths:
+        with timer.stage('insert paths') as record:
+            record['rows'] = insert_paths(conn, tree)
+    if distances:
+        with timer.stage('insert distances') as record:
+            record['rows'] = insert_distances(
+                conn, create_distmat(langdata, tree))
+    with timer.stage('insert codes') as record:
+        record['rows'] = sum((
+            insert_wals_codes(conn, langdata.values()),
+            insert_iso_codes(conn, langdata.values()),
+            insert_macroareas(conn, langdata.values()),
+            insert_countries(conn, langdata.values()),
+        ))
     unset_sql_opts(conn)
 
 
@@ -441,8 +555,19 @@ def main():
     """Command line interface."""
     parser = argparse.ArgumentParser()
     parser.add_argument("db", help="Path to SQLite database.")
+    parser.add_argument("--tree", metavar="FILE",
+                        help="Save the language tree to FILE (.npz).")
+    parser.add_argument("--skip-paths", action="store_true",
+                        help="Do not fill the paths table.")
+    parser.add_argument("--skip-distances", action="store_true",
+                        help="Do not fill the distances table.")
+    add_timer_arguments(parser)
     args = parser.parse_args()
-    run(args.db)
+    timer = StageTimer('glottolog', profile_dir=args.profile)
+    run(args.db, tree_file=args.tree, paths=not args.skip_paths,
+        distances=not args.skip_distances, timer=timer)
+    if args.report:
+        timer.write(args.report)
 
 
 if __name__ == '__main__':
@@ -1,14 +1,12 @@
 #!/usr/bin/env python3
 """Download, process, and insert ISO 639-3 code tables into a database."""
 import argparse
-import io
 import re
 import sqlite3
 import zipfile
 
-import pandas as pd
-
-from .utils import DOWNLOAD_DIR, download_file
+from .utils import (DOWNLOAD_DIR, StageTimer, add_timer_arguments,
+                    download_file, insert_tsv, set_sql_opts, unset_sql_opts)
 
 
 CURRENT_DATE = "20180123"
@@ -48,21 +46,27 @@ def table2files(z):
     return tables
 
 
-def insert_data(db):
-    """Insert data from the ISO 639-3 zipfile into the database."""
+def insert_data(db, timer=None):
+    """Insert data from the ISO 639-3 zipfile into the database.
+
+    All tables are inserted in one transaction. ``timer`` is a
+    :py:class:`~lingdata.utils.StageTimer` measuring each stage.
+
+    """
+    timer = timer or StageTimer('iso_639_3')
     conn = sqlite3.connect(db)
+    set_sql_opts(conn)
     url = iso_639_3_url(CURRENT_DATE)
-    z = zipfile.ZipFile(download_file(url, DOWNLOAD_DIR))
+    with timer.stage('download'):
+        z = zipfile.ZipFile(download_file(url, DOWNLOAD_DIR))
     for tbl, filename in table2files(z):
-        print(tbl, filename)
-        with io.TextIOWrapper(z.open(filename, 'r')) as f:
-            # there are some empty lines
-            text = '\n'.join((line for line in f if line.strip() != ""))
-            # important to adjust NA values otherwise Namibia is problematic
-            dat = pd.read_csv(io.StringIO(text), delimiter='\t', na_values="",
-                              keep_default_na=False)
-            dat.to_sql(tbl, conn, if_exists='append', index=False)
+        with timer.stage(f'insert {tbl}') as record, \
+                z.open(filename, 'r') as f:
+            # only empty values are missing, otherwise Namibia is
+            # problematic
+            record['rows'] = insert_tsv(conn, tbl, f)
     conn.commit()
+    unset_sql_opts(conn)
     conn.close()
 
 
@@ -70,8 +74,12 @@ def main():
     """Command line interface."""
     parser = argparse.ArgumentParser()
     parser.add_argument("db", help="Path to SQLite database.")
+    add_timer_arguments(parser)
     args = parser.parse_args()
-    insert_data(args.db)
+    timer = StageTimer('iso_639_3', profile_dir=args.profile)
+    insert_data(args.db, timer=timer)
+    if args.report:
+        timer.write(args.report)
 
 
 if __name__ == '__main__':
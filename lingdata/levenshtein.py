@@ -0,0 +1,227 @@
+"""Batched Levenshtein distances and ASJP lexical distances with NumPy.
+
+Distances are computed with Myers' bit-parallel algorithm, in Hyyrö's
+formulation for the edit distance between two strings, vectorized over
+word pairs: each step processes one character of the second word of every
+pair at once. The first word of each pair is a bit vector in a 64-bit
+integer, so it can have at most :data:`MAX_LENGTH` characters; longer
+words, which do not occur in ASJP wordlists, fall back to
+:py:func:`Levenshtein.distance`.
+
+"""
+import numpy as np
+import Levenshtein
+
+MAX_LENGTH = 64
+"""Maximum length of the shorter word of a pair for the NumPy kernel."""
+
+BATCH_SIZE = 32
+"""Number of language pairs compared at once by :func:`lexidists_block`.
+
+The arrays of a batch take about 0.2 MiB per pair of 40-item wordlists.
+
+"""
+
+
+def encode(words):
+    """Encode words as arrays of Unicode code points.
+
+    Returns
+    -------
+    (codes, lengths): tuple of :py:class:`~numpy.array`
+        ``codes`` is a ``len(words) x max length`` array padded with 0.
+
+    """
+    arr = np.array(words, dtype=str)
+    if arr.dtype.itemsize == 0:
+        arr = arr.astype('U1')
+    codes = arr.view(np.uint32).reshape(len(arr), -1)
+    return codes, np.char.str_len(arr)
+
+
+def _myers(a, la, b, lb):
+    """Levenshtein distances between rows of encoded words ``a`` and ``b``.
+
+    Each row of ``a`` must have at most :data:`MAX_LENGTH` characters.
+
+    """
+    one = np.uint64(1)
+    a = a[:, :max(la.max(), 1)]
+    b = b[:, :max(lb.max(), 1)]
+    n, width = a.shape
+    # peq[k, j] has bit i set if a[k, i] == b[k, j]
+    bits = one << np.arange(width, dtype=np.uint64)
+    valid = np.arange(width) < la[:, np.newaxis]
+    peq = np.zeros(b.shape, dtype=np.uint64)
+    for i in range(width):
+        peq |= np.where((a[:, i, np.newaxis] == b) & valid[:, i, np.newaxis],
+                        bits[i], np.uint64(0))
+    pv = np.full(n, ~np.uint64(0))
+    mv = np.zeros(n, dtype=np.uint64)
+    score = la.astype(np.int64)
+    high = np.where(la > 0, one << (np.maximum(la, 1) - 1).astype(np.uint64),
+                    np.uint64(0))
+    for j in range(b.shape[1]):
+        # pairs stop changing once b is exhausted, so only the score
+        # needs to be masked
+        active = j < lb
+        eq = peq[:, j]
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        score += active & ((ph & high) != 0)
+        score -= active & ((mh & high) != 0)
+        ph = (ph << one) | one
+        mh = mh << one
+        pv = mh | ~(xv | ph)
+        mv = ph & xv
+    return np.where(la == 0, lb, score)
+
+
+def distances(words1, words2):
+    """Levenshtein distances between ``words1[i]`` and ``words2[i]``."""
+    codes1, len1 = encode(words1)
+    codes2, len2 = encode(words2)
+    return encoded_distances(codes1, len1, codes2, len2)
+
+
+def encoded_distances(codes1, len1, codes2, len2):
+    """Levenshtein distances between rows of encoded words."""
+    width = max(codes1.shape[1], codes2.shape[1])
+    codes1, codes2 = _pad(codes1, width), _pad(codes2, width)
+    # the shorter word of each pair is the bit vector
+    swap = (len1 > len2)[:, np.newaxis]
+    a = np.where(swap, codes2, codes1)
+    b = np.where(swap, codes1, codes2)
+    la = np.minimum(len1, len2)
+    lb = np.maximum(len1, len2)
+    out = np.zeros(len(la), dtype=np.int64)
+    short = la <= MAX_LENGTH
+    if short.any():
+        out[short] = _myers(a[short, :MAX_LENGTH], la[short], b[short],
+                            lb[short])
+    for k in np.flatnonzero(~short):
+        out[k] = Levenshtein.distance(''.join(map(chr, a[k, :la[k]])),
+                                      ''.join(map(chr, b[k, :lb[k]])))
+    return out
+
+
+def _pad(codes, width):
+    """Pad the columns of ``codes`` with zeros to ``width``."""
+    if codes.shape[1] >= width:
+        return codes
+    out = np.zeros((codes.shape[0], width), dtype=codes.dtype)
+    out[:, :codes.shape[1]] = codes
+    return out
+
+
+def _wordlist_array(wordlist, meanings, ids):
+    """IDs of the words of each meaning, padded with -1."""
+    rows = [[ids.setdefault(w, len(ids)) for w in wordlist[m]]
+            for m in meanings]
+    out = np.full((len(rows), max(map(len, rows))), -1, dtype=np.int64)
+    for i, row in enumerate(rows):
+        out[i, :len(row)] = row
+    return out
+
+
+def lexidists_block(pairs, min_words=2, batch_size=BATCH_SIZE):
+    """Calculate lexical distances for many pairs of languages at once.
+
+    Parameters
+    ----------
+    pairs: list
+        ``(words1, words2)`` tuples of wordlists.
+    min_words: int
+        Minimum number of common meanings
+    batch_size: int
+        Number of language pairs whose word pairs are computed together.
+
+    Returns
+    -------
+    list
+        For each pair, the same value as :func:`lingdata.asjp.lexidists`.
+
+    The word-pair distances of each batch of language pairs are computed
+    in one NumPy call, and identical word pairs only once per batch. The
+    sums are then accumulated in the same order as
+    :func:`lingdata.asjp.lexidists`, so the results are identical.
+
+    """
+    out = []
+    for start in range(0, len(pairs), batch_size):
+        out.extend(_lexidists_batch(pairs[start:start + batch_size],
+                                    min_words))
+    return out
+
+
+def _lexidists_batch(pairs, min_words):
+    """Lexical distances of one batch of :func:`lexidists_block`."""
+    ids = {}
+    # (M, word pairs of each meaning pair) for each language pair
+    jobs = []
+    for words1, words2 in pairs:
+        common_words = sorted(set(words1.keys()) & set(words2.keys()))
+        M = len(common_words)
+        if M <= min_words:
+            jobs.append(None)
+            continue
+        w1 = _wordlist_array(words1, common_words, ids)
+        w2 = _wordlist_array(words2, common_words, ids)
+        # meaning pairs with meaning1 <= meaning2, in lexidists order
+        ia, ib = np.triu_indices(M)
+        # word pairs of each meaning pair, in itertools.product order
+        j1 = np.repeat(w1[ia], w2.shape[1], axis=1)
+        j2 = np.tile(w2[ib], (1, w1.shape[1]))
+        jobs.append((M, ia == ib, j1, j2))
+    words = list(ids)
+    codes, lengths = encode(words) if words else (None, None)
+    valid = [(j1 >= 0) & (j2 >= 0) for _, _, j1, j2 in filter(None, jobs)]
+    keys = np.concatenate(
+        [j1[v] * len(words) + j2[v]
+         for (_, _, j1, j2), v in zip(filter(None, jobs), valid)] or
+        [np.zeros(0, dtype=np.int64)])
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    i1, i2 = np.divmod(uniq, max(len(words), 1))
+    if len(uniq):
+        d = encoded_distances(codes[i1], lengths[i1], codes[i2], lengths[i2])
+        d = d / np.maximum(lengths[i1], lengths[i2])
+    else:
+        d = np.zeros(0)
+    d = d[inverse]
+    out = []
+    offset = 0
+    valid = iter(valid)
+    for job in jobs:
+        if job is None:
+            out.append(None)
+            continue
+        M, same, j1, _ = job
+        v = next(valid)
+        dist = np.zeros(j1.shape)
+        dist[v] = d[offset:offset + v.sum()]
+        offset += v.sum()
+        # add the word pairs in order; adding 0 for the padding is exact
+        total = dist[:, 0].copy()
+        for k in range(1, dist.shape[1]):
+            total += dist[:, k]
+        mean = total / v.sum(axis=1)
+        ldn_sum = float(np.cumsum(mean[same])[-1])
+        ldnd_denom = float(np.cumsum(mean[~same])[-1])
+        out.append({
+            'ldn': ldn_sum / M,
+            'ldnd': 0.5 * (M - 1) * ldn_sum / ldnd_denom,
+            'M': M
+        })
+    return out
+
+
+def lexidists(words1, words2, min_words=2):
+    """Calculate lexical distance between two languages.
+
+    Same as :func:`lingdata.asjp.lexidists`, computed with
+    :func:`lexidists_block`.
+
+    """
+    return lexidists_block([(words1, words2)], min_words=min_words)[0]
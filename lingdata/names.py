@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""Index the language names of Glottolog, ISO 639-3 and Ethnologue.
+
+The names are copied from the other databases into ``names.db`` with their
+code in the source: a glottocode, ISO 639-3 ``Id`` or Ethnologue
+``LangID``. The names are folded to lower case without diacritics, see
+:func:`fold`, and indexed with an FTS5 trigram index. :func:`search_names`
+ranks the names sharing the rarest trigrams of each query by their trigram
+similarity to it.
+
+"""
+import argparse
+import collections
+import os.path
+import sqlite3
+import unicodedata
+
+from .utils import set_sql_opts, unset_sql_opts
+
+SOURCES = {
+    'glottolog': [
+        ("SELECT glottocode, 'name', name FROM glottolog.languoids "
+         "WHERE name IS NOT NULL"),
+    ],
+    'iso_639_3': [
+        ("SELECT Id, 'Print_Name', Print_Name "
+         "FROM iso_639_3.iso_639_3_Name_Index"),
+        ("SELECT Id, 'Inverted_Name', Inverted_Name "
+         "FROM iso_639_3.iso_639_3_Name_Index"),
+    ],
+    'ethnologue': [
+        ("SELECT LangID, NameType, Name FROM ethnologue.LanguageIndex "
+         "WHERE Name IS NOT NULL"),
+    ],
+}
+"""Queries of the code, name type and name of each source database."""
+
+FOLD = str.maketrans({
+    'æ': 'ae', 'œ': 'oe', 'ø': 'o', 'ł': 'l', 'đ': 'd', 'ð': 'd',
+    'þ': 'th', 'ı': 'i', 'ŧ': 't', 'ħ': 'h',
+})
+"""Letters without a Unicode decomposition and their folded form."""
+
+POSTINGS = 1000
+"""Approximate number of names scored by :func:`search` for each query."""
+
+Match = collections.namedtuple(
+    'Match', ['name', 'source', 'code', 'name_type', 'score'])
+"""A name found by :func:`search`, with its trigram similarity."""
+
+
+def fold(name):
+    """Fold case, diacritics and whitespace of ``name``.
+
+    >>> fold("  Ngäbere  Bugle ")
+    'ngabere bugle'
+
+    """
+    name = unicodedata.normalize('NFKD', name.casefold())
+    name = ''.join(x for x in name if not unicodedata.combining(x))
+    return ' '.join(name.translate(FOLD).split())
+
+
+def trigrams(folded):
+    """Set of the trigrams of a folded name."""
+    return {folded[i:i + 3] for i in range(len(folded) - 2)}
+
+
+def insert_names(conn, data_dir):
+    """Insert the names of the databases in ``data_dir`` into ``conn``.
+
+    Sources whose database is not in ``data_dir`` are skipped.
+
+    """
+    for source, queries in SOURCES.items():
+        path = os.path.join(data_dir, f'{source}.db')
+        if not os.path.exists(path):
+            print(f"{path} not found, skipping {source}")
+            continue
+        conn.execute("ATTACH DATABASE ? AS " + source, (path, ))
+        for sql in queries:
+            conn.executemany(
+                "INSERT OR IGNORE INTO names "
+                "(source, code, name_type, name, folded) "
+                "VALUES (?, ?, ?, ?, ?)",
+                ((source, code, name_type, name, fold(name))
+                 for code, name_type, name in conn.execute(sql)))
+        conn.commit()
+        conn.execute("DETACH DATABASE " + source)
+    conn.execute("INSERT INTO names_fts (rowid, folded) "
+                 "SELECT name_id, folded FROM names")
+    conn.commit()
+
+
+def search(conn, name, k=10, schema='main'):
+    """Find the ``k`` names most similar to ``name``.
+
+    Parameters
+    ----------
+    conn: :py:class:`sqlite3.Connection`
+        Connection to ``names.db``.
+    name: str
+        Name to look for.
+    k: int
+        Maximum number of matches.
+    schema: str
+        Schema of ``names.db`` in ``conn``, if it is attached.
+
+    Returns
+    -------
+    list
+        :data:`Match` objects, best first. The score is the Jaccard
+        similarity of the trigrams of the folded names, 1 for names which
+        are the same once folded.
+
+    The names scored are those with any of the rarest trigrams of
+    ``name``, taking trigrams until about :data:`POSTINGS` names are
+    found. A misspelled name still shares most of its trigrams with the
+    correct one, while its misspelled trigrams are rare or unknown, so
+    they do not add candidates. Names shorter than three characters have
+    no trigrams and only match exactly.
+
+    """
+    folded = fold(name)
+    grams = trigrams(folded)
+    columns = "name, source, code, name_type, folded"
+    if grams:
+        counts = conn.execute(
+            f"SELECT term, doc FROM {schema}.names_vocab WHERE term IN "
+            f"({', '.join('?' * len(grams))})", sorted(grams)).fetchall()
+        terms = []
+        total = 0
+        for term, count in sorted(counts, key=lambda x: (x[1], x[0])):
+            if terms and total + count > POSTINGS:
+                break
+            terms.append(term)
+            total += count
+        if not terms:
+            return []
+        query = ' OR '.join('"%s"' % x.replace('"', '""') for x in terms)
+        rows = conn.execute(
+            f"SELECT {columns} FROM {schema}.names WHERE name_id IN "
+            f"(SELECT rowid FROM {schema}.names_fts WHERE names_fts MATCH ?)",
+            (query, ))
+    else:
+        rows = conn.execute(
+            f"SELECT {columns} FROM {schema}.names WHERE folded = ?",
+            (folded, ))
+    matches = []
+    for *row, other in rows:
+        if other == folded:
+            score = 1.
+        else:
+            other = trigrams(other)
+            score = len(grams & other) / len(grams | other)
+        matches.append(Match(*row, score))
+    matches.sort(key=lambda x: (-x.score, x.name, x.source, x.code))
+    return matches[:k]
+
+
+def search_names(conn, names, k=10, schema='main'):
+    """Find the ``k`` names most similar to each of ``names``.
+
+    Returns a list with the :func:`search` results of each name. Names
+    which are the same once folded are only searched once.
+
+    """
+    results = {}
+    out = []
+    for name in names:
+        folded = fold(name)
+        if folded not in results:
+            results[folded] = search(conn, folded, k, schema)
+        out.append(results[folded])
+    return out
+
+
+def run(outfile, data_dir=None):
+    """Create the names database.
+
+    The source databases are in ``data_dir``, by default the directory of
+    ``outfile``.
+
+    """
+    if data_dir is None:
+        data_dir = os.path.dirname(outfile) or '.'
+
+    conn = sqlite3.connect(outfile)
+    set_sql_opts(conn)
+    insert_names(conn, data_dir)
+    unset_sql_opts(conn)
+    conn.close()
+
+
+def main():
+    """Command line interface."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("db", help="Path to SQLite database.")
+    parser.add_argument("--data-dir",
+                        help="Directory of the source databases. Defaults "
+                        "to the directory of db.")
+    args = parser.parse_args()
+    run(args.db, args.data_dir)
+
+
+if __name__ == '__main__':
+    main()
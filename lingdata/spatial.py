@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""Spatial index of the coordinates of the languages in all databases.
+
+The languages and dialects of Glottolog, and the languages of ASJP and
+WALS, are indexed as points on the unit sphere in a k-d tree for each
+database (:py:class:`scipy.spatial.cKDTree`). The straight-line (chord)
+distance between unit vectors increases with the great-circle distance,
+so the nearest points in the tree are the nearest on the sphere, and a
+radius on the sphere is a radius in the tree. Unlike the ``geo`` column
+of the Glottolog ``distances`` table, queries are not limited to
+languages of the same family.
+
+The coordinates are saved to ``<data_dir>/spatial.npz`` at the end of a
+build, and the trees are built again when it is loaded, which is fast.
+Distances are great-circle distances in kilometers, as by
+:func:`lingdata.glottolog.great_circle_distance`.
+
+"""
+import argparse
+import collections
+import os.path
+import sqlite3
+
+import numpy as np
+from geopy.distance import EARTH_RADIUS
+from scipy.spatial import cKDTree
+
+SOURCES = {
+    'glottolog':
+    ("SELECT glottocode, latitude, longitude FROM languoids "
+     "WHERE level IN ('language', 'dialect') "
+     "AND latitude IS NOT NULL AND longitude IS NOT NULL "
+     "ORDER BY glottocode"),
+    'asjp':
+    ("SELECT language, CAST(lat AS REAL), CAST(lon AS REAL) FROM languages "
+     "WHERE typeof(lat) IN ('integer', 'real') "
+     "AND typeof(lon) IN ('integer', 'real') "
+     "ORDER BY language"),
+    'wals':
+    ("SELECT wals_code, latitude, longitude FROM languages "
+     "ORDER BY wals_code"),
+}
+"""Queries of the codes and coordinates of each database, sorted by code.
+"""
+
+INDEX = "spatial.npz"
+"""Name of the file of the index in the data directory."""
+
+Neighbor = collections.namedtuple('Neighbor', ['code', 'distance'])
+"""A language found by a query, with its distance in kilometers."""
+
+
+def index_path(data_dir):
+    """Path of the spatial index of the databases in ``data_dir``."""
+    return os.path.join(data_dir, INDEX)
+
+
+def unit_vectors(latitude, longitude):
+    """Unit vectors of coordinates in degrees, with shape ``(n, 3)``."""
+    lat = np.radians(np.asarray(latitude, dtype=float))
+    long = np.radians(np.asarray(longitude, dtype=float))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(long), cos_lat * np.sin(long),
+                     np.sin(lat)], axis=-1)
+
+
+def chord_to_km(chord):
+    """Great-circle distance in kilometers of a chord of the unit sphere."""
+    return 2 * EARTH_RADIUS * np.arcsin(np.minimum(chord, 2.) / 2)
+
+
+def km_to_chord(distance):
+    """Chord of the unit sphere of a great-circle distance in kilometers."""
+    return 2 * np.sin(np.minimum(np.asarray(distance, dtype=float)
+                                 / EARTH_RADIUS, np.pi) / 2)
+
+
+def read_points(data_dir):
+    """Read the codes and coordinates of the databases in ``data_dir``.
+
+    Returns a dict of ``(codes, latitude, longitude)`` arrays keyed by
+    database; databases which are not in ``data_dir`` are left out.
+
+    """
+    points = {}
+    for source, sql in SOURCES.items():
+        path = os.path.join(data_dir, f'{source}.db')
+        if not os.path.exists(path):
+            continue
+        conn = sqlite3.connect(path)
+        rows = conn.execute(sql).fetchall()
+        conn.close()
+        codes = [x[0].encode('utf-8') for x in rows]
+        points[source] = (
+            np.array(codes, dtype=f"S{max(map(len, codes), default=1)}"),
+            np.array([x[1] for x in rows], dtype=float),
+            np.array([x[2] for x in rows], dtype=float))
+    return points
+
+
+class SpatialIndex:
+    """Nearest-neighbor and radius queries on language coordinates.
+
+    Parameters
+    ----------
+    points: dict
+        ``(codes, latitude, longitude)`` arrays keyed by database, as
+        returned by :func:`read_points`. Codes must be sorted.
+
+    Use :meth:`load` to read the index of a data directory. Each query
+    searches the languages of one database, ``source``. Query points can
+    be scalars or arrays; the batch methods, :meth:`query` and
+    :meth:`query_radius`, return arrays of positions in
+    ``index.codes[source]``.
+
+    """
+
+    def __init__(self, points):
+        self.codes = {}
+        self.latitude = {}
+        self.longitude = {}
+        self._trees = {}
+        for source, (codes, lat, long) in points.items():
+            self.codes[source] = np.asarray(codes)
+            self.latitude[source] = np.asarray(lat)
+            self.longitude[source] = np.asarray(long)
+            self._trees[source] = cKDTree(unit_vectors(lat, long))
+
+    @classmethod
+    def from_databases(cls, data_dir):
+        """Index the databases in ``data_dir``."""
+        return cls(read_points(data_dir))
+
+    @classmethod
+    def load(cls, path):
+        """Load an index saved with :meth:`save`."""
+        with np.load(path) as f:
+            sources = [x[:-len('_codes')] for x in f.files
+                       if x.endswith('_codes')]
+            return cls({
+                x: (f[f'{x}_codes'], f[f'{x}_latitude'],
+                    f[f'{x}_longitude'])
+                for x in sources
+            })
+
+    def save(self, path):
+        """Save the coordinates to ``.npz`` file ``path``."""
+        arrays = {}
+        for source in self.codes:
+            arrays[f'{source}_codes'] = self.codes[source]
+            arrays[f'{source}_latitude'] = self.latitude[source]
+            arrays[f'{source}_longitude'] = self.longitude[source]
+        np.savez(path, **arrays)
+
+    def _tree(self, source):
+        try:
+            return self._trees[source]
+        except KeyError:
+            raise ValueError(f"no {source} languages in the index") from None
+
+    def locate(self, code, source='glottolog'):
+        """Latitude and longitude of ``code``, or ``None`` if not indexed."""
+        codes = self.codes.get(source)
+        if codes is None:
+            return None
+        key = code.encode('utf-8')
+        i = int(np.searchsorted(codes, key))
+        if i == len(codes) or codes[i] != key:
+            return None
+        return (float(self.latitude[source][i]),
+                float(self.longitude[source][i]))
+
+    def query(self, latitude, longitude, k=10, source='glottolog',
+              radius=None):
+        """Find the ``k`` nearest languages of ``source`` to each point.
+
+        Parameters
+        ----------
+        latitude, longitude: float or array-like
+            Coordinates of the query points in degrees.
+        k: int
+            Number of neighbors, at least 1.
+        source: str
+            Database of the languages; one of the keys of :data:`SOURCES`.
+        radius: float
+            If given, only find languages within this distance in
+            kilometers.
+
+        Returns
+        -------
+        (distance, index): tuple of :py:class:`numpy.ndarray`
+            The distances in kilometers and positions in
+            ``codes[source]`` of the neighbors, nearest first, with shape
+            ``(n, k)`` for ``n`` points, or ``(k, )`` for one point.
+            Missing neighbors have an infinite distance and an index of
+            -1.
+
+        """
+        if k < 1:
+            raise ValueError(f"k must be at least 1, not {k}")
+        tree = self._tree(source)
+        chord, index = tree.query(
+            unit_vectors(latitude, longitude), k=[*range(1, k + 1)],
+            distance_upper_bound=(np.inf if radius is None else
+                                  float(km_to_chord(radius)) * (1 + 1e-9)))
+        missing = index == tree.n
+        index[missing] = -1
+        distance = chord_to_km(chord)
+        distance[missing] = np.inf
+        return distance, index
+
+    def query_radius(self, latitude, longitude, radius, source='glottolog'):
+        """Find all languages of ``source`` within ``radius`` of each point.
+
+        ``radius`` is in kilometers. Returns lists of the distances and
+        positions in ``codes[source]`` of the languages near each point,
+        nearest first, or the two arrays for one point.
+
+        """
+        tree = self._tree(source)
+        vectors = unit_vectors(latitude, longitude)
+        single = vectors.ndim == 1
+        vectors = np.atleast_2d(vectors)
+        chord = float(km_to_chord(radius)) * (1 + 1e-9)
+        distances = []
+        indices = []
+        for vector, index in zip(vectors, tree.query_ball_point(
+                vectors, chord, return_sorted=False)):
+            index = np.asarray(index, dtype=np.intp)
+            d = np.linalg.norm(tree.data[index] - vector, axis=1)
+            order = np.lexsort((index, d))
+            distances.append(chord_to_km(d[order]))
+            indices.append(index[order])
+        if single:
+            return distances[0], indices[0]
+        return distances, indices
+
+    def _neighbors(self, source, distance, index):
+        codes = self.codes[source]
+        return [Neighbor(codes[i].decode('utf-8'), float(d))
+                for d, i in zip(distance.tolist(), index.tolist())
+                if i >= 0]
+
+    def nearest(self, latitude, longitude, k=10, source='glottolog'):
+        """List of the ``k`` nearest :data:`Neighbor` to one point."""
+        return self._neighbors(
+            source, *self.query(latitude, longitude, k, source))
+
+    def within(self, latitude, longitude, radius, source='glottolog'):
+        """List of the :data:`Neighbor` within ``radius`` km of one point.
+        """
+        return self._neighbors(
+            source, *self.query_radius(latitude, longitude, radius, source))
+
+    def nearest_to(self, code, k=10, source='glottolog', of='glottolog'):
+        """List of the ``k`` nearest :data:`Neighbor` to a language.
+
+        ``code`` is the code of the language in database ``of``, and the
+        neighbors are languages of ``source``, not including the language
+        itself. Returns ``None`` if the language has no coordinates.
+
+        """
+        location = self.locate(code, of)
+        if location is None:
+            return None
+        neighbors = self.nearest(*location, k + 1, source)
+        if source == of:
+            neighbors = [x for x in neighbors if x.code != code]
+        return neighbors[:k]
+
+
+def write_index(data_dir, path=None):
+    """Index the databases in ``data_dir`` and save the index.
+
+    ``path`` defaults to :func:`index_path`. Returns the number of
+    languages indexed.
+
+    """
+    index = SpatialIndex.from_databases(data_dir)
+    path = path or index_path(data_dir)
+    tmp = path + '.tmp.npz'
+    index.save(tmp)
+    os.replace(tmp, path)
+    return sum(len(x) for x in index.codes.values())
+
+
+def main():
+    """Command line interface."""
+    parser = argparse.ArgumentParser(
+        description="Build the spatial index of the databases.")
+    parser.add_argument("--data-dir", default="data",
+                        help="Directory of the databases.")
+    parser.add_argument("--out",
+                        help="Output file. Defaults to DATA_DIR/spatial.npz.")
+    args = parser.parse_args()
+    n = write_index(args.data_dir, args.out)
+    print(f"Indexed {n} languages")
+
+
+if __name__ == '__main__':
+    main()
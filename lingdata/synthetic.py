@@ -0,0 +1,633 @@
+#!/usr/bin/env python3
+"""Generate synthetic source data for testing and benchmarking builds.
+
+The files have the same names and formats as the downloaded sources of
+the Glottolog, ASJP, ISO 639-3 and Ethnologue databases, so that a
+directory of them can be used as a mirror (see
+:data:`lingdata.utils.MIRROR_ENV`)::
+
+    python -m lingdata.synthetic --scale 0.1 /tmp/mirror
+    LINGDATA_MIRROR=/tmp/mirror python -m lingdata build --force \\
+        glottolog asjp iso_639_3 ethnologue names
+
+All sources describe the same random languages, so that their codes and
+names match across databases like the real ones. At scale 1 there are
+about as many languages as in Glottolog, with a similarly skewed
+distribution of family sizes. The WALS source is not generated, since
+its database is built with R.
+
+"""
+import argparse
+import csv
+import io
+import json
+import math
+import os
+import os.path
+import random
+import string
+import unicodedata
+import zipfile
+
+from . import asjp, ethnologue, glottolog, iso_639_3
+from .utils import url_filename
+
+SOURCES = ('glottolog', 'asjp', 'iso_639_3', 'ethnologue')
+"""Sources which can be generated."""
+
+LANGUAGES = 8000
+"""Number of languages at scale 1, about as many as in Glottolog."""
+
+MACROAREAS = ('Africa', 'Australia', 'Eurasia', 'North America',
+              'Papunesia', 'South America')
+"""Glottolog macroareas."""
+
+COUNTRIES = (
+    ('AO', 'Angola', 'Africa'), ('AU', 'Australia', 'Pacific'),
+    ('BO', 'Bolivia', 'Americas'), ('BR', 'Brazil', 'Americas'),
+    ('CD', 'Congo, Democratic Republic of the', 'Africa'),
+    ('CM', 'Cameroon', 'Africa'), ('CN', 'China', 'Asia'),
+    ('CO', 'Colombia', 'Americas'), ('ET', 'Ethiopia', 'Africa'),
+    ('FR', 'France', 'Europe'), ('GH', 'Ghana', 'Africa'),
+    ('ID', 'Indonesia', 'Asia'), ('IN', 'India', 'Asia'),
+    ('IR', 'Iran', 'Asia'), ('KE', 'Kenya', 'Africa'),
+    ('LA', 'Laos', 'Asia'), ('MM', 'Myanmar', 'Asia'),
+    ('MX', 'Mexico', 'Americas'), ('MY', 'Malaysia', 'Asia'),
+    ('NA', 'Namibia', 'Africa'), ('NG', 'Nigeria', 'Africa'),
+    ('NP', 'Nepal', 'Asia'), ('PE', 'Peru', 'Americas'),
+    ('PG', 'Papua New Guinea', 'Pacific'), ('PH', 'Philippines', 'Asia'),
+    ('RU', 'Russian Federation', 'Europe'), ('SB', 'Solomon Islands',
+                                              'Pacific'),
+    ('SD', 'Sudan', 'Africa'), ('TD', 'Chad', 'Africa'),
+    ('TZ', 'Tanzania', 'Africa'), ('US', 'United States', 'Americas'),
+    ('VN', 'Viet Nam', 'Asia'), ('VU', 'Vanuatu', 'Pacific'),
+    ('ZA', 'South Africa', 'Africa'),
+)
+"""Ethnologue countries: code, name and area.
+
+Namibia is included since its code, ``NA``, is read as a missing value
+unless the tables are parsed with care.
+
+"""
+
+STATUSES = (('safe', 60), ('vulnerable', 12), ('definitely endangered', 8),
+            ('severely endangered', 6), ('critically endangered', 6),
+            ('extinct', 8))
+"""Glottolog endangerment statuses of languages and their weights."""
+
+ASJP_ALPHABET = "pbmfvtdszcnrlSZCjT5ykgxNqXh7LwieEu3oa"
+"""Symbols of ASJPcode."""
+
+_CONSONANTS = ('p', 't', 'k', 'b', 'd', 'g', 'm', 'n', 's', 'l', 'r', 'w',
+               'y', 'h', 'z', 'ch', 'sh', 'ng', 'ts')
+_VOWELS = ('a', 'e', 'i', 'o', 'u', 'a', 'i', 'á', 'é', 'ö', 'ü', 'ã')
+_DIRECTIONS = ('Northern', 'Southern', 'Eastern', 'Western', 'Central',
+               'Upper', 'Lower', 'Coastal', 'Highland')
+
+
+def _ascii(name):
+    """Lower case ASCII letters of ``name``."""
+    name = unicodedata.normalize('NFKD', name.lower())
+    return ''.join(x for x in name if x in string.ascii_lowercase)
+
+
+def random_name(rng):
+    """Random language name of two to four syllables."""
+    syllables = [
+        rng.choice(_CONSONANTS) + rng.choice(_VOWELS[:7] if rng.random() < .9
+                                             else _VOWELS)
+        for _ in range(rng.choice((2, 2, 3, 3, 3, 4)))
+    ]
+    if rng.random() < .3:
+        syllables.append(rng.choice(('n', 'r', 'k', 'm', 's')))
+    name = ''.join(syllables)
+    if rng.random() < .03:
+        # Glottolog labels with an apostrophe are escaped in the tree
+        i = rng.randrange(2, len(name) - 1)
+        name = name[:i] + "'" + name[i:]
+    return name.capitalize()
+
+
+def _family_sizes(n, rng):
+    """Random numbers of languages of families, ``n`` in total."""
+    sizes = []
+    while sum(sizes) < n:
+        # about a third of the families are isolates, and a few are huge
+        sizes.append(max(1, int(rng.lognormvariate(0.3, 1.7))))
+    sizes[-1] -= sum(sizes) - n
+    return sizes
+
+
+def _product(letters, n):
+    """All strings of ``n`` of ``letters``."""
+    out = ['']
+    for _ in range(n):
+        out = [x + y for x in out for y in letters]
+    return out
+
+
+def make_languoids(n_languages, rng):
+    """Random Glottolog-like forest of language families.
+
+    Parameters
+    ----------
+    n_languages: int
+        Number of languages.
+    rng: :py:class:`random.Random`
+        Random number generator.
+
+    Returns
+    -------
+    list
+        Dicts of languoid data, in preorder. Families are split into
+        random subgroups down to the languages, which have random dialects.
+        Each languoid has its ``glottocode``, ``name``, ``level``, the
+        index of its ``parent`` and the Glottocode of its ``family`` (both
+        ``None`` for roots), the indices of its ``children``, and its
+        ``status``, ``iso_639_3``, ``wals_code``, ``latitude``,
+        ``longitude``, ``macroarea`` and ``countries``. A few bookkeeping
+        languoids, which are not in the tree, are at the end.
+
+    """
+    languoids = []
+    glottocodes = set()
+    # all three letter codes, ISO codes first from one end and WALS codes
+    # of two or three letters from the other
+    codes = _product(string.ascii_lowercase, 3)
+    rng.shuffle(codes)
+    wals_codes = _product(string.ascii_lowercase, 2)
+    rng.shuffle(wals_codes)
+    wals_codes += codes[len(codes) // 2:]
+    iso_codes = codes[:len(codes) // 2]
+
+    def add(name, level, parent, family, **kwargs):
+        prefix = (_ascii(name) + 'aaaa')[:4]
+        while True:
+            glottocode = f"{prefix}{rng.randrange(1000, 10000)}"
+            if glottocode not in glottocodes:
+                glottocodes.add(glottocode)
+                break
+        node = {
+            'glottocode': glottocode, 'name': name, 'level': level,
+            'parent': parent, 'family': family, 'children': [],
+            'status': 'safe', 'iso_639_3': None, 'wals_code': None,
+            'latitude': None, 'longitude': None, 'macroarea': None,
+            'countries': [], 'bookkeeping': False,
+        }
+        node.update(kwargs)
+        languoids.append(node)
+        if parent is not None:
+            languoids[parent]['children'].append(len(languoids) - 1)
+        return len(languoids) - 1
+
+    def add_language(parent, family, area):
+        lat = area['latitude'] + rng.gauss(0, 4)
+        lon = area['longitude'] + rng.gauss(0, 4)
+        status = rng.choices([x for x, _ in STATUSES],
+                             [x for _, x in STATUSES])[0]
+        i = add(random_name(rng), 'language', parent, family,
+                status=status,
+                iso_639_3=(iso_codes.pop() if iso_codes and
+                           rng.random() < .85 else None),
+                wals_code=(wals_codes.pop() if wals_codes and
+                           rng.random() < .3 else None),
+                latitude=max(-89., min(89., lat)) if rng.random() < .95
+                else None,
+                longitude=(lon + 180) % 360 - 180,
+                macroarea=area['macroarea'] if rng.random() < .95
+                else None,
+                countries=rng.sample(area['countries'],
+                                     rng.choice((1, 1, 1, 2))))
+        if languoids[i]['latitude'] is None:
+            languoids[i]['longitude'] = None
+        # most languages have no dialects, a few have many
+        for _ in range(min(int(rng.expovariate(.6)), 20)):
+            add_dialect(i, family)
+        return i
+
+    def add_dialect(parent, family, depth=0):
+        language = languoids[parent]
+        name = language['name'].split(' (')[0]
+        name = (f"{rng.choice(_DIRECTIONS)} {name}" if rng.random() < .5
+                else f"{name} ({random_name(rng)})")
+        coords = language['latitude'] is not None and rng.random() < .4
+        i = add(name, 'dialect', parent, family, status=language['status'],
+                latitude=(language['latitude'] + rng.gauss(0, .5)
+                          if coords else None),
+                longitude=(language['longitude'] if coords else None),
+                macroarea=language['macroarea'],
+                countries=(language['countries'] if rng.random() < .8
+                           else []))
+        if coords:
+            languoids[i]['latitude'] = max(-89.,
+                                           min(89., languoids[i]['latitude']))
+        if depth < 2 and rng.random() < .1:
+            add_dialect(i, family, depth + 1)
+
+    def add_group(n, parent, family, area):
+        i = add(random_name(rng) + rng.choice(('ic', 'an', '')), 'family',
+                parent, family)
+        family = family or languoids[i]['glottocode']
+        k = min(n, rng.randint(2, 5))
+        # random split of n languages into k subgroups
+        cuts = sorted(rng.sample(range(1, n), k - 1))
+        for size in (b - a for a, b in zip([0] + cuts, cuts + [n])):
+            if size == 1:
+                add_language(i, family, area)
+            else:
+                add_group(size, i, family, area)
+        return i
+
+    for size in _family_sizes(n_languages, rng):
+        area = {
+            'latitude': rng.uniform(-45, 65),
+            'longitude': rng.uniform(-180, 180),
+            'macroarea': rng.choice(MACROAREAS),
+            'countries': [x[0] for x in rng.sample(COUNTRIES, 3)],
+        }
+        if size == 1:
+            add_language(None, None, area)
+        else:
+            add_group(size, None, None, area)
+    # bookkeeping languoids are in the languoid table but not in the tree
+    for _ in range(max(1, n_languages // 100)):
+        add(random_name(rng), 'language', None, None, bookkeeping=True)
+    return languoids
+
+
+def _descendant_counts(languoids):
+    """Numbers of descendant families, languages and dialects of each."""
+    counts = [{'family': 0, 'language': 0, 'dialect': 0} for _ in languoids]
+    # children come after their parents in preorder
+    for i in reversed(range(len(languoids))):
+        parent = languoids[i]['parent']
+        if parent is not None and not languoids[i]['bookkeeping']:
+            for level, count in counts[i].items():
+                counts[parent][level] += count
+            counts[parent][languoids[i]['level']] += 1
+    return counts
+
+
+def newick_label(languoid):
+    """Quoted label of a languoid in the Glottolog newick tree."""
+    label = f"{languoid['name']} [{languoid['glottocode']}]"
+    if languoid['iso_639_3']:
+        label += f"[{languoid['iso_639_3']}]"
+    if languoid['level'] == 'language':
+        label += '-l-'
+    return "'" + label.replace("'", "''") + "'"
+
+
+def newick(languoids):
+    """The Glottolog newick tree of ``languoids``, one family per line."""
+    def subtree(i):
+        node = languoids[i]
+        out = newick_label(node) + ':1'
+        if node['children']:
+            out = '(' + ','.join(map(subtree, node['children'])) + ')' + out
+        return out
+
+    return '\n'.join(
+        subtree(i) + ';' for i, x in enumerate(languoids)
+        if x['parent'] is None and not x['bookkeeping'])
+
+
+def _csv(rows, header, delimiter=',', lineterminator='\r\n'):
+    """Write ``rows`` with ``header`` to a string."""
+    f = io.StringIO()
+    writer = csv.writer(f, delimiter=delimiter, lineterminator=lineterminator)
+    writer.writerow(header)
+    writer.writerows(rows)
+    return f.getvalue()
+
+
+def _coord(x):
+    """Coordinate as written in the sources; empty if missing."""
+    return '' if x is None else f"{x:.5f}"
+
+
+def write_glottolog(out_dir, languoids, rng):
+    """Write the Glottolog sources of ``languoids`` to ``out_dir``."""
+    paths = {x: os.path.join(out_dir, url_filename(y))
+             for x, y in glottolog.URLS.items()}
+    with open(paths['glottolog-newick'], 'w', encoding='utf-8') as f:
+        f.write(newick(languoids))
+
+    counts = _descendant_counts(languoids)
+    rows = []
+    for node, count in zip(languoids, counts):
+        parent = node['parent']
+        rows.append((
+            node['glottocode'],
+            node['family'] or '',
+            languoids[parent]['glottocode'] if parent is not None else '',
+            node['name'], node['bookkeeping'], node['level'],
+            node['status'], _coord(node['latitude']),
+            _coord(node['longitude']), node['iso_639_3'] or '', '', '',
+            count['family'], count['language'], count['dialect'],
+            ' '.join(node['countries']),
+        ))
+    header = ('id', 'family_id', 'parent_id', 'name', 'bookkeeping', 'level',
+              'status', 'latitude', 'longitude', 'iso639P3code',
+              'description', 'markup_description', 'child_family_count',
+              'child_language_count', 'child_dialect_count', 'country_ids')
+    with zipfile.ZipFile(paths['languoids'], 'w',
+                         zipfile.ZIP_DEFLATED) as z:
+        z.writestr('languoid.csv', _csv(rows, header))
+
+    rows = [(x['glottocode'], x['name'], x['iso_639_3'] or '', x['level'],
+             x['macroarea'] or '', _coord(x['latitude']),
+             _coord(x['longitude']))
+            for x in languoids if x['level'] != 'family']
+    header = ('glottocode', 'name', 'isocodes', 'level', 'macroarea',
+              'latitude', 'longitude')
+    with open(paths['lang_geo'], 'w', encoding='utf-8', newline='') as f:
+        f.write(_csv(rows, header))
+
+    resources = []
+    for node in languoids:
+        identifiers = []
+        if node['wals_code']:
+            identifiers.append({'type': 'wals',
+                                'identifier': node['wals_code']})
+        if node['iso_639_3']:
+            identifiers.append({'type': 'iso639-3',
+                                'identifier': node['iso_639_3']})
+        resources.append({'id': node['glottocode'], 'name': node['name'],
+                          'identifiers': identifiers})
+    with open(paths['resourcemap'], 'w', encoding='utf-8') as f:
+        json.dump({'properties': {}, 'resources': resources}, f)
+    return list(paths.values())
+
+
+def _mutate(word, n, rng):
+    """Apply ``n`` random substitutions, insertions or deletions."""
+    word = list(word)
+    for _ in range(n):
+        op = rng.random()
+        i = rng.randrange(len(word))
+        if op < .6 or len(word) < 3:
+            word[i] = rng.choice(ASJP_ALPHABET)
+        elif op < .8:
+            word.insert(i, rng.choice(ASJP_ALPHABET))
+        else:
+            del word[i]
+    return ''.join(word)
+
+
+def write_asjp(out_dir, languoids, rng, share=.5):
+    """Write the ASJP dataset of ``languoids`` to ``out_dir``.
+
+    About ``share`` of the languages and dialects have a wordlist. Their
+    words are derived by random sound changes from words of their genus,
+    the top-level subgroup of their family, which are derived from words
+    of their family.
+
+    """
+    meanings = list(asjp.load_meanings())
+    # genus of each languoid: the top-level subgroup or the root
+    genus = [None] * len(languoids)
+    for i, node in enumerate(languoids):
+        parent = node['parent']
+        if parent is None or languoids[parent]['parent'] is None:
+            genus[i] = i
+        else:
+            genus[i] = genus[parent]
+    root = [None] * len(languoids)
+    for i, node in enumerate(languoids):
+        root[i] = i if node['parent'] is None else root[node['parent']]
+
+    def random_word():
+        return ''.join(rng.choice(ASJP_ALPHABET)
+                       for _ in range(rng.randint(2, 6)))
+
+    words = {}
+
+    def words_of(i):
+        if i not in words:
+            if root[i] == i:
+                words[i] = [random_word() for _ in meanings]
+            else:
+                parent = genus[i] if genus[i] != i else root[i]
+                words[i] = [_mutate(x, rng.choice((0, 1, 1, 2)), rng)
+                            for x in words_of(parent)]
+        return words[i]
+
+    names = set()
+    rows = []
+    for i, node in enumerate(languoids):
+        if node['level'] not in ('language', 'dialect') or \
+                node['bookkeeping'] or rng.random() >= share:
+            continue
+        name = '_'.join(_ascii(x) for x in node['name'].split()).upper()
+        while name in names:
+            name += '_2'
+        names.add(name)
+        family = languoids[root[i]]
+        row = [name, _ascii(family['name']).upper()[:6] or 'X',
+               _ascii(languoids[genus[i]]['name']).upper(),
+               '', '', _coord(node['latitude'])[:-3],
+               _coord(node['longitude'])[:-3],
+               str(int(rng.lognormvariate(8, 2))),
+               node['wals_code'] or '', node['iso_639_3'] or '']
+        for word in words_of(genus[i]):
+            if rng.random() < .15:
+                row.append('')
+                continue
+            word = _mutate(word, rng.choice((0, 1, 1, 2, 3)), rng)
+            if rng.random() < .08:
+                word += ', ' + _mutate(word, 1, rng)
+            if rng.random() < .03:
+                word = '%' + word
+            row.append(word)
+        rows.append(row)
+    header = ['names', 'wls_fam', 'wls_gen', 'e', 'hh', 'lat', 'lon', 'pop',
+              'wcode', 'iso'] + meanings
+    path = os.path.join(out_dir, url_filename(asjp.URL))
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('dataset.tab', _csv(rows, header, '\t', '\n').encode(
+            'cp1252', errors='replace'))
+    return [path]
+
+
+def _inverted(name):
+    """Inverted form of a name, e.g. ``Tama, Northern``."""
+    first, _, rest = name.partition(' ')
+    return f"{rest}, {first}" if first in _DIRECTIONS and rest else name
+
+
+def write_iso_639_3(out_dir, languoids, rng):
+    """Write the ISO 639-3 code tables of ``languoids`` to ``out_dir``.
+
+    Besides the languages with ISO codes, there are macrolanguages grouping
+    some of them, special codes, and retired codes.
+
+    """
+    date = iso_639_3.CURRENT_DATE
+    languages = [x for x in languoids if x['iso_639_3']]
+    used = {x['iso_639_3'] for x in languages}
+    free = sorted(set(_product(string.ascii_lowercase, 3)) - used)
+    rng.shuffle(free)
+    types = {'extinct': 'X'}
+    part1 = iter(rng.sample(_product(string.ascii_lowercase, 2), 180))
+    codes = []
+    names = []
+    for x in languages:
+        p1 = next(part1, '') if rng.random() < .02 else ''
+        codes.append((x['iso_639_3'], '', '', p1, 'I',
+                      types.get(x['status'], 'L'), x['name'], ''))
+        names.append((x['iso_639_3'], x['name'], _inverted(x['name'])))
+        if rng.random() < .2:
+            name = random_name(rng)
+            names.append((x['iso_639_3'], name, name))
+    macrolanguages = []
+    for _ in range(max(1, len(languages) // 150)):
+        code = free.pop()
+        name = random_name(rng)
+        codes.append((code, '', '', '', 'M', 'L', name, ''))
+        names.append((code, name, name))
+        for member in rng.sample(languages, min(len(languages),
+                                                rng.randint(2, 8))):
+            macrolanguages.append((code, member['iso_639_3'], 'A'))
+    for code, name in (('mis', 'Uncoded languages'),
+                       ('mul', 'Multiple languages'),
+                       ('und', 'Undetermined'),
+                       ('zxx', 'No linguistic content')):
+        if code in free:
+            free.remove(code)
+            codes.append((code, code, code, '', 'S', 'S', name, ''))
+            names.append((code, name, name))
+    retirements = []
+    for _ in range(max(1, len(languages) // 30)):
+        reason = rng.choice('CDNSM')
+        change_to = rng.choice(languages)['iso_639_3'] if reason in 'CDM' \
+            else ''
+        remedy = (f"Split into {random_name(rng)} and {random_name(rng)}"
+                  if reason == 'S' else '')
+        retirements.append((
+            free.pop(), random_name(rng), reason, change_to, remedy,
+            f"{rng.randint(2007, 2017)}-01-{rng.randint(10, 28)}"))
+    tables = {
+        f'iso-639-3_{date}.tab': (
+            ('Id', 'Part2B', 'Part2T', 'Part1', 'Scope', 'Language_Type',
+             'Ref_Name', 'Comment'), codes),
+        f'iso-639-3_Name_Index_{date}.tab': (
+            ('Id', 'Print_Name', 'Inverted_Name'), names),
+        f'iso-639-3-macrolanguages_{date}.tab': (
+            ('M_Id', 'I_Id', 'I_Status'), macrolanguages),
+        f'iso-639-3_Retirements_{date}.tab': (
+            ('Id', 'Ref_Name', 'Ret_Reason', 'Change_To', 'Ret_Remedy',
+             'Effective'), retirements),
+    }
+    path = os.path.join(out_dir,
+                        url_filename(iso_639_3.iso_639_3_url(date)))
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        for filename, (header, rows) in tables.items():
+            # the tables end with empty lines
+            z.writestr(f'iso-639-3_Code_Tables_{date}/{filename}',
+                       _csv(sorted(rows), header, '\t') + '\r\n')
+    return [path]
+
+
+def write_ethnologue(out_dir, languoids, rng):
+    """Write the Ethnologue code tables of ``languoids`` to ``out_dir``."""
+    languages = [x for x in languoids if x['iso_639_3']]
+    codes = []
+    index = set()
+    for x in languages:
+        countries = x['countries'] or [rng.choice(COUNTRIES)[0]]
+        status = 'X' if x['status'] == 'extinct' else 'L'
+        codes.append((x['iso_639_3'], countries[0], status, x['name']))
+        for country in countries:
+            index.add((x['iso_639_3'], country, 'L', x['name']))
+        for _ in range(rng.choice((0, 0, 1, 2, 4))):
+            index.add((x['iso_639_3'], countries[0],
+                       rng.choice(('LA', 'LA', 'LA', 'LP')),
+                       random_name(rng)))
+        for i in x['children']:
+            dialect = languoids[i]['name']
+            index.add((x['iso_639_3'], countries[0], 'D', dialect))
+            if rng.random() < .2:
+                index.add((x['iso_639_3'], countries[0], 'DA',
+                           random_name(rng)))
+    # some names are missing
+    for x in rng.sample(languages, min(3, len(languages))):
+        index.add((x['iso_639_3'], codes[0][1], 'LA', ''))
+    tables = {
+        'CountryCodes': (('CountryID', 'Name', 'Area'), COUNTRIES),
+        'LanguageCodes': (('LangID', 'CountryID', 'LangStatus', 'Name'),
+                          codes),
+        'LanguageIndex': (('LangID', 'CountryID', 'NameType', 'Name'),
+                          index),
+    }
+    date = ethnologue.CURRENT_DATE
+    path = os.path.join(out_dir,
+                        url_filename(ethnologue.ethnologue_url(date)))
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        for table, (header, rows) in tables.items():
+            z.writestr(f'{table}.tab', _csv(sorted(rows), header, '\t'))
+    return [path]
+
+
+WRITERS = {
+    'glottolog': write_glottolog,
+    'asjp': write_asjp,
+    'iso_639_3': write_iso_639_3,
+    'ethnologue': write_ethnologue,
+}
+"""Function writing the files of each source."""
+
+
+def generate(out_dir, scale=1., seed=0, sources=SOURCES):
+    """Write synthetic sources to directory ``out_dir``.
+
+    Parameters
+    ----------
+    out_dir: str
+        Output directory, which can be used as a mirror.
+    scale: float
+        Size of the data; at scale 1 there are :data:`LANGUAGES`
+        languages.
+    seed: int
+        Seed of the random number generator. The same seed and scale
+        always give the same data.
+    sources: list
+        Sources to generate, from :data:`SOURCES`.
+
+    Returns
+    -------
+    list
+        Paths of the files written.
+
+    """
+    rng = random.Random(seed)
+    languoids = make_languoids(max(2, math.ceil(LANGUAGES * scale)), rng)
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for source in sources:
+        # a generator for each source, so that they do not depend on
+        # which others are generated
+        paths += WRITERS[source](out_dir, languoids,
+                                 random.Random(f"{seed}-{source}"))
+    return paths
+
+
+def main():
+    """Command line interface."""
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic source data.")
+    parser.add_argument("out_dir", help="Output directory.")
+    parser.add_argument("--scale", type=float, default=1.,
+                        help="Size of the data; 1 is about the size of "
+                        "Glottolog.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Random seed.")
+    parser.add_argument("--sources", nargs="+", choices=SOURCES,
+                        default=SOURCES, help="Sources to generate.")
+    args = parser.parse_args()
+    for path in generate(args.out_dir, args.scale, args.seed, args.sources):
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,336 @@
+"""Compact array representation of the Glottolog language tree.
+
+The tree, or rather forest of language families, is stored as flat NumPy
+arrays indexed by the position of each node in a preorder traversal. This
+supports constant time ancestor and lowest common ancestor (LCA) queries,
+and is much smaller than lists of the ancestors and descendants of each
+node.
+
+"""
+import re
+
+import numpy as np
+
+NODE_PATTERN = re.compile(r"""^
+    (?P<name> .* ) [ ]
+    \[ (?P<glottocode> [a-z0-9]{8} ) \]
+    (?: \[ (?P<iso_639_3> [a-z]{3} ) \] ) ?
+    (?P<language> -l- ) ?
+$""", re.X)
+"""Pattern of the node labels of the Glottolog newick tree."""
+
+TOKEN_PATTERN = re.compile(r"""\s*(?:
+    (?P<label> '(?:[^']|'')*' | [^'(),:;\s]+ )
+    | (?P<length> :[^'(),:;\s]* )
+    | (?P<punct> [(),;] )
+)""", re.X)
+"""Pattern of the tokens of a newick tree."""
+
+CHUNKSIZE = 2**16
+"""Number of characters read at a time by :func:`read_newick`."""
+
+
+def newick_tokens(f, chunksize=CHUNKSIZE):
+    """Tokenize a newick tree read from text file ``f``.
+
+    Yields ``(kind, token)`` tuples, with ``kind`` one of ``'label'``,
+    ``'length'`` and ``'punct'``, while reading ``chunksize`` characters at
+    a time.
+
+    """
+    buffer = ''
+    eof = False
+    while not eof:
+        chunk = f.read(chunksize)
+        eof = not chunk
+        buffer += chunk
+        pos = 0
+        while True:
+            m = TOKEN_PATTERN.match(buffer, pos)
+            # a token at the end of the buffer can continue in the next chunk
+            if m is None or (m.end() == len(buffer) and not eof):
+                break
+            pos = m.end()
+            yield m.lastgroup, m.group(m.lastgroup)
+        buffer = buffer[pos:]
+        if eof and buffer.strip():
+            raise ValueError(f"invalid newick near {buffer[:50]!r}")
+
+
+def parse_label(label):
+    """Parse the label of a node in the Glottolog newick tree."""
+    if label.startswith("'"):
+        label = label[1:-1].replace("''", "'")
+    m = NODE_PATTERN.match(label)
+    if m is None:
+        raise ValueError(f"invalid node label {label!r}")
+    return m.group('glottocode', 'name', 'iso_639_3', 'language')
+
+
+def read_newick(f, chunksize=CHUNKSIZE):
+    """Parse the Glottolog newick tree into arrays.
+
+    Parameters
+    ----------
+    f: str or file
+        Path to the newick file, or a text file object or stream. Each
+        tree in it is a language family.
+    chunksize: int
+        Number of characters read at a time.
+
+    Returns
+    -------
+    dict
+        Arrays with the ``glottocode``, ``name``, ``iso_639_3`` code (or an
+        empty string), whether the node is a ``language``, and the index of
+        the ``parent`` (or -1) of each node, in preorder.
+
+    The file is parsed in one pass without building the tree in memory.
+
+    """
+    if isinstance(f, str):
+        with open(f, 'r', encoding='utf-8') as fh:
+            return read_newick(fh, chunksize=chunksize)
+    labels = []
+    parent = []
+    stack = []
+    # index of the node whose label comes next
+    last = None
+    for kind, token in newick_tokens(f, chunksize=chunksize):
+        if kind == 'punct':
+            if token == '(':
+                stack.append(len(parent))
+                parent.append(stack[-2] if len(stack) > 1 else -1)
+                labels.append(None)
+                last = None
+            elif token == ')':
+                last = stack.pop()
+            else:
+                last = None
+                if token == ';' and stack:
+                    raise ValueError("unbalanced parentheses in newick")
+        elif kind == 'label':
+            if last is None:
+                last = len(parent)
+                parent.append(stack[-1] if stack else -1)
+                labels.append(None)
+            labels[last] = token
+    if None in labels:
+        raise ValueError("unlabeled node in newick")
+    nodes = [parse_label(x) for x in labels]
+    return {
+        'glottocode': np.array([x[0] for x in nodes], dtype=str),
+        'name': np.array([x[1] for x in nodes], dtype=str),
+        'iso_639_3': np.array([x[2] or '' for x in nodes], dtype=str),
+        'language': np.array([x[3] is not None for x in nodes], dtype=bool),
+        'parent': np.array(parent, dtype=np.int32),
+    }
+
+
+class ArrayTree:
+    """Forest stored as arrays of nodes in preorder.
+
+    Parameters
+    ----------
+    codes: list
+        Glottocodes of the nodes, in preorder.
+    parent: :py:class:`~numpy.array`
+        Index of the parent of each node, or -1 for the roots. The parent
+        of a node must come before it.
+
+    Nodes can be given to the methods either as Glottocodes or as integer
+    indices into :attr:`codes`, and as scalars or arrays.
+
+    Attributes
+    ----------
+    size: :py:class:`~numpy.array`
+        Number of nodes in the subtree of each node, including the node.
+        The subtree of node ``i`` is the nodes ``i`` to ``i + size[i] - 1``.
+    depth: :py:class:`~numpy.array`
+        Depth of each node; roots have a depth of 1.
+    post: :py:class:`~numpy.array`
+        Postorder index of each node. Together with the preorder index, this
+        gives the nested set intervals of the nodes.
+    root: :py:class:`~numpy.array`
+        Index of the root of the tree of each node.
+    euler: :py:class:`~numpy.array`
+        Euler tour of the forest, and the index of the first occurrence of
+        each node in it, in :attr:`first`.
+    sparse: :py:class:`~numpy.array`
+        Sparse table with the shallowest node of each ``2 ** k`` long
+        interval of the Euler tour in row ``k``.
+
+    """
+
+    ARRAYS = ('parent', 'size', 'depth', 'post', 'root', 'euler', 'first',
+              'sparse')
+    """Arrays stored by :meth:`save`."""
+
+    def __init__(self, codes, parent):
+        parent = np.asarray(parent, dtype=np.int32)
+        n = len(parent)
+        if np.any(parent >= np.arange(n)):
+            raise ValueError("nodes must be in preorder")
+        self.codes = np.asarray(codes, dtype=str)
+        self.parent = parent
+        # depth and subtree sizes, one level of the tree at a time
+        self.depth = np.ones(n, dtype=np.int32)
+        anc = parent
+        while np.any(anc >= 0):
+            self.depth += anc >= 0
+            anc = np.where(anc >= 0, parent[anc], -1)
+        self.size = np.ones(n, dtype=np.int32)
+        for d in range(int(self.depth.max(initial=1)), 1, -1):
+            nodes = np.flatnonzero(self.depth == d)
+            np.add.at(self.size, parent[nodes], self.size[nodes])
+        self.post = np.arange(n, dtype=np.int32) + self.size - self.depth
+        self.root = np.maximum.accumulate(
+            np.where(parent < 0, np.arange(n, dtype=np.int32), 0))
+        self.euler, self.first = self._euler_tour()
+        self.sparse = self._sparse_table()
+        self.index = {x: i for i, x in enumerate(self.codes.tolist())}
+
+    def _euler_tour(self):
+        """Euler tour and first occurrence of each node."""
+        euler = []
+        first = np.zeros(len(self), dtype=np.int32)
+        stack = []
+        for i, p in enumerate(self.parent.tolist()):
+            # return to the parent, emitting every node on the way up
+            while stack and stack[-1] != p:
+                stack.pop()
+                if stack:
+                    euler.append(stack[-1])
+            first[i] = len(euler)
+            euler.append(i)
+            stack.append(i)
+        while stack:
+            stack.pop()
+            if stack:
+                euler.append(stack[-1])
+        return np.array(euler, dtype=np.int32), first
+
+    def _sparse_table(self):
+        """Sparse table for range minimum queries on the Euler tour."""
+        m = len(self.euler)
+        levels = max(m, 1).bit_length()
+        table = np.zeros((levels, m), dtype=np.int32)
+        table[0] = self.euler
+        for k in range(1, levels):
+            half = 1 << (k - 1)
+            width = m - (1 << k) + 1
+            a = table[k - 1, :width]
+            b = table[k - 1, half:half + width]
+            table[k, :width] = np.where(self.depth[a] <= self.depth[b], a, b)
+        return table
+
+    @classmethod
+    def from_parents(cls, codes, parent):
+        """Create a tree from nodes in any order.
+
+        ``parent`` is the index of the parent of each node in ``codes``, or
+        -1 for the roots. Children are kept in the order they are given.
+
+        """
+        parent = np.asarray(parent).tolist()
+        children = [[] for _ in parent]
+        roots = []
+        for i, p in enumerate(parent):
+            (children[p] if p >= 0 else roots).append(i)
+        order = []
+        stack = roots[::-1]
+        while stack:
+            i = stack.pop()
+            order.append(i)
+            stack.extend(reversed(children[i]))
+        new = np.empty(len(parent), dtype=np.int32)
+        new[order] = np.arange(len(order))
+        return cls([codes[i] for i in order],
+                   [new[parent[i]] if parent[i] >= 0 else -1 for i in order])
+
+    def save(self, path):
+        """Save the tree to a ``.npz`` file."""
+        np.savez(path, codes=self.codes,
+                 **{x: getattr(self, x) for x in self.ARRAYS})
+
+    @classmethod
+    def load(cls, path):
+        """Load a tree saved with :meth:`save`."""
+        self = cls.__new__(cls)
+        with np.load(path) as f:
+            self.codes = f['codes']
+            for x in cls.ARRAYS:
+                setattr(self, x, f[x])
+        self.index = {x: i for i, x in enumerate(self.codes.tolist())}
+        return self
+
+    def __len__(self):
+        return len(self.parent)
+
+    def indices(self, nodes):
+        """Convert Glottocodes or indices to an array of indices."""
+        nodes = np.asarray(nodes)
+        if nodes.dtype.kind in 'iu':
+            return nodes
+        return np.vectorize(self.index.__getitem__, otypes=[np.int32])(nodes)
+
+    def is_ancestor(self, a, b):
+        """Check if ``a`` is a proper ancestor of ``b``."""
+        a, b = self.indices(a), self.indices(b)
+        return (a < b) & (b < a + self.size[a])
+
+    def lca(self, a, b):
+        """Index of the lowest common ancestor of ``a`` and ``b``.
+
+        A node is its own ancestor here, so the LCA of a node and one of its
+        descendants is the node. Returns -1 for nodes in different trees.
+
+        """
+        a, b = self.indices(a), self.indices(b)
+        lo = np.minimum(self.first[a], self.first[b])
+        hi = np.maximum(self.first[a], self.first[b])
+        k = np.log2(hi - lo + 1).astype(np.int64)
+        x = self.sparse[k, lo]
+        y = self.sparse[k, hi - (1 << k) + 1]
+        out = np.where(self.depth[x] <= self.depth[y], x, y)
+        return np.where(self.root[a] == self.root[b], out, -1)
+
+    def shared_ancestors(self, a, b):
+        """Number of proper ancestors shared by ``a`` and ``b``."""
+        a, b = self.indices(a), self.indices(b)
+        lca = self.lca(a, b)
+        shared = self.depth[lca] - ((lca == a) | (lca == b))
+        return np.where(lca >= 0, shared, 0)
+
+    def subtree(self, a):
+        """Indices of the nodes in the subtree of ``a``, including ``a``."""
+        a = int(self.indices(a))
+        return np.arange(a, a + self.size[a])
+
+    def levels(self):
+        """Indices of the nodes at each depth, starting with the roots."""
+        order = np.argsort(self.depth, kind='stable')
+        bounds = np.searchsorted(self.depth[order],
+                                 np.arange(2, self.depth.max(initial=0) + 1))
+        return np.split(order, bounds)
+
+    def paths(self):
+        """Pairs of nodes and their ancestors.
+
+        Yields
+        ------
+        (nodes, ancestors, dist): tuple of :py:class:`~numpy.array`
+            Each node with its ancestors ``dist`` levels up, for
+            ``dist = 1, 2, ...``.
+
+        """
+        nodes = np.arange(len(self), dtype=np.int32)
+        anc = self.parent
+        dist = 1
+        while len(nodes):
+            keep = anc >= 0
+            nodes, anc = nodes[keep], anc[keep]
+            if len(nodes):
+                yield nodes, anc, dist
+            anc = self.parent[anc]
+            dist += 1
@@ -1,5 +1,21 @@
 """Utility functions used in by the other modules."""
+import contextlib
+import cProfile
+import fcntl
+import hashlib
+import io
+import itertools
+import json
+import os
 import os.path
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
 
 import requests
 
@@ -7,6 +23,38 @@ import requests
 DOWNLOAD_DIR = "downloads"
 """Default name of the directory to cach download files."""
 
+MANIFEST = "MANIFEST.json"
+"""Name of the file with the checksums of the files in a download directory.
+"""
+
+CHUNK_SIZE = 2**20
+"""Number of bytes written at a time when downloading a file."""
+
+TIMEOUT = 60
+"""Timeout in seconds of HTTP requests."""
+
+MIRROR_ENV = "LINGDATA_MIRROR"
+"""Environment variable with the root URL or directory of a mirror.
+
+If it is set, files are downloaded from the mirror instead of their
+original URL. The mirror has the files under the same names as in the
+download directory, e.g. ``file:///srv/lingdata/downloads``.
+
+"""
+
+OFFLINE_ENV = "LINGDATA_OFFLINE"
+"""Environment variable which, if set to a non-empty value, disables
+downloads; only files already in the download directory are used."""
+
+REVALIDATE_ENV = "LINGDATA_REVALIDATE"
+"""Environment variable which, if set to a non-empty value, checks whether
+cached files are up to date with their source."""
+
+TSV_CHUNKSIZE = 10000
+"""Number of rows inserted at a time by :func:`insert_tsv`."""
+
+_manifest_lock = threading.Lock()
+
 
 def set_sql_opts(con):
     """Set SQL options to speed up loading data."""
@@ -21,12 +69,432 @@ def unset_sql_opts(con):
     con.execute("PRAGMA journal_mode=WAL")
 
 
-def download_file(url, dst):
-    """Download ``url`` to ``dst`` if ``dst`` does not exist."""
+def column_types(conn, table):
+    """Python types of the columns of ``table``, keyed by name.
+
+    Uses the rules of SQLite column affinity: ``int`` for integer columns,
+    ``float`` for real columns, and ``str`` for the others. Numeric
+    columns, such as dates, are left to SQLite to convert.
+
+    """
+    types = {}
+    for _, name, decltype, *_ in conn.execute(f"PRAGMA table_info({table})"):
+        decltype = (decltype or '').upper()
+        if 'INT' in decltype:
+            types[name] = int
+        elif any(x in decltype for x in ('CHAR', 'CLOB', 'TEXT')):
+            types[name] = str
+        elif any(x in decltype for x in ('REAL', 'FLOA', 'DOUB')):
+            types[name] = float
+        else:
+            types[name] = str
+    return types
+
+
+def read_tsv(f, types, skip_missing=()):
+    """Read a tab-separated table from binary file ``f``.
+
+    Parameters
+    ----------
+    f: file
+        Binary file of UTF-8 text, e.g. a member of a zip file. The first
+        line has the column names.
+    types: dict
+        Type of each column, as from :func:`column_types`.
+    skip_missing: list
+        Rows with missing values in these columns are skipped.
+
+    Returns
+    -------
+    (columns, rows): tuple
+        The column names, and an iterator over the rows as tuples of
+        values converted to their type.
+
+    The lines are read one at a time, and blank lines are skipped. Only
+    empty values are missing, and read as ``None``; in particular ``NA``
+    is the country code of Namibia.
+
+    """
+    lines = (x.rstrip('\r\n') for x in io.TextIOWrapper(f, 'utf-8-sig')
+             if x.strip())
+    columns = next(lines, '').split('\t')
+    unknown = [x for x in columns if x not in types]
+    if unknown:
+        raise ValueError("unknown columns: " + ", ".join(unknown))
+    converters = [(i, types[x]) for i, x in enumerate(columns)
+                  if types[x] is not str]
+    skip = [columns.index(x) for x in skip_missing]
+
+    def rows():
+        for line in lines:
+            values = line.split('\t')
+            if len(values) > len(columns):
+                raise ValueError(f"too many values in line {line!r}")
+            # trailing empty values can be left out
+            values += [''] * (len(columns) - len(values))
+            if any(values[i] == '' for i in skip):
+                continue
+            for i, type_ in converters:
+                if values[i] != '':
+                    values[i] = type_(values[i])
+            yield tuple(None if x == '' else x for x in values)
+
+    return columns, rows()
+
+
+def insert_tsv(conn, table, f, skip_missing=(), chunksize=TSV_CHUNKSIZE):
+    """Insert a tab-separated table from binary file ``f`` into ``table``.
+
+    The values are converted to the declared types of the columns, and
+    inserted ``chunksize`` rows at a time, so memory use does not depend on
+    the size of the table. See :func:`read_tsv` for the format and
+    ``skip_missing``. The rows are not committed, so that several tables
+    can be inserted in one transaction.
+
+    Returns the number of rows inserted.
+
+    """
+    columns, rows = read_tsv(f, column_types(conn, table), skip_missing)
+    sql = (f"INSERT INTO {table} ({', '.join(columns)}) "
+           f"VALUES ({', '.join('?' * len(columns))})")
+    count = 0
+    while True:
+        chunk = list(itertools.islice(rows, chunksize))
+        if not chunk:
+            return count
+        conn.executemany(sql, chunk)
+        count += len(chunk)
+
+
+def url_filename(url):
+    """Name of the file that ``url`` is downloaded to."""
+    return os.path.basename(urllib.parse.urlsplit(url).path)
+
+
+def mirror_url(url, mirror=None):
+    """URL to download ``url`` from.
+
+    ``mirror`` defaults to the value of :data:`MIRROR_ENV`. It can be a URL
+    or the path of a directory.
+
+    """
+    if mirror is None:
+        mirror = os.environ.get(MIRROR_ENV)
+    if not mirror:
+        return url
+    if not urllib.parse.urlsplit(mirror).scheme:
+        mirror = urllib.parse.urljoin(
+            'file:', urllib.request.pathname2url(os.path.abspath(mirror)))
+    return mirror.rstrip('/') + '/' + url_filename(url)
+
+
+def sha256sum(path):
+    """SHA-256 checksum of the file ``path``."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def read_manifest(dst):
+    """Read the manifest of download directory ``dst``.
+
+    Returns
+    -------
+    dict
+        For each file name, a dict with its ``url``, ``sha256`` checksum,
+        ``size`` and modification time (``mtime_ns``) when the checksum was
+        computed, and the ``etag`` and ``last_modified`` headers of the
+        response.
+
+    """
+    try:
+        with open(os.path.join(dst, MANIFEST), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def file_stat(path):
+    """Size and modification time of ``path``, as in the manifest."""
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def update_manifest(dst, filename, entry):
+    """Set the manifest entry of ``filename`` in download directory ``dst``.
+
+    The entry is removed if ``entry`` is ``None``.
+
+    """
+    # the stages download in separate processes, which may update the
+    # same manifest at the same time
+    with _manifest_lock, \
+            open(os.path.join(dst, MANIFEST + '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        manifest = read_manifest(dst)
+        if entry is None:
+            manifest.pop(filename, None)
+        else:
+            manifest[filename] = entry
+        fd, tmp = tempfile.mkstemp(prefix=MANIFEST + '.', dir=dst)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                # mkstemp only lets the owner read the file
+                os.fchmod(f.fileno(), 0o644)
+                json.dump(manifest, f, indent=2, sort_keys=True)
+            os.replace(tmp, os.path.join(dst, MANIFEST))
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+
+def _copy_file(source, part):
+    """Copy the local file at URL ``source`` to ``part``."""
+    path = urllib.request.url2pathname(urllib.parse.urlsplit(source).path)
+    with open(path, 'rb') as src, open(part, 'wb') as f:
+        shutil.copyfileobj(src, f, CHUNK_SIZE)
+    return {}
+
+
+def _http_download(source, part, validators):
+    """Download ``source`` to ``part``.
+
+    An existing ``part`` is resumed if the server supports range requests
+    and the file has not changed since. ``validators`` are the ``etag`` and
+    ``last_modified`` headers of a complete copy of the file; if the file
+    has not changed since then, nothing is downloaded and ``None`` is
+    returned. Otherwise, returns the headers of the response.
+
+    """
+    headers = {'Accept-Encoding': 'identity'}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    if offset and os.path.exists(part + '.json'):
+        # headers of the response the partial download came from
+        with open(part + '.json', 'r') as f:
+            partial = json.load(f)
+        if partial.get('etag') or partial.get('last_modified'):
+            headers['Range'] = f'bytes={offset}-'
+            headers['If-Range'] = partial.get('etag') or partial.get(
+                'last_modified')
+    with requests.get(source, headers=headers, stream=True,
+                      timeout=TIMEOUT) as r:
+        if r.status_code == 304:
+            return None
+        if r.status_code == 416:
+            # the partial download is no longer valid
+            os.remove(part)
+            return _http_download(source, part, validators)
+        r.raise_for_status()
+        out = {
+            'etag': r.headers.get('ETag'),
+            'last_modified': r.headers.get('Last-Modified')
+        }
+        with open(part + '.json', 'w') as f:
+            json.dump(out, f)
+        with open(part, 'ab' if r.status_code == 206 else 'wb') as f:
+            for chunk in r.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+    os.remove(part + '.json')
+    return out
+
+
+def download_file(url, dst, sha256=None, revalidate=None, offline=None):
+    """Download ``url`` to directory ``dst``, unless it is already there.
+
+    Parameters
+    ----------
+    url: str
+        URL of the file.
+    dst: str
+        Download directory.
+    sha256: str
+        Expected SHA-256 checksum of the file.
+    revalidate: bool
+        If true, download the file again if it changed at the source. The
+        default is the value of :data:`REVALIDATE_ENV`.
+    offline: bool
+        If true, only use files that are already in ``dst``. The default
+        is the value of :data:`OFFLINE_ENV`.
+
+    Returns
+    -------
+    str
+        Path to the downloaded file.
+
+    Files are streamed to disk, to a ``.part`` file which is resumed if the
+    download is interrupted. The checksums of the downloaded files are
+    recorded in the :data:`MANIFEST` of ``dst``, and cached files are
+    checked against them if their size or modification time changed, or
+    if ``revalidate`` is true. Files are downloaded from the mirror in
+    :data:`MIRROR_ENV` if it is set.
+
+    """
+    if revalidate is None:
+        revalidate = bool(os.environ.get(REVALIDATE_ENV))
+    if offline is None:
+        offline = bool(os.environ.get(OFFLINE_ENV))
     os.makedirs(dst, exist_ok=True)
-    downloaded_file = os.path.join(dst, os.path.basename(url))
-    if not os.path.exists(downloaded_file):
-        r = requests.get(url, stream=True)
-        with open(downloaded_file, 'wb') as f:
-            f.write(r.content)
+    filename = url_filename(url)
+    downloaded_file = os.path.join(dst, filename)
+    entry = read_manifest(dst).get(filename, {})
+    expected = sha256 or entry.get('sha256')
+    validators = {}
+    if os.path.exists(downloaded_file):
+        stat = file_stat(downloaded_file)
+        # the file was not modified since its checksum was recorded
+        if (entry and not revalidate and expected == entry.get('sha256')
+                and all(entry.get(k) == v for k, v in stat.items())):
+            return downloaded_file
+        checksum = sha256sum(downloaded_file)
+        if expected and checksum != expected:
+            if offline:
+                raise ValueError(f"{downloaded_file} has checksum {checksum}, "
+                                 f"expected {expected}")
+        elif not revalidate or offline:
+            new_entry = dict(entry, url=url, sha256=checksum, **stat)
+            if new_entry != entry:
+                update_manifest(dst, filename, new_entry)
+            return downloaded_file
+        else:
+            validators = entry
+    if offline:
+        raise FileNotFoundError(f"{downloaded_file} is not downloaded and "
+                                f"{OFFLINE_ENV} is set")
+    source = mirror_url(url)
+    part = downloaded_file + '.part'
+    if urllib.parse.urlsplit(source).scheme == 'file':
+        headers = _copy_file(source, part)
+    else:
+        headers = _http_download(source, part, validators)
+        if headers is None:
+            return downloaded_file
+    checksum = sha256sum(part)
+    if sha256 and checksum != sha256:
+        os.remove(part)
+        raise ValueError(f"{source} has checksum {checksum}, expected "
+                         f"{sha256}")
+    os.replace(part, downloaded_file)
+    update_manifest(dst, filename, dict(headers, url=url, sha256=checksum,
+                                        **file_stat(downloaded_file)))
     return downloaded_file
+
+
+def max_rss():
+    """Peak resident set size of this process in MiB."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KiB elsewhere
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+
+
+def _cpu_time(who):
+    """User and system CPU time of ``who`` in seconds."""
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+class StageTimer:
+    """Measure the time and memory of each stage of a build.
+
+    Parameters
+    ----------
+    name: str
+        Name of the build, e.g. ``'glottolog'``.
+    profile_dir: str
+        If given, each stage is profiled with :py:mod:`cProfile` and its
+        statistics saved to ``<profile_dir>/<name>.<stage>.prof``.
+
+    Use :meth:`stage` around each stage, then :meth:`write` the report.
+
+    """
+
+    def __init__(self, name, profile_dir=None):
+        self.name = name
+        self.profile_dir = profile_dir
+        self.stages = []
+
+    @contextlib.contextmanager
+    def stage(self, stage):
+        """Measure the stage ``stage``.
+
+        Use as ``with timer.stage('insert') as record: ...``. ``record`` is
+        a dict to which the stage can add the number of ``rows`` it
+        processed. Once the stage is done, it has the ``wall`` and ``cpu``
+        time in seconds, including the CPU time of child processes that
+        finished (``cpu_children``), the peak RSS of the process and its
+        increase during the stage in MiB, and ``rows_per_second``.
+
+        """
+        record = {'stage': stage, 'rows': None}
+        profiler = None
+        if self.profile_dir:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            profiler = cProfile.Profile()
+        rss = max_rss()
+        cpu = _cpu_time(resource.RUSAGE_SELF)
+        cpu_children = _cpu_time(resource.RUSAGE_CHILDREN)
+        start = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(os.path.join(
+                    self.profile_dir,
+                    f"{self.name}.{stage.replace(' ', '_')}.prof"))
+            wall = time.perf_counter() - start
+            record.update({
+                'wall': wall,
+                'cpu': _cpu_time(resource.RUSAGE_SELF) - cpu,
+                'cpu_children':
+                _cpu_time(resource.RUSAGE_CHILDREN) - cpu_children,
+                'max_rss': max_rss(),
+                'rss_increase': max_rss() - rss,
+                'rows_per_second':
+                record['rows'] / wall if record['rows'] and wall else None,
+            })
+            self.stages.append(record)
+            print(self.format(record))
+
+    def format(self, record):
+        """One line summary of a stage."""
+        out = (f"{self.name}: {record['stage']}: {record['wall']:.2f} s, "
+               f"CPU {record['cpu'] + record['cpu_children']:.2f} s, "
+               f"max RSS {record['max_rss']:.0f} MiB")
+        if record['rows'] is not None:
+            out += f", {record['rows']} rows"
+        if record['rows_per_second']:
+            out += f" ({record['rows_per_second']:.0f}/s)"
+        return out
+
+    def report(self):
+        """Report of all the stages as a dict."""
+        return {
+            'name': self.name,
+            'stages': self.stages,
+            'wall': sum(x['wall'] for x in self.stages),
+            'cpu': sum(x['cpu'] + x['cpu_children'] for x in self.stages),
+            'max_rss': max_rss(),
+        }
+
+    def write(self, path):
+        """Write the :meth:`report` to ``path`` as JSON."""
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+
+def add_timer_arguments(parser):
+    """Add the ``--report`` and ``--profile`` options to ``parser``."""
+    parser.add_argument("--report", metavar="FILE",
+                        help="Write the time and memory used by each stage "
+                        "to FILE as JSON.")
+    parser.add_argument("--profile", metavar="DIR",
+                        help="Save cProfile statistics of each stage to "
+                        "DIR/<name>.<stage>.prof.")
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""Typological distances between WALS languages.
+
+The ``features`` distances in ``wals.db`` are computed by ``bin/wals.R``
+for all features at once. This module computes them for any set of
+languages and features, or with other weights, from ``language_features``.
+
+The feature values are an integer matrix of languages by features, with 0
+for missing values. For the distances, each feature is expanded into
+indicator columns by :func:`encode`, one per value for ``hamming``
+distances and one per threshold between values for ``gower`` distances, so
+that the distances of a block of languages to all the others are a few
+matrix products. Only the features observed for both languages of a pair
+are compared.
+
+"""
+import argparse
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+METRICS = ('hamming', 'gower')
+"""Distances between feature values.
+
+``hamming``
+    0 if the values are the same, 1 otherwise; the values are nominal.
+``gower``
+    The difference of the values divided by the range of the feature; the
+    values are ordinal.
+
+"""
+
+BLOCKSIZE = 256
+"""Default number of languages in each block of distances."""
+
+
+class FeatureMatrix:
+    """WALS feature values of languages.
+
+    Parameters
+    ----------
+    languages: array
+        WALS codes of the languages, sorted.
+    features: array
+        Feature IDs, e.g. ``1A``.
+    values: :py:class:`numpy.ndarray`
+        Integer values of shape ``(len(languages), len(features))``, 0 for
+        missing values.
+
+    """
+
+    def __init__(self, languages, features, values):
+        self.languages = np.asarray(languages)
+        self.features = np.asarray(features)
+        self.values = values
+
+    @classmethod
+    def from_db(cls, db, languages=None, features=None):
+        """Load the feature values of WALS database ``db``.
+
+        Only the values of ``languages`` and ``features`` are loaded, if
+        given. Languages without any of the features are dropped.
+
+        """
+        conn = sqlite3.connect(db)
+        rows = conn.execute("SELECT wals_code, feature_id, value "
+                            "FROM language_features").fetchall()
+        conn.close()
+        if languages is not None:
+            languages = set(languages)
+            rows = [x for x in rows if x[0] in languages]
+        if features is not None:
+            features = set(features)
+            rows = [x for x in rows if x[1] in features]
+        codes, lang_index = np.unique([x[0] for x in rows],
+                                      return_inverse=True)
+        feature_ids = sorted({x[1] for x in rows},
+                             key=lambda x: (int(x[:-1]), x[-1]))
+        feature_index = {x: i for i, x in enumerate(feature_ids)}
+        values = np.zeros((len(codes), len(feature_ids)), dtype=np.int8)
+        values[lang_index.reshape(-1),
+               [feature_index[x[1]] for x in rows]] = [x[2] for x in rows]
+        return cls(codes, np.array(feature_ids), values)
+
+    def subset(self, languages=None, features=None):
+        """Feature values of ``languages`` and ``features`` only."""
+        rows = slice(None)
+        cols = slice(None)
+        if languages is not None:
+            rows = np.flatnonzero(np.isin(self.languages, list(languages)))
+        if features is not None:
+            cols = np.flatnonzero(np.isin(self.features, list(features)))
+        return FeatureMatrix(self.languages[rows], self.features[cols],
+                             self.values[rows][:, cols])
+
+
+def encode(values, metric='hamming', weights=None):
+    """Encode feature ``values`` as indicator columns.
+
+    Parameters
+    ----------
+    values: :py:class:`numpy.ndarray`
+        Feature values, as :attr:`FeatureMatrix.values`.
+    metric: str
+        One of :data:`METRICS`.
+    weights: array
+        Weight of each feature. Defaults to 1.
+
+    Returns
+    -------
+    tuple
+        ``(indicators, column_observed, column_weights, observed,
+        weights)``.
+
+        For ``hamming``, each value ``v`` of a feature has a column which
+        is 1 if the feature has value ``v``. For ``gower``, each threshold
+        ``t`` between the smallest and largest value of a feature has a
+        column which is 1 if the value is greater than ``t``, so that the
+        number of differing columns is the difference of the values.
+        ``column_observed`` is 1 if the feature of each column is
+        observed, ``column_weights`` are the weights of the columns and
+        ``observed`` is 1 if a feature is observed.
+
+    """
+    if metric not in METRICS:
+        raise ValueError(f"metric must be one of {METRICS}")
+    values = np.asarray(values)
+    observed = values > 0
+    if weights is None:
+        weights = np.ones(values.shape[1])
+    weights = np.asarray(weights, dtype=float)
+    masked = np.ma.masked_array(values, ~observed)
+    lo = masked.min(axis=0).filled(1).astype(int)
+    hi = masked.max(axis=0).filled(1).astype(int)
+    if metric == 'hamming':
+        # one column for each value from 1 to the largest
+        feature = np.repeat(np.arange(values.shape[1]), hi)
+        level = np.concatenate([np.arange(1, x + 1) for x in hi] +
+                               [np.zeros(0, dtype=int)])
+        indicators = values[:, feature] == level
+        column_weights = weights[feature]
+    else:
+        # one column for each threshold from the smallest to the largest
+        # value but one
+        feature = np.repeat(np.arange(values.shape[1]), hi - lo)
+        level = np.concatenate([np.arange(a, b) for a, b in zip(lo, hi)] +
+                               [np.zeros(0, dtype=int)])
+        indicators = (values[:, feature] > level) & observed[:, feature]
+        column_weights = weights[feature] / (hi - lo)[feature]
+    return (indicators.astype(float), observed[:, feature].astype(float),
+            column_weights, observed.astype(float), weights)
+
+
+_ENCODED = None
+_METRIC = 'hamming'
+
+
+def _init_worker(encoded, metric):
+    """Set the per-process data used by :func:`distance_block`."""
+    global _ENCODED, _METRIC
+    _ENCODED = encoded
+    _METRIC = metric
+
+
+def distance_block(block):
+    """Distances of the languages in ``block`` to all languages.
+
+    ``block`` is a ``(start, stop)`` tuple of row indices of the encoded
+    feature matrix. Returns a ``(start, stop, distances, shared)`` tuple,
+    where ``distances`` are the weighted mean distances of the features
+    observed for both languages, NaN if there are none, and ``shared`` is
+    the number of these features.
+
+    """
+    start, stop = block
+    indicators, col_observed, col_weights, observed, weights = _ENCODED
+    block_ind = indicators[start:stop] * col_weights
+    shared_weight = (observed[start:stop] * weights) @ observed.T
+    shared = observed[start:stop] @ observed.T
+    if _METRIC == 'hamming':
+        # mismatches are the features observed for both but not matching
+        diff = shared_weight - block_ind @ indicators.T
+    else:
+        # |a - b| = sum over thresholds of [a > t] xor [b > t]
+        diff = (block_ind @ col_observed.T +
+                col_observed[start:stop] @ (indicators * col_weights).T -
+                2 * block_ind @ indicators.T)
+    distances = np.full(diff.shape, np.nan)
+    np.divide(diff, shared_weight, out=distances, where=shared_weight > 0)
+    np.clip(distances, 0, 1, out=distances)
+    return start, stop, distances, shared.round().astype(np.int64)
+
+
+def feature_distances(matrix, metric='hamming', weights=None,
+                      blocksize=BLOCKSIZE, workers=1):
+    """Compute the distances between all languages of ``matrix``.
+
+    Parameters
+    ----------
+    matrix: :class:`FeatureMatrix`
+        Feature values.
+    metric: str
+        One of :data:`METRICS`.
+    weights: array
+        Weight of each feature of ``matrix``. Defaults to 1.
+    blocksize: int
+        Number of languages in each block.
+    workers: int
+        Number of worker processes. If 1, run in this process.
+
+    Yields
+    ------
+    tuple
+        The :func:`distance_block` of each block of languages, in order.
+
+    """
+    encoded = encode(matrix.values, metric, weights)
+    n = len(matrix.languages)
+    blocks = [(i, min(i + blocksize, n)) for i in range(0, n, blocksize)]
+    if workers <= 1:
+        _init_worker(encoded, metric)
+        yield from map(distance_block, blocks)
+    else:
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(encoded, metric)) as ex:
+            yield from ex.map(distance_block, blocks)
+
+
+def distance_matrix(matrix, **kwargs):
+    """Distance matrix of all languages of ``matrix``.
+
+    Returns the ``(distances, shared)`` arrays of :func:`distance_block`
+    for all pairs of languages. ``kwargs`` are passed to
+    :func:`feature_distances`.
+
+    """
+    n = len(matrix.languages)
+    distances = np.empty((n, n))
+    shared = np.empty((n, n), dtype=np.int64)
+    for start, stop, dist, count in feature_distances(matrix, **kwargs):
+        distances[start:stop] = dist
+        shared[start:stop] = count
+    return distances, shared
+
+
+def distance_rows(languages, blocks, min_shared=1):
+    """Rows for the ``feature_distances`` table.
+
+    Yields ``(wals_code_1, wals_code_2, value, n_features)`` of the pairs
+    in ``blocks`` from :func:`feature_distances` with ``wals_code_1 <
+    wals_code_2`` and at least ``min_shared`` features observed for both.
+
+    """
+    languages = np.asarray(languages)
+    for start, stop, dist, shared in blocks:
+        i, j = np.nonzero(
+            (np.arange(start, stop)[:, np.newaxis] <
+             np.arange(len(languages))[np.newaxis, :])
+            & (shared >= max(min_shared, 1)))
+        yield from zip(languages[i + start].tolist(),
+                       languages[j].tolist(), dist[i, j].tolist(),
+                       shared[i, j].tolist())
+
+
+def write_distances(conn, variable, languages, blocks, min_shared=1):
+    """Replace the ``feature_distances`` of ``variable`` in ``conn``.
+
+    The rows are from :func:`distance_rows` and are inserted in one
+    transaction. Returns the number of rows.
+
+    """
+    with conn:
+        conn.execute("DELETE FROM feature_distances WHERE variable = ?",
+                     (variable, ))
+        c = conn.executemany(
+            "INSERT INTO feature_distances (variable, wals_code_1, "
+            "wals_code_2, value, n_features) VALUES (?, ?, ?, ?, ?)",
+            ((variable, ) + x
+             for x in distance_rows(languages, blocks, min_shared)))
+    return c.rowcount
+
+
+def select_languages(conn, families=None, macroareas=None):
+    """WALS codes of the languages in ``families`` or ``macroareas``.
+
+    Returns ``None``, meaning all languages, if both are empty.
+
+    """
+    where = []
+    params = []
+    for column, values in (('family', families), ('macroarea', macroareas)):
+        if values:
+            where.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params += values
+    if not where:
+        return None
+    return [x[0] for x in conn.execute(
+        "SELECT wals_code FROM languages WHERE " + " AND ".join(where),
+        params)]
+
+
+def select_features(conn, features=None, areas=None):
+    """Feature IDs in ``features`` or in ``areas``.
+
+    Returns ``None``, meaning all features, if both are empty.
+
+    """
+    if not features and not areas:
+        return None
+    out = set(features or ())
+    if areas:
+        out.update(x[0] for x in conn.execute(
+            "SELECT feature_id FROM features WHERE area IN "
+            f"({', '.join('?' * len(areas))})", areas))
+    return out
+
+
+def main():
+    """Command line interface."""
+    parser = argparse.ArgumentParser(
+        description="Compute feature distances between WALS languages and "
+        "save them in the feature_distances table.")
+    parser.add_argument("db", help="Path to the WALS database.")
+    parser.add_argument("variable",
+                        help="Name of the distances in feature_distances.")
+    parser.add_argument("--metric", choices=METRICS, default='hamming',
+                        help="Distance between feature values.")
+    parser.add_argument("--feature", action="append", dest="features",
+                        help="Only use this feature. Can be repeated.")
+    parser.add_argument("--area", action="append", dest="areas",
+                        help="Only use the features of this area. Can be "
+                        "repeated.")
+    parser.add_argument("--family", action="append", dest="families",
+                        help="Only compare the languages of this family. "
+                        "Can be repeated.")
+    parser.add_argument("--macroarea", action="append", dest="macroareas",
+                        help="Only compare the languages of this macroarea. "
+                        "Can be repeated.")
+    parser.add_argument("--min-shared", type=int, default=1,
+                        help="Minimum number of features of both languages.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes.")
+    parser.add_argument("--blocksize", type=int, default=BLOCKSIZE,
+                        help="Number of languages in each block.")
+    args = parser.parse_args()
+    conn = sqlite3.connect(args.db)
+    languages = select_languages(conn, args.families, args.macroareas)
+    features = select_features(conn, args.features, args.areas)
+    matrix = FeatureMatrix.from_db(args.db, languages, features)
+    blocks = feature_distances(matrix, args.metric,
+                               blocksize=args.blocksize,
+                               workers=args.workers)
+    n = write_distances(conn, args.variable, matrix.languages, blocks,
+                        args.min_shared)
+    conn.close()
+    print(f"{n} distances between {len(matrix.languages)} languages and "
+          f"{len(matrix.features)} features")
+
+
+if __name__ == '__main__':
+    main()
@@ -39,3 +39,18 @@ CREATE TABLE distances (
     FOREIGN KEY (language_2) REFERENCES languages (language),
     FOREIGN KEY (language_1) REFERENCES languages (language)
 );
+
+-- Hash of the wordlist and family of each language, used for updates
+CREATE TABLE wordlist_hashes (
+    language TEXT PRIMARY KEY,
+    hash CHAR(64) NOT NULL,
+    FOREIGN KEY (language) REFERENCES languages (language)
+);
+
+-- Chunks of language pairs whose distances have been inserted
+CREATE TABLE distances_progress (
+    family TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    stop INTEGER NOT NULL,
+    PRIMARY KEY (family, start)
+);
@@ -0,0 +1,5 @@
+-- Secondary indexes for asjp.db, created after the data is loaded
+CREATE INDEX IF NOT EXISTS languages_iso ON languages (iso);
+CREATE INDEX IF NOT EXISTS languages_wcode ON languages (wcode);
+CREATE INDEX IF NOT EXISTS languages_wls_fam ON languages (wls_fam);
+CREATE INDEX IF NOT EXISTS distances_language_2 ON distances (language_2);
@@ -0,0 +1,6 @@
+-- Secondary indexes for ethnologue.db, created after the data is loaded
+CREATE INDEX IF NOT EXISTS LanguageCodes_CountryID
+    ON LanguageCodes (CountryID);
+CREATE INDEX IF NOT EXISTS LanguageIndex_CountryID
+    ON LanguageIndex (CountryID);
+CREATE INDEX IF NOT EXISTS LanguageIndex_Name ON LanguageIndex (Name);
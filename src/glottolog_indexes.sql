@@ -0,0 +1,13 @@
+-- Secondary indexes for glottolog.db, created after the data is loaded
+CREATE INDEX IF NOT EXISTS languoids_family_id ON languoids (family_id);
+CREATE INDEX IF NOT EXISTS languoids_parent_id ON languoids (parent_id);
+CREATE INDEX IF NOT EXISTS paths_glottocode_to ON paths (glottocode_to);
+CREATE INDEX IF NOT EXISTS distances_glottocode_2 ON distances (glottocode_2);
+CREATE INDEX IF NOT EXISTS wals_codes_glottocode ON wals_codes (glottocode);
+CREATE INDEX IF NOT EXISTS wals_codes_wals_code ON wals_codes (wals_code);
+CREATE INDEX IF NOT EXISTS iso_codes_glottocode ON iso_codes (glottocode);
+CREATE INDEX IF NOT EXISTS iso_codes_iso_639_3 ON iso_codes (iso_639_3);
+CREATE INDEX IF NOT EXISTS countries_glottocode ON countries (glottocode);
+CREATE INDEX IF NOT EXISTS countries_country_code ON countries (country_code);
+CREATE INDEX IF NOT EXISTS macroareas_glottocode ON macroareas (glottocode);
+CREATE INDEX IF NOT EXISTS macroareas_macroarea ON macroareas (macroarea);
@@ -0,0 +1,8 @@
+-- Secondary indexes for iso_639_3.db, created after the data is loaded
+CREATE INDEX IF NOT EXISTS iso_639_3_Part2B ON iso_639_3 (Part2B);
+CREATE INDEX IF NOT EXISTS iso_639_3_Part2T ON iso_639_3 (Part2T);
+CREATE INDEX IF NOT EXISTS iso_639_3_Part1 ON iso_639_3 (Part1);
+CREATE INDEX IF NOT EXISTS iso_639_3_macrolanguages_I_Id
+    ON iso_639_3_macrolanguages (I_Id);
+CREATE INDEX IF NOT EXISTS iso_639_3_Retirements_Change_To
+    ON iso_639_3_Retirements (Change_To);
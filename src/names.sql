@@ -0,0 +1,22 @@
+-- DDL for names.db
+CREATE TABLE names (
+    name_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    -- name with case and diacritics folded, see lingdata.names.fold
+    folded TEXT NOT NULL,
+    source TEXT NOT NULL
+        CHECK (source IN ('glottolog', 'iso_639_3', 'ethnologue')),
+    -- glottocode, ISO 639-3 Id or Ethnologue LangID
+    code TEXT NOT NULL,
+    -- e.g. Print_Name or Inverted_Name, or the Ethnologue NameType
+    name_type TEXT NOT NULL,
+    UNIQUE (source, code, name_type, name)
+);
+-- trigram index of names.folded; the rowid is names.name_id
+CREATE VIRTUAL TABLE names_fts USING fts5(
+    folded,
+    content='',
+    tokenize='trigram'
+);
+-- number of names with each trigram
+CREATE VIRTUAL TABLE names_vocab USING fts5vocab(names_fts, 'row');
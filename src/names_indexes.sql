@@ -0,0 +1,3 @@
+-- Secondary indexes for names.db, created after the data is loaded
+CREATE INDEX IF NOT EXISTS names_folded ON names (folded);
+CREATE INDEX IF NOT EXISTS names_code ON names (code);
@@ -69,3 +69,17 @@ CREATE TABLE distances (
     CHECK (wals_code_1 < wals_code_2),
     CHECK (variable IN ('geo', 'clade', 'features'))
 );
+
+-- Feature distances computed with lingdata.wals for subsets of languages
+-- and features, or other metrics, each saved under a variable name
+CREATE TABLE feature_distances (
+    variable TEXT NOT NULL,
+    wals_code_1 CHAR(3) NOT NULL,
+    wals_code_2 CHAR(3) NOT NULL,
+    value REAL CHECK (value >= 0 and value <= 1),
+    n_features INTEGER NOT NULL CHECK (n_features >= 1),
+    PRIMARY KEY (variable, wals_code_1, wals_code_2),
+    FOREIGN KEY (wals_code_1) REFERENCES languages (wals_code),
+    FOREIGN KEY (wals_code_2) REFERENCES languages (wals_code),
+    CHECK (wals_code_1 < wals_code_2)
+);
@@ -0,0 +1,10 @@
+-- Secondary indexes for wals.db, created after the data is loaded
+CREATE INDEX IF NOT EXISTS languages_iso_code ON languages (iso_code);
+CREATE INDEX IF NOT EXISTS languages_glottocode ON languages (glottocode);
+CREATE INDEX IF NOT EXISTS language_countries_wals_code
+    ON language_countries (wals_code);
+CREATE INDEX IF NOT EXISTS language_features_feature_id
+    ON language_features (feature_id, value);
+CREATE INDEX IF NOT EXISTS distances_wals_code_2 ON distances (wals_code_2);
+CREATE INDEX IF NOT EXISTS feature_distances_wals_code_2
+    ON feature_distances (variable, wals_code_2);